@@ -1,13 +1,20 @@
 import os
 import json
+import logging
 import hmac
 import hashlib
-import asyncio
-import websockets
 import uvicorn
-import ssl
 from fastapi import FastAPI, Request
 from dotenv import load_dotenv
+from pathlib import Path
+import sys
+
+# Shared RTMS helpers live in python_common/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python_common"))
+from rtms_common.client import RTMSClient, MEDIA_TYPE_AUDIO
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.capture import CaptureWriter
+from rtms_common.logs import Lazy, MediaLog, setup_logging
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,159 +27,59 @@ ZOOM_SECRET_TOKEN = os.getenv("ZOOM_SECRET_TOKEN")
 CLIENT_ID = os.getenv("ZM_CLIENT_ID")
 CLIENT_SECRET = os.getenv("ZM_CLIENT_SECRET")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
-
-# Dictionary to keep track of active WebSocket connections
-active_connections = {}
-
-def generate_signature(client_id, meeting_uuid, stream_id, client_secret):
-    """Generate signature for authentication."""
-    print('Generating signature with parameters:')
-    print('meetingUuid:', meeting_uuid)
-    print('streamId:', stream_id)
-
-    # Create a message string and generate an HMAC SHA256 signature
-    message = f"{client_id},{meeting_uuid},{stream_id}"
-    return hmac.new(
-        client_secret.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
-
-async def connect_to_signaling_websocket(meeting_uuid, stream_id, server_url):
-    """Connect to the signaling WebSocket server."""
-    print(f"Connecting to signaling WebSocket for meeting {meeting_uuid}")
-
-    try:
-        async with websockets.connect(server_url) as ws:
-            # Store connection for cleanup later
-            if meeting_uuid not in active_connections:
-                active_connections[meeting_uuid] = {}
-            active_connections[meeting_uuid]["signaling"] = ws
-
-            print(f"Signaling WebSocket connection opened for meeting {meeting_uuid}")
-            signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-
-            # Send handshake message
-            handshake = {
-                "msg_type": 1,  # SIGNALING_HAND_SHAKE_REQ
-                "protocol_version": 1,
-                "meeting_uuid": meeting_uuid,
-                "rtms_stream_id": stream_id,
-                "sequence": int(asyncio.get_event_loop().time() * 1e9),
-                "signature": signature
-            }
-            await ws.send(json.dumps(handshake))
-            print("Sent handshake to signaling server")
-
-            while True:
-                try:
-                    data = await ws.recv()
-                    msg = json.loads(data)
-                    print("Signaling Message:", json.dumps(msg, indent=2))
-
-                    # Handle successful handshake response
-                    if msg["msg_type"] == 2 and msg["status_code"] == 0:  # SIGNALING_HAND_SHAKE_RESP
-                        media_url = msg.get("media_server", {}).get("server_urls", {}).get("all")
-                        if media_url:
-                            # Connect to the media WebSocket server
-                            asyncio.create_task(
-                                connect_to_media_websocket(media_url, meeting_uuid, stream_id, ws)
-                            )
-
-                    # Respond to keep-alive requests
-                    if msg["msg_type"] == 12:  # KEEP_ALIVE_REQ
-                        keep_alive_response = {
-                            "msg_type": 13,  # KEEP_ALIVE_RESP
-                            "timestamp": msg["timestamp"]
-                        }
-                        print("Responding to Signaling KEEP_ALIVE_REQ:", keep_alive_response)
-                        await ws.send(json.dumps(keep_alive_response))
-
-                except websockets.exceptions.ConnectionClosed:
-                    break
-                except Exception as e:
-                    print(f"Error processing message: {e}")
-                    break
-
-    except Exception as e:
-        print(f"Signaling socket error: {e}")
-    finally:
-        print("Signaling socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("signaling", None)
-
-async def connect_to_media_websocket(media_url, meeting_uuid, stream_id, signaling_socket):
-    """Connect to the media WebSocket server."""
-    print(f"Connecting to media WebSocket at {media_url}")
-
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    try:
-        async with websockets.connect(media_url, ssl=ssl_context) as media_ws:
-            # Store connection for cleanup later
-            if meeting_uuid in active_connections:
-                active_connections[meeting_uuid]["media"] = media_ws
-
-            signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-            handshake = {
-                "msg_type": 3,  # DATA_HAND_SHAKE_REQ
-                "protocol_version": 1,
-                "meeting_uuid": meeting_uuid,
-                "rtms_stream_id": stream_id,
-                "signature": signature,
-                "media_type": 1,  # MEDIA_DATA_AUDIO
-                "payload_encryption": False
-            }
-            await media_ws.send(json.dumps(handshake))
-
-            while True:
-                try:
-                    data = await media_ws.recv()
-                    try:
-                        # Try to parse as JSON first
-                        msg = json.loads(data)
-                        print("Media JSON Message:", json.dumps(msg, indent=2))
-
-                        # Handle successful media handshake
-                        if msg["msg_type"] == 4 and msg["status_code"] == 0:  # DATA_HAND_SHAKE_RESP
-                            await signaling_socket.send(json.dumps({
-                                "msg_type": 7,  # CLIENT_READY_ACK
-                                "rtms_stream_id": stream_id
-                            }))
-                            print("Media handshake successful, sent start streaming request")
-
-                        # Respond to keep-alive requests
-                        if msg["msg_type"] == 12:  # KEEP_ALIVE_REQ
-                            await media_ws.send(json.dumps({
-                                "msg_type": 13,  # KEEP_ALIVE_RESP
-                                "timestamp": msg["timestamp"]
-                            }))
-                            print("Responded to Media KEEP_ALIVE_REQ")
-
-                    except json.JSONDecodeError:
-                        # If JSON parsing fails, it's binary audio data
-                        print("Raw audio data (base64):", data.hex())
-
-                except websockets.exceptions.ConnectionClosed:
-                    break
-                except Exception as e:
-                    print(f"Error processing message: {e}")
-                    break
-
-    except Exception as e:
-        print(f"Media socket error: {e}")
-    finally:
-        print("Media socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("media", None)
+# Record every received RTMS message to this file for offline replay (a .zst name compresses it)
+RTMS_CAPTURE = os.getenv("RTMS_CAPTURE")
+# Verify the RTMS servers' TLS certificates; set to false only for local servers with self-signed certificates
+RTMS_VERIFY_TLS = os.getenv("RTMS_VERIFY_TLS", "true").lower() != "false"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Media lines logged: every Nth message per meeting and at most N lines/sec, by msg_type (e.g. "14=100,*=1")
+LOG_MEDIA_SAMPLE = os.getenv("LOG_MEDIA_SAMPLE", "")
+LOG_MEDIA_RATE = os.getenv("LOG_MEDIA_RATE", "*=1")
+# Seconds between per-meeting message/byte summaries (0 = off)
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", 10))
+
+# Log lines are formatted and written on a background thread, never on the event loop
+setup_logging(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+media_log = MediaLog(sample=LOG_MEDIA_SAMPLE, rate=LOG_MEDIA_RATE, summary_interval=LOG_SUMMARY_INTERVAL)
+
+def handle_signaling(stream, frame):
+    """Log every signaling message."""
+    logger.info("Signaling Message: %s", Lazy(json.dumps, frame.msg, indent=2))
+
+def handle_media(stream, frame):
+    """Log a sample of the media messages; all of them are counted in the summaries."""
+    if not media_log.observe(stream, frame):
+        return
+    if frame.msg_type is None:
+        # If JSON parsing fails, it's binary data
+        logger.info("Raw audio data: %s", Lazy(frame.raw.hex))
+        return
+
+    logger.info("Media JSON Message: %s", Lazy(json.dumps, frame.msg, indent=2))
+    if frame.payload:
+        logger.info("Media payload: %d bytes", len(frame.payload))
+
+# Message rates, decode/handshake latency and keep-alive timings, served at GET /metrics
+metrics = RTMSMetrics()
+
+rtms_client = RTMSClient(
+    CLIENT_ID,
+    CLIENT_SECRET,
+    media_type=MEDIA_TYPE_AUDIO,
+    on_media=handle_media,
+    on_signaling=handle_signaling,
+    verify_tls=RTMS_VERIFY_TLS,
+    metrics=metrics,
+    capture=CaptureWriter(RTMS_CAPTURE) if RTMS_CAPTURE else None
+)
+metrics.attach(app)
 
 @app.post(WEBHOOK_PATH)
 async def webhook(request: Request):
     """Handle webhook requests."""
     body = await request.json()
-    print("RTMS Webhook received:", json.dumps(body, indent=2))
+    logger.info("RTMS Webhook received: %s", Lazy(json.dumps, body, indent=2))
     event = body.get("event")
     payload = body.get("payload", {})
 
@@ -183,7 +90,7 @@ async def webhook(request: Request):
             payload["plainToken"].encode(),
             hashlib.sha256
         )
-        print("Responding to URL validation challenge")
+        logger.info("Responding to URL validation challenge")
         return {
             "plainToken": payload["plainToken"],
             "encryptedToken": hash_obj.hexdigest()
@@ -191,25 +98,18 @@ async def webhook(request: Request):
 
     # Handle RTMS started event
     if event == "meeting.rtms_started":
-        print("RTMS Started event received")
+        logger.info("RTMS Started event received")
         meeting_uuid = payload.get("meeting_uuid")
         rtms_stream_id = payload.get("rtms_stream_id")
         server_urls = payload.get("server_urls")
         if all([meeting_uuid, rtms_stream_id, server_urls]):
-            asyncio.create_task(
-                connect_to_signaling_websocket(meeting_uuid, rtms_stream_id, server_urls)
-            )
+            rtms_client.start_stream(meeting_uuid, rtms_stream_id, server_urls)
 
     # Handle RTMS stopped event
     if event == "meeting.rtms_stopped":
-        print("RTMS Stopped event received")
+        logger.info("RTMS Stopped event received")
         meeting_uuid = payload.get("meeting_uuid")
-        if meeting_uuid in active_connections:
-            connections = active_connections[meeting_uuid]
-            for conn in connections.values():
-                if conn and hasattr(conn, "close"):
-                    await conn.close()
-            active_connections.pop(meeting_uuid, None)
+        await rtms_client.stop_stream(meeting_uuid)
 
     return {"status": "ok"}
 
@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import struct
+import time
+from pathlib import Path
+
+
+class AudioFileSink:
+    """Append raw audio chunks to a per-meeting file as they arrive.
+
+    Chunks go through a buffered writer, so memory use stays flat no matter how
+    long the meeting runs. The buffer is flushed to the OS every
+    `flush_interval` seconds and fsync'd to disk every `fsync_interval`
+    seconds (0 disables fsync until close).
+    """
+
+    def __init__(self, path, buffer_size=64 * 1024, flush_interval=1.0, fsync_interval=5.0):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.bytes_written = 0
+        self.chunks_written = 0
+        self.closed = False
+
+        self._file = open(self.path, 'wb', buffering=buffer_size)
+        now = time.monotonic()
+        self._last_flush = now
+        self._last_fsync = now
+
+    def write(self, chunk):
+        """Append one chunk and apply the flush/fsync policy."""
+        if self.closed:
+            return
+        self._file.write(chunk)
+        self.bytes_written += len(chunk)
+        self.chunks_written += 1
+
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+            if self.fsync_interval and now - self._last_fsync >= self.fsync_interval:
+                self._sync()
+                self._last_fsync = now
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """Flush and fsync everything written so far, then close the file."""
+        if self.closed:
+            return
+        self.closed = True
+        self._sync()
+        self._file.close()
+
+
+class WavFileSink(AudioFileSink):
+    """Stream PCM straight into a playable .wav file.
+
+    A RIFF/WAVE header with placeholder sizes is written up front and patched
+    with the real sizes on every fsync and on close, so even a file from a
+    crashed process only misses the audio written since the last sync.
+    """
+
+    def __init__(self, path, sample_rate=16000, channels=1, sample_width=2, **kwargs):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.gaps = []
+        super().__init__(path, **kwargs)
+        self._file.write(self._header(0))
+
+    def write_gap(self, seconds, max_fill=300.0):
+        """Fill a stream gap with silence so the audio stays aligned to meeting time.
+
+        At most `max_fill` seconds are filled; the full gap is still recorded
+        in `gaps` (offset into the recording and duration, in seconds).
+        """
+        if self.closed or seconds <= 0:
+            return
+        block_align = self.channels * self.sample_width
+        self.gaps.append({
+            "at": round(self.bytes_written / (self.sample_rate * block_align), 3),
+            "duration": round(seconds, 3)
+        })
+        self.write_silence(int(min(seconds, max_fill) * self.sample_rate) * block_align)
+
+    def write_silence(self, size):
+        """Append `size` bytes of digital silence."""
+        block = bytes(min(size, 64 * 1024))
+        while size > 0:
+            chunk = block if size >= len(block) else block[:size]
+            self._file.write(chunk)
+            self.bytes_written += len(chunk)
+            size -= len(chunk)
+
+    def _header(self, data_size):
+        block_align = self.channels * self.sample_width
+        return struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + data_size, b'WAVE',
+            b'fmt ', 16, 1, self.channels, self.sample_rate,
+            self.sample_rate * block_align, block_align, self.sample_width * 8,
+            b'data', data_size
+        )
+
+    def _sync(self):
+        # Patch the header with the sizes written so far, then resume appending
+        self._file.flush()
+        self._file.seek(0)
+        self._file.write(self._header(self.bytes_written))
+        self._file.seek(0, os.SEEK_END)
+        super()._sync()
+
+
+class SegmentedWavSink:
+    """Write audio as a series of playable WAV segments plus a live manifest.
+
+    A new segment is started every `segment_seconds` of audio (or once a
+    segment reaches `max_bytes`). Each finished segment is published to
+    `index.jsonl` (one JSON object per line) and to an HLS-style
+    `playlist.m3u8`, so consumers can tail the recording while the meeting is
+    still running. Pass `on_segment` to post-process a finished segment (e.g.
+    transcode it); the callback must then call `publish(segment)` itself.
+    """
+
+    def __init__(self, directory, segment_seconds=30, max_bytes=0, on_segment=None,
+                 sample_rate=16000, channels=1, sample_width=2, **kwargs):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = str(self.directory)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.bytes_per_second = sample_rate * channels * sample_width
+        self.segment_bytes = int(segment_seconds * self.bytes_per_second) if segment_seconds else 0
+        if max_bytes:
+            self.segment_bytes = min(self.segment_bytes or max_bytes, max_bytes)
+        self.on_segment = on_segment
+        self.sink_kwargs = kwargs
+        self.bytes_written = 0
+        self.chunks_written = 0
+        self.closed = False
+
+        self._segment = None
+        self._seq = 0
+        self._published = []
+        self._pending = 0
+        self._gaps = []
+
+    def write(self, chunk):
+        """Append one chunk, rotating to a new segment when the current one is full."""
+        if self.closed:
+            return
+        if self._segment is None:
+            self._open_segment()
+        self._segment.write(chunk)
+        self.bytes_written += len(chunk)
+        self.chunks_written += 1
+        if self.segment_bytes and self._segment.bytes_written >= self.segment_bytes:
+            self._close_segment()
+
+    def write_gap(self, seconds, max_fill=300.0):
+        """Fill a stream gap with silence, rotating segments as usual.
+
+        The gap is listed under `gaps` in the manifest entry of the segment
+        it starts in, with its offset into the whole recording.
+        """
+        if self.closed or seconds <= 0:
+            return
+        self._gaps.append({"at": round(self.bytes_written / self.bytes_per_second, 3), "duration": round(seconds, 3)})
+        block_align = self.channels * self.sample_width
+        remaining = int(min(seconds, max_fill) * self.sample_rate) * block_align
+        while remaining > 0:
+            if self._segment is None:
+                self._open_segment()
+            room = self.segment_bytes - self._segment.bytes_written if self.segment_bytes else remaining
+            size = min(remaining, max(room, block_align))
+            self._segment.write_silence(size)
+            self.bytes_written += size
+            remaining -= size
+            if self.segment_bytes and self._segment.bytes_written >= self.segment_bytes:
+                self._close_segment()
+
+    def _open_segment(self):
+        path = self.directory / f"segment_{self._seq:05d}.wav"
+        self._segment = WavFileSink(
+            path,
+            sample_rate=self.sample_rate,
+            channels=self.channels,
+            sample_width=self.sample_width,
+            **self.sink_kwargs
+        )
+        self._segment_start = self.bytes_written / self.bytes_per_second
+
+    def _close_segment(self):
+        segment_sink, self._segment = self._segment, None
+        segment_sink.close()
+        segment = {
+            "seq": self._seq,
+            "file": Path(segment_sink.path).name,
+            "start": round(self._segment_start, 3),
+            "duration": round(segment_sink.bytes_written / self.bytes_per_second, 3),
+            "bytes": segment_sink.bytes_written,
+            "created_at": round(time.time(), 3)
+        }
+        if self._gaps:
+            segment["gaps"], self._gaps = self._gaps, []
+        self._seq += 1
+        self._pending += 1
+        if self.on_segment:
+            self.on_segment(segment)
+        else:
+            self.publish(segment)
+
+    def publish(self, segment):
+        """Add a finished segment to the JSONL index and the playlist."""
+        self._pending -= 1
+        self._published.append(segment)
+        with open(self.directory / "index.jsonl", 'a') as f:
+            f.write(json.dumps(segment) + "\n")
+        self._write_playlist()
+
+    def _write_playlist(self):
+        segments = sorted(self._published, key=lambda s: s["seq"])
+        target = max([s["duration"] for s in segments] + [self.segment_bytes / self.bytes_per_second])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(target)}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for s in segments:
+            lines.append(f"#EXTINF:{s['duration']:.3f},")
+            lines.append(s["file"])
+        if self.closed and not self._pending:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Write to a temp file and rename so readers never see a partial playlist
+        tmp_path = self.directory / "playlist.m3u8.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.directory / "playlist.m3u8")
+
+    def close(self):
+        """Finalize the current segment and mark the playlist as complete."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._segment is not None and self._segment.bytes_written:
+            self._close_segment()
+        elif self._segment is not None:
+            self._segment.close()
+            os.unlink(self._segment.path)
+            self._segment = None
+        if not self._pending:
+            self._write_playlist()
@@ -1,16 +1,24 @@
 import os
 import json
+import logging
 import hmac
 import hashlib
 import asyncio
-import websockets
+import zlib
 import uvicorn
-import base64
-import ssl
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request
 from dotenv import load_dotenv
-import subprocess
 from pathlib import Path
+import sys
+from audio_sink import SegmentedWavSink, WavFileSink
+
+# Shared RTMS helpers live in python_common/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python_common"))
+from rtms_common.client import RTMSClient, MEDIA_TYPE_AUDIO
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.capture import CaptureWriter
+from rtms_common.logs import Lazy, MediaLog, setup_logging
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,34 +30,59 @@ ZOOM_SECRET_TOKEN = os.getenv("ZOOM_SECRET_TOKEN")
 CLIENT_ID = os.getenv("ZM_CLIENT_ID")
 CLIENT_SECRET = os.getenv("ZM_CLIENT_SECRET")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
-
-# Dictionary to keep track of active WebSocket connections and audio chunks
-active_connections = {}
-audio_chunks = {}
-
-def generate_signature(client_id, meeting_uuid, stream_id, client_secret):
-    """Generate signature for authentication."""
-    print('Generating signature with parameters:')
-    print('meetingUuid:', meeting_uuid)
-    print('streamId:', stream_id)
-
-    # Create a message string and generate an HMAC SHA256 signature
-    message = f"{client_id},{meeting_uuid},{stream_id}"
-    return hmac.new(
-        client_secret.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
-
-async def convert_raw_to_wav(input_file, output_file):
-    """Convert raw audio data to WAV format using ffmpeg."""
+AUDIO_FLUSH_INTERVAL = float(os.getenv("AUDIO_FLUSH_INTERVAL", 1.0))
+AUDIO_FSYNC_INTERVAL = float(os.getenv("AUDIO_FSYNC_INTERVAL", 5.0))
+# Threads that write, flush, fsync and close the audio files; each meeting is pinned to one
+AUDIO_WRITERS = int(os.getenv("AUDIO_WRITERS", 2))
+# "wav" needs no ffmpeg; "opus", "flac" or "mp3" transcode the WAV when the meeting ends
+AUDIO_OUTPUT_FORMAT = os.getenv("AUDIO_OUTPUT_FORMAT", "wav").lower()
+# Set either value to write rotating segments plus index.jsonl/playlist.m3u8 during the meeting
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", 0))
+SEGMENT_MAX_BYTES = int(os.getenv("SEGMENT_MAX_BYTES", 0))
+# Longest media outage (seconds) that is filled with silence after a reconnect
+MAX_GAP_FILL = float(os.getenv("MAX_GAP_FILL", 300))
+# Record every received RTMS message to this file for offline replay (a .zst name compresses it)
+RTMS_CAPTURE = os.getenv("RTMS_CAPTURE")
+# Verify the RTMS servers' TLS certificates; set to false only for local servers with self-signed certificates
+RTMS_VERIFY_TLS = os.getenv("RTMS_VERIFY_TLS", "true").lower() != "false"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Media lines logged: every Nth message per meeting and at most N lines/sec, by msg_type (e.g. "14=100,*=1")
+LOG_MEDIA_SAMPLE = os.getenv("LOG_MEDIA_SAMPLE", "")
+LOG_MEDIA_RATE = os.getenv("LOG_MEDIA_RATE", "*=1")
+# Seconds between per-meeting message/byte summaries (0 = off)
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", 10))
+
+# Log lines are formatted and written on a background thread, never on the event loop
+setup_logging(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+media_log = MediaLog(sample=LOG_MEDIA_SAMPLE, rate=LOG_MEDIA_RATE, summary_interval=LOG_SUMMARY_INTERVAL)
+
+# Dictionary to keep track of the audio sink of each meeting; only touched on the meeting's writer thread
+audio_sinks = {}
+# Sink I/O never runs on the event loop, so a slow disk cannot delay socket reads or
+# keep-alive replies. One thread per meeting keeps its chunks in order.
+audio_writers = [
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"audio-writer-{i}")
+    for i in range(AUDIO_WRITERS)
+]
+
+# Segment publish tasks still running per meeting; the event loop only keeps weak references to tasks
+publish_tasks = {}
+
+def audio_writer(meeting_uuid):
+    return audio_writers[zlib.crc32(meeting_uuid.encode()) % len(audio_writers)]
+
+def safe_meeting_id(meeting_uuid):
+    """Turn a meeting UUID into a string that is safe to use in a filename."""
+    return ''.join(c if c.isalnum() else '_' for c in meeting_uuid)
+
+async def transcode_audio(wav_file, output_format):
+    """Transcode a finished WAV recording to another format using ffmpeg."""
+    output_file = str(Path(wav_file).with_suffix(f".{output_format}"))
     try:
         command = [
             'ffmpeg', '-y',
-            '-f', 's16le',
-            '-ar', '16000',
-            '-ac', '1',
-            '-i', input_file,
+            '-i', wav_file,
             output_file
         ]
         process = await asyncio.create_subprocess_exec(
@@ -58,158 +91,127 @@ async def convert_raw_to_wav(input_file, output_file):
             stderr=asyncio.subprocess.PIPE
         )
         await process.communicate()
-        
-        # Clean up raw file
-        os.unlink(input_file)
-        print(f"WAV saved: {output_file}")
-    except Exception as e:
-        print(f"Conversion error: {e}")
-
-async def connect_to_signaling_websocket(meeting_uuid, stream_id, server_url):
-    """Connect to the signaling WebSocket server."""
-    print(f"Connecting to signaling WebSocket for meeting {meeting_uuid}")
-
-    try:
-        async with websockets.connect(server_url) as ws:
-            # Store connection for cleanup later
-            if meeting_uuid not in active_connections:
-                active_connections[meeting_uuid] = {}
-            active_connections[meeting_uuid]["signaling"] = ws
-
-            print(f"Signaling WebSocket connection opened for meeting {meeting_uuid}")
-            signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-
-            # Send handshake message
-            handshake = {
-                "msg_type": 1,  # SIGNALING_HAND_SHAKE_REQ
-                "protocol_version": 1,
-                "meeting_uuid": meeting_uuid,
-                "rtms_stream_id": stream_id,
-                "sequence": int(asyncio.get_event_loop().time() * 1e9),
-                "signature": signature
-            }
-            await ws.send(json.dumps(handshake))
-            print("Sent handshake to signaling server")
-
-            while True:
-                try:
-                    data = await ws.recv()
-                    msg = json.loads(data)
-                    print("Signaling Message:", json.dumps(msg, indent=2))
-
-                    # Handle successful handshake response
-                    if msg["msg_type"] == 2 and msg["status_code"] == 0:  # SIGNALING_HAND_SHAKE_RESP
-                        media_url = msg.get("media_server", {}).get("server_urls", {}).get("all")
-                        if media_url:
-                            # Connect to the media WebSocket server
-                            asyncio.create_task(
-                                connect_to_media_websocket(media_url, meeting_uuid, stream_id, ws)
-                            )
-
-                    # Respond to keep-alive requests
-                    if msg["msg_type"] == 12:  # KEEP_ALIVE_REQ
-                        keep_alive_response = {
-                            "msg_type": 13,  # KEEP_ALIVE_RESP
-                            "timestamp": msg["timestamp"]
-                        }
-                        print("Responding to Signaling KEEP_ALIVE_REQ:", keep_alive_response)
-                        await ws.send(json.dumps(keep_alive_response))
-
-                except websockets.exceptions.ConnectionClosed:
-                    break
-                except Exception as e:
-                    print(f"Error processing message: {e}")
-                    break
-
+        if process.returncode != 0:
+            logger.warning(f"Transcoding to {output_format} failed, keeping {wav_file}")
+            return
+
+        # Clean up intermediate WAV file
+        os.unlink(wav_file)
+        logger.info(f"{output_format.upper()} saved: {output_file}")
+        return output_file
     except Exception as e:
-        print(f"Signaling socket error: {e}")
-    finally:
-        print("Signaling socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("signaling", None)
-
-async def connect_to_media_websocket(media_url, meeting_uuid, stream_id, signaling_socket):
-    """Connect to the media WebSocket server."""
-    print(f"Connecting to media WebSocket at {media_url}")
-
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    try:
-        async with websockets.connect(media_url, ssl=ssl_context) as media_ws:
-            # Store connection for cleanup later
-            if meeting_uuid in active_connections:
-                active_connections[meeting_uuid]["media"] = media_ws
-
-            # Initialize audio chunks list for this meeting
-            audio_chunks[meeting_uuid] = []
-
-            signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-            handshake = {
-                "msg_type": 3,  # DATA_HAND_SHAKE_REQ
-                "protocol_version": 1,
-                "meeting_uuid": meeting_uuid,
-                "rtms_stream_id": stream_id,
-                "signature": signature,
-                "media_type": 1,  # MEDIA_DATA_AUDIO
-                "payload_encryption": False
-            }
-            await media_ws.send(json.dumps(handshake))
-
-            while True:
-                try:
-                    data = await media_ws.recv()
-                    try:
-                        # Try to parse as JSON first
-                        msg = json.loads(data)
-                        print("Media JSON Message:", json.dumps(msg, indent=2))
-
-                        # Handle successful media handshake
-                        if msg["msg_type"] == 4 and msg["status_code"] == 0:  # DATA_HAND_SHAKE_RESP
-                            await signaling_socket.send(json.dumps({
-                                "msg_type": 7,  # CLIENT_READY_ACK
-                                "rtms_stream_id": stream_id
-                            }))
-                            print("Media handshake successful, sent start streaming request")
-
-                        # Respond to keep-alive requests
-                        if msg["msg_type"] == 12:  # KEEP_ALIVE_REQ
-                            await media_ws.send(json.dumps({
-                                "msg_type": 13,  # KEEP_ALIVE_RESP
-                                "timestamp": msg["timestamp"]
-                            }))
-                            print("Responded to Media KEEP_ALIVE_REQ")
-
-                        # Handle audio data
-                        if msg["msg_type"] == 14 and msg.get("content", {}).get("data"):
-                            # Decode base64 audio data
-                            audio_data = base64.b64decode(msg["content"]["data"])
-                            if meeting_uuid in audio_chunks:
-                                audio_chunks[meeting_uuid].append(audio_data)
-                                print(f"Received audio chunk, total chunks: {len(audio_chunks[meeting_uuid])}")
-
-                    except json.JSONDecodeError:
-                        print("Received binary data (not JSON)")
-
-                except websockets.exceptions.ConnectionClosed:
-                    break
-                except Exception as e:
-                    print(f"Error processing message: {e}")
-                    break
-
-    except Exception as e:
-        print(f"Media socket error: {e}")
-    finally:
-        print("Media socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("media", None)
+        logger.error(f"Transcoding error: {e}")
+
+async def publish_segment(meeting_uuid, sink, segment):
+    """Transcode a finished segment if needed, then add it to the manifest."""
+    output_file = await transcode_audio(str(sink.directory / segment["file"]), AUDIO_OUTPUT_FORMAT)
+    if output_file:
+        segment["file"] = Path(output_file).name
+    await asyncio.get_running_loop().run_in_executor(audio_writer(meeting_uuid), sink.publish, segment)
+
+def start_publish(meeting_uuid, sink, segment):
+    """Start publishing a finished segment, keeping the task until it completes (event loop)."""
+    task = asyncio.create_task(publish_segment(meeting_uuid, sink, segment))
+    tasks = publish_tasks.setdefault(meeting_uuid, set())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+def open_audio_sink(meeting_uuid, loop):
+    """Create the WAV (or segmented WAV) sink for a meeting (on its writer thread)."""
+    sink_options = {
+        "flush_interval": AUDIO_FLUSH_INTERVAL,
+        "fsync_interval": AUDIO_FSYNC_INTERVAL
+    }
+    if not (SEGMENT_SECONDS or SEGMENT_MAX_BYTES):
+        return WavFileSink(f"recording_{safe_meeting_id(meeting_uuid)}.wav", **sink_options)
+
+    on_segment = None
+    if AUDIO_OUTPUT_FORMAT != "wav":
+        # Finished segments are transcoded on the event loop
+        on_segment = lambda segment: loop.call_soon_threadsafe(start_publish, meeting_uuid, sink, segment)
+    sink = SegmentedWavSink(
+        f"recording_{safe_meeting_id(meeting_uuid)}",
+        segment_seconds=SEGMENT_SECONDS,
+        max_bytes=SEGMENT_MAX_BYTES,
+        on_segment=on_segment,
+        **sink_options
+    )
+    return sink
+
+def write_audio(meeting_uuid, chunk, loop):
+    """Append a chunk to the meeting's sink, opening it first if needed (writer thread)."""
+    sink = audio_sinks.get(meeting_uuid)
+    if sink is None:
+        # Kept across media reconnects
+        sink = audio_sinks[meeting_uuid] = open_audio_sink(meeting_uuid, loop)
+    with metrics.time_sink_write("wav"):
+        sink.write(chunk)
+
+def write_gap(meeting_uuid, duration):
+    """Fill a media outage with silence (writer thread)."""
+    sink = audio_sinks.get(meeting_uuid)
+    if sink is not None:
+        sink.write_gap(duration, max_fill=MAX_GAP_FILL)
+
+def close_audio_sink(meeting_uuid):
+    """Finalize the meeting's sink and remove an empty recording (writer thread)."""
+    sink = audio_sinks.pop(meeting_uuid, None)
+    if sink is not None:
+        sink.close()
+        if not isinstance(sink, SegmentedWavSink) and not sink.bytes_written:
+            os.unlink(sink.path)
+    return sink
+
+def handle_signaling(stream, frame):
+    """Log every signaling message."""
+    logger.info("Signaling Message: %s", Lazy(json.dumps, frame.msg, indent=2))
+
+def handle_media(stream, frame):
+    """Append incoming audio to the meeting's sink."""
+    # Only a sample of the messages is logged; all of them are counted in the summaries
+    log_frame = media_log.observe(stream, frame)
+    if frame.msg_type is None:
+        if log_frame:
+            logger.info("Received binary data (not JSON)")
+        return
+
+    if log_frame:
+        # Audio data is kept out of msg and decoded from the raw frame
+        logger.info("Media JSON Message: %s", Lazy(json.dumps, frame.msg, indent=2))
+
+    # Handle audio data: hand it to the meeting's writer thread, which appends it to an on-disk sink
+    if frame.msg_type == 14 and frame.payload:
+        audio_writer(stream.meeting_uuid).submit(
+            write_audio, stream.meeting_uuid, frame.payload, asyncio.get_running_loop())
+        if log_frame:
+            logger.info("Received audio chunk of %d bytes", len(frame.payload))
+
+def handle_gap(stream, gap):
+    """Fill a media outage with silence so the recording keeps meeting time."""
+    logger.warning(f"Media gap of {gap.duration:.2f}s in meeting {stream.meeting_uuid} ({gap.reason})")
+    audio_writer(stream.meeting_uuid).submit(write_gap, stream.meeting_uuid, gap.duration)
+
+# Message rates, decode/handshake latency and keep-alive timings, served at GET /metrics
+metrics = RTMSMetrics()
+
+rtms_client = RTMSClient(
+    CLIENT_ID,
+    CLIENT_SECRET,
+    media_type=MEDIA_TYPE_AUDIO,
+    on_media=handle_media,
+    on_signaling=handle_signaling,
+    on_gap=handle_gap,
+    verify_tls=RTMS_VERIFY_TLS,
+    metrics=metrics,
+    capture=CaptureWriter(RTMS_CAPTURE) if RTMS_CAPTURE else None
+)
+metrics.attach(app)
 
 @app.post(WEBHOOK_PATH)
 async def webhook(request: Request):
     """Handle webhook requests."""
     body = await request.json()
-    print("RTMS Webhook received:", json.dumps(body, indent=2))
+    logger.info("RTMS Webhook received: %s", Lazy(json.dumps, body, indent=2))
     event = body.get("event")
     payload = body.get("payload", {})
 
@@ -220,7 +222,7 @@ async def webhook(request: Request):
             payload["plainToken"].encode(),
             hashlib.sha256
         )
-        print("Responding to URL validation challenge")
+        logger.info("Responding to URL validation challenge")
         return {
             "plainToken": payload["plainToken"],
             "encryptedToken": hash_obj.hexdigest()
@@ -228,46 +230,37 @@ async def webhook(request: Request):
 
     # Handle RTMS started event
     if event == "meeting.rtms_started":
-        print("RTMS Started event received")
+        logger.info("RTMS Started event received")
         meeting_uuid = payload.get("meeting_uuid")
         rtms_stream_id = payload.get("rtms_stream_id")
         server_urls = payload.get("server_urls")
         if all([meeting_uuid, rtms_stream_id, server_urls]):
-            asyncio.create_task(
-                connect_to_signaling_websocket(meeting_uuid, rtms_stream_id, server_urls)
-            )
+            rtms_client.start_stream(meeting_uuid, rtms_stream_id, server_urls)
 
     # Handle RTMS stopped event
     if event == "meeting.rtms_stopped":
-        print("RTMS Stopped event received")
+        logger.info("RTMS Stopped event received")
         meeting_uuid = payload.get("meeting_uuid")
-        
-        # Save audio data to WAV file
-        if meeting_uuid in audio_chunks and audio_chunks[meeting_uuid]:
-            meeting_id = ''.join(c if c.isalnum() else '_' for c in meeting_uuid)
-            raw_filename = f"recording_{meeting_id}.raw"
-            wav_filename = f"recording_{meeting_id}.wav"
-
-            # Combine all audio chunks
-            combined_data = b''.join(audio_chunks[meeting_uuid])
-            
-            # Write raw audio data to file
-            with open(raw_filename, 'wb') as f:
-                f.write(combined_data)
-
-            # Convert to WAV
-            await convert_raw_to_wav(raw_filename, wav_filename)
-            
-            # Clean up audio chunks
-            audio_chunks.pop(meeting_uuid, None)
-
-        # Close all active WebSocket connections
-        if meeting_uuid in active_connections:
-            connections = active_connections[meeting_uuid]
-            for conn in connections.values():
-                if conn and hasattr(conn, "close"):
-                    await conn.close()
-            active_connections.pop(meeting_uuid, None)
+
+        # Close the meeting's signaling and media connections
+        await rtms_client.stop_stream(meeting_uuid)
+
+        # Finalize the streamed WAV file (patches the header sizes) after the chunks queued before it
+        sink = await asyncio.get_running_loop().run_in_executor(
+            audio_writer(meeting_uuid), close_audio_sink, meeting_uuid)
+        # (an empty recording has already been removed)
+        if sink and (isinstance(sink, SegmentedWavSink) or sink.bytes_written):
+            if isinstance(sink, SegmentedWavSink):
+                # The close queued the last segment's publish before returning; wait for all of them
+                tasks = publish_tasks.pop(meeting_uuid, set())
+                for result in await asyncio.gather(*tasks, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        logger.error(f"Failed to publish a segment of meeting {meeting_uuid}: {result}")
+                logger.info(f"Segments saved: {sink.path}")
+            elif AUDIO_OUTPUT_FORMAT != "wav":
+                await transcode_audio(sink.path, AUDIO_OUTPUT_FORMAT)
+            else:
+                logger.info(f"WAV saved: {sink.path}")
 
     return {"status": "ok"}
 
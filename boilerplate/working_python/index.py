@@ -3,11 +3,19 @@ import json
 import hmac
 import hashlib
 import logging
-import random
+import multiprocessing
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
-import websocket
-import threading
+from pathlib import Path
+import sys
+
+# Shared RTMS helpers live in python_common/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python_common"))
+from rtms_common.client import RTMSClient, MEDIA_TYPE_ALL
+from rtms_common.shard import ShardedWorkerPool
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.capture import CaptureWriter
+from rtms_common.logs import MediaLog, setup_logging
 
 # Load environment variables
 load_dotenv()
@@ -18,143 +26,89 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
 ZOOM_SECRET_TOKEN = os.getenv("ZOOM_SECRET_TOKEN")
 CLIENT_ID = os.getenv("ZM_CLIENT_ID")
 CLIENT_SECRET = os.getenv("ZM_CLIENT_SECRET")
-
-# Setup logging
-logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
+# Number of worker processes for RTMS streams (0 = run them in this process)
+RTMS_WORKERS = int(os.getenv("RTMS_WORKERS", 0))
+# Record every received RTMS message to this file for offline replay (a .zst name compresses it;
+# single-process mode only)
+RTMS_CAPTURE = os.getenv("RTMS_CAPTURE")
+# Verify the RTMS servers' TLS certificates; set to false only for local servers with self-signed certificates
+RTMS_VERIFY_TLS = os.getenv("RTMS_VERIFY_TLS", "true").lower() != "false"
+# Media lines logged: every Nth message per meeting and at most N lines/sec, by msg_type (e.g. "14=100,*=1")
+LOG_MEDIA_SAMPLE = os.getenv("LOG_MEDIA_SAMPLE", "")
+LOG_MEDIA_RATE = os.getenv("LOG_MEDIA_RATE", "*=1")
+# Seconds between per-meeting message/byte summaries (0 = off)
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", 10))
+
+# Setup logging; lines are formatted and written on a background thread, never on the event loop
+setup_logging(getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
 logger = logging.getLogger(__name__)
+media_log = MediaLog(sample=LOG_MEDIA_SAMPLE, rate=LOG_MEDIA_RATE, summary_interval=LOG_SUMMARY_INTERVAL)
 
 app = Flask(__name__)
-active_connections = {}
-
-def generate_signature(client_id, meeting_uuid, stream_id, client_secret):
-    message = f"{client_id},{meeting_uuid},{stream_id}"
-    signature = hmac.new(client_secret.encode(), message.encode(), hashlib.sha256).hexdigest()
-    return signature
-
-def connect_to_media_ws(media_url, meeting_uuid, stream_id, signaling_socket):
-    logger.info(f"Connecting to media WebSocket at {media_url}")
-
-    def on_open(ws):
-        signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-        handshake = {
-            "msg_type": 3,
-            "protocol_version": 1,
-            "meeting_uuid": meeting_uuid,
-            "rtms_stream_id": stream_id,
-            "signature": signature,
-            "media_type": 32,
-            "payload_encryption": False,
-            "media_params": {
-                "audio": {
-                    "content_type": 1,
-                    "sample_rate": 1,
-                    "channel": 1,
-                    "codec": 1,
-                    "data_opt": 1,
-                    "send_rate": 100
-                },
-                "video": {
-                    "codec": 7,
-                    "resolution": 2,
-                    "fps": 25
-                }
+
+# Message rates, decode/handshake latency and keep-alive timings, served at GET /metrics
+metrics = RTMSMetrics()
+metrics.attach(app)
+
+def handle_media(stream, frame):
+    # Only msg_type is read up front; the frame is parsed when a branch needs it
+    msg_type = frame.msg_type
+    # Every message is counted in the per-meeting summaries; only a sample gets its own line
+    log_frame = media_log.observe(stream, frame)
+
+    if msg_type == 14:
+        if log_frame:
+            logger.info("Received AUDIO data")
+        # Handle audio data if needed
+    elif msg_type == 15:
+        if log_frame:
+            logger.info("Received VIDEO data")
+        # Handle video data if needed
+    elif msg_type == 17:
+        if log_frame:
+            logger.info("Received TRANSCRIPT data")
+        # Handle transcript data if needed
+
+def create_rtms_client(metrics=None, capture=None):
+    # All signaling/media sockets of a process run on one background event loop
+    return RTMSClient(
+        CLIENT_ID,
+        CLIENT_SECRET,
+        media_type=MEDIA_TYPE_ALL,
+        media_params={
+            "audio": {
+                "content_type": 1,
+                "sample_rate": 1,
+                "channel": 1,
+                "codec": 1,
+                "data_opt": 1,
+                "send_rate": 100
+            },
+            "video": {
+                "codec": 7,
+                "resolution": 2,
+                "fps": 25
             }
-        }
-        ws.send(json.dumps(handshake))
-
-    def on_message(ws, message):
-        # logger.info(f"Received message from media WebSocket: {message}")
-        try:
-            msg = json.loads(message)
-            msg_type = msg.get("msg_type")
-
-            if msg_type == 4 and msg.get("status_code") == 0:
-                signaling_socket.send(json.dumps({
-                    "msg_type": 7,
-                    "rtms_stream_id": stream_id
-                }))
-                logger.info("Media handshake successful, sent start streaming request")
-            elif msg_type == 12:
-                ws.send(json.dumps({
-                    "msg_type": 13,
-                    "timestamp": msg["timestamp"]
-                }))
-                logger.info("Responded to Media KEEP_ALIVE_REQ")
-            elif msg_type == 14:
-                logger.info("Received AUDIO data")
-                # Handle audio data if needed
-            elif msg_type == 15:
-                logger.info("Received VIDEO data")
-                # Handle video data if needed
-            elif msg_type == 17:
-                logger.info("Received TRANSCRIPT data")
-                # Handle transcript data if needed
-        except Exception as e:
-            logger.error(f"Error processing media message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"Media socket error: {error}")
-
-    def on_close(ws, close_status_code, close_msg):
-        logger.info("Media socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("media", None)
-
-    ws = websocket.WebSocketApp(media_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    active_connections[meeting_uuid]["media"] = ws
-    threading.Thread(target=ws.run_forever, daemon=True).start()
-
-def connect_to_signaling_ws(meeting_uuid, stream_id, server_url):
-    logger.info(f"Connecting to signaling WebSocket for meeting {meeting_uuid}")
-
-    def on_open(ws):
-        signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-        handshake = {
-            "msg_type": 1,
-            "protocol_version": 1,
-            "meeting_uuid": meeting_uuid,
-            "rtms_stream_id": stream_id,
-            "sequence": random.randint(0, int(1e9)),
-            "signature": signature
-        }
-        ws.send(json.dumps(handshake))
-        logger.info("Sent handshake to signaling server")
-
-    def on_message(ws, message):
-        try:
-            msg = json.loads(message)
-            if msg.get("msg_type") == 2 and msg.get("status_code") == 0:
-                media_url = msg.get("media_server", {}).get("server_urls", {}).get("all")
-                if media_url:
-                    connect_to_media_ws(media_url, meeting_uuid, stream_id, ws)
-            elif msg.get("msg_type") == 12:
-                ws.send(json.dumps({
-                    "msg_type": 13,
-                    "timestamp": msg["timestamp"]
-                }))
-                logger.info("Responded to Signaling KEEP_ALIVE_REQ")
-        except Exception as e:
-            logger.error(f"Error processing signaling message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"Signaling socket error: {error}")
-
-    def on_close(ws, close_status_code, close_msg):
-        logger.info("Signaling socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("signaling", None)
-
-    ws = websocket.WebSocketApp(server_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    active_connections[meeting_uuid] = {"signaling": ws}
-    threading.Thread(target=ws.run_forever, daemon=True).start()
+        },
+        on_media=handle_media,
+        verify_tls=RTMS_VERIFY_TLS,
+        metrics=metrics,
+        capture=capture
+    )
+
+# With RTMS_WORKERS set, meetings are hashed by meeting_uuid across worker processes
+if RTMS_WORKERS > 0:
+    rtms_client = ShardedWorkerPool(RTMS_WORKERS, create_rtms_client)
+    # Worker clients have no metrics or capture; GET /metrics only covers this process.
+    # Workers import this module again, so only warn in the web server process
+    if multiprocessing.parent_process() is None:
+        logger.warning(f"RTMS_WORKERS={RTMS_WORKERS}: RTMS metrics are not collected from worker processes")
+        if RTMS_CAPTURE:
+            logger.warning("RTMS_CAPTURE is ignored with RTMS_WORKERS set; run a single process to capture")
+    submit_stream, submit_stop = rtms_client.submit_start, rtms_client.submit_stop
+else:
+    rtms_client = create_rtms_client(metrics, CaptureWriter(RTMS_CAPTURE) if RTMS_CAPTURE else None)
+    submit_stream, submit_stop = rtms_client.submit_stream, rtms_client.submit_stop
 
 @app.route(WEBHOOK_PATH, methods=['POST'])
 def handle_webhook():
@@ -172,17 +126,11 @@ def handle_webhook():
         meeting_uuid = payload.get("meeting_uuid")
         stream_id = payload.get("rtms_stream_id")
         server_url = payload.get("server_urls")
-        connect_to_signaling_ws(meeting_uuid, stream_id, server_url)
+        submit_stream(meeting_uuid, stream_id, server_url)
 
     if event == "meeting.rtms_stopped":
         meeting_uuid = payload.get("meeting_uuid")
-        if meeting_uuid in active_connections:
-            for conn in active_connections[meeting_uuid].values():
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-            del active_connections[meeting_uuid]
+        submit_stop(meeting_uuid)
 
     return '', 200
 
@@ -1,16 +1,19 @@
 import os
-import json
-import hmac
-import hashlib
 import logging
-import random
-from flask import Flask, request, jsonify
+from flask import Flask
 from dotenv import load_dotenv
-import websocket
-import threading
-import base64
-import requests
-import time
+from pathlib import Path
+import sys
+
+# Shared RTMS helpers live in python_common/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python_common"))
+from rtms_common.client import RTMSClient, MEDIA_TYPE_ALL
+from rtms_common.tokens import TokenError, get_token_manager
+from rtms_common.keepalive import default_keepalive
+from rtms_common.event_stream import ZoomEventStream
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.capture import CaptureWriter
+from rtms_common.logs import MediaLog, setup_logging
 
 # Load environment variables
 load_dotenv()
@@ -20,168 +23,106 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
 ZOOM_SECRET_TOKEN = os.getenv("ZOOM_SECRET_TOKEN")
 CLIENT_ID = os.getenv("ZM_CLIENT_ID")
 CLIENT_SECRET = os.getenv("ZM_CLIENT_SECRET")
-
-# Setup logging
-logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
+# Close (and report) the event WebSocket if nothing arrives for this many seconds
+EVENT_WS_DEAD_AFTER = float(os.getenv("EVENT_WS_DEAD_AFTER", 75))
+# Upper bound (seconds) of the jittered backoff between event WebSocket reconnects
+EVENT_WS_MAX_BACKOFF = float(os.getenv("EVENT_WS_MAX_BACKOFF", 60))
+# Record every received RTMS message to this file for offline replay (a .zst name compresses it)
+RTMS_CAPTURE = os.getenv("RTMS_CAPTURE")
+# Verify the RTMS servers' TLS certificates; set to false only for local servers with self-signed certificates
+RTMS_VERIFY_TLS = os.getenv("RTMS_VERIFY_TLS", "true").lower() != "false"
+# Media lines logged: every Nth message per meeting and at most N lines/sec, by msg_type (e.g. "14=100,*=1")
+LOG_MEDIA_SAMPLE = os.getenv("LOG_MEDIA_SAMPLE", "")
+LOG_MEDIA_RATE = os.getenv("LOG_MEDIA_RATE", "*=1")
+# Seconds between per-meeting message/byte summaries (0 = off)
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", 10))
+
+# Setup logging; lines are formatted and written on a background thread, never on the event loop
+setup_logging(getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
 logger = logging.getLogger(__name__)
+media_log = MediaLog(sample=LOG_MEDIA_SAMPLE, rate=LOG_MEDIA_RATE, summary_interval=LOG_SUMMARY_INTERVAL)
 
-app = Flask(__name__)
-active_connections = {}
-
-def generate_signature(client_id, meeting_uuid, stream_id, client_secret):
-    message = f"{client_id},{meeting_uuid},{stream_id}"
-    signature = hmac.new(client_secret.encode(), message.encode(), hashlib.sha256).hexdigest()
-    return signature
-
-def connect_to_media_ws(media_url, meeting_uuid, stream_id, signaling_socket):
-    logger.info(f"Connecting to media WebSocket at {media_url}")
-
-    def on_open(ws):
-        signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-        handshake = {
-            "msg_type": 3,
-            "protocol_version": 1,
-            "meeting_uuid": meeting_uuid,
-            "rtms_stream_id": stream_id,
-            "signature": signature,
-            "media_type": 32,
-            "payload_encryption": False,
-            "media_params": {
-                "audio": {
-                    "content_type": 1,
-                    "sample_rate": 1,
-                    "channel": 1,
-                    "codec": 1,
-                    "data_opt": 1,
-                    "send_rate": 100
-                },
-                "video": {
-                    "codec": 7,
-                    "resolution": 2,
-                    "fps": 25
-                }
-            }
-        }
-        ws.send(json.dumps(handshake))
-
-    def on_message(ws, message):
-        # logger.info(f"Received message from media WebSocket: {message}")
-        try:
-            msg = json.loads(message)
-            msg_type = msg.get("msg_type")
-
-            if msg_type == 4 and msg.get("status_code") == 0:
-                signaling_socket.send(json.dumps({
-                    "msg_type": 7,
-                    "rtms_stream_id": stream_id
-                }))
-                logger.info("Media handshake successful, sent start streaming request")
-            elif msg_type == 12:
-                ws.send(json.dumps({
-                    "msg_type": 13,
-                    "timestamp": msg["timestamp"]
-                }))
-                logger.info("Responded to Media KEEP_ALIVE_REQ")
-            elif msg_type == 14:
-                logger.info("Received AUDIO data")
-                # Handle audio data if needed
-            elif msg_type == 15:
-                logger.info("Received VIDEO data")
-                # Handle video data if needed
-            elif msg_type == 17:
-                logger.info("Received TRANSCRIPT data")
-                # Handle transcript data if needed
-        except Exception as e:
-            logger.error(f"Error processing media message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"Media socket error: {error}")
+# One timer thread drives heartbeats and dead-peer checks for every socket
+keepalive = default_keepalive()
 
-    def on_close(ws, close_status_code, close_msg):
-        logger.info("Media socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("media", None)
-
-    ws = websocket.WebSocketApp(media_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    active_connections[meeting_uuid]["media"] = ws
-    threading.Thread(target=ws.run_forever, daemon=True).start()
-
-def connect_to_signaling_ws(meeting_uuid, stream_id, server_url):
-    logger.info(f"Connecting to signaling WebSocket for meeting {meeting_uuid}")
+app = Flask(__name__)
 
-    def on_open(ws):
-        signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-        handshake = {
-            "msg_type": 1,
-            "protocol_version": 1,
-            "meeting_uuid": meeting_uuid,
-            "rtms_stream_id": stream_id,
-            "sequence": random.randint(0, int(1e9)),
-            "signature": signature
+# Message rates, decode/handshake latency and keep-alive timings, served at GET /metrics
+metrics = RTMSMetrics()
+metrics.attach(app)
+
+def handle_media(stream, frame):
+    # Only msg_type is read up front; the frame is parsed when a branch needs it
+    msg_type = frame.msg_type
+    # Every message is counted in the per-meeting summaries; only a sample gets its own line
+    log_frame = media_log.observe(stream, frame)
+
+    if msg_type == 14:
+        if log_frame:
+            logger.info("Received AUDIO data")
+        # Handle audio data if needed
+    elif msg_type == 15:
+        if log_frame:
+            logger.info("Received VIDEO data")
+        # Handle video data if needed
+    elif msg_type == 17:
+        if log_frame:
+            logger.info("Received TRANSCRIPT data")
+        # Handle transcript data if needed
+
+# All signaling/media sockets run on one background event loop
+rtms_client = RTMSClient(
+    CLIENT_ID,
+    CLIENT_SECRET,
+    media_type=MEDIA_TYPE_ALL,
+    media_params={
+        "audio": {
+            "content_type": 1,
+            "sample_rate": 1,
+            "channel": 1,
+            "codec": 1,
+            "data_opt": 1,
+            "send_rate": 100
+        },
+        "video": {
+            "codec": 7,
+            "resolution": 2,
+            "fps": 25
         }
-        ws.send(json.dumps(handshake))
-        logger.info("Sent handshake to signaling server")
-
-    def on_message(ws, message):
-        try:
-            msg = json.loads(message)
-            if msg.get("msg_type") == 2 and msg.get("status_code") == 0:
-                media_url = msg.get("media_server", {}).get("server_urls", {}).get("all")
-                if media_url:
-                    connect_to_media_ws(media_url, meeting_uuid, stream_id, ws)
-            elif msg.get("msg_type") == 12:
-                ws.send(json.dumps({
-                    "msg_type": 13,
-                    "timestamp": msg["timestamp"]
-                }))
-                logger.info("Responded to Signaling KEEP_ALIVE_REQ")
-        except Exception as e:
-            logger.error(f"Error processing signaling message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"Signaling socket error: {error}")
-
-    def on_close(ws, close_status_code, close_msg):
-        logger.info("Signaling socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("signaling", None)
-
-    ws = websocket.WebSocketApp(server_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    active_connections[meeting_uuid] = {"signaling": ws}
-    threading.Thread(target=ws.run_forever, daemon=True).start()
+    },
+    on_media=handle_media,
+    verify_tls=RTMS_VERIFY_TLS,
+    metrics=metrics,
+    capture=CaptureWriter(RTMS_CAPTURE) if RTMS_CAPTURE else None
+)
 
 def get_zoom_access_token():
-    url = "https://zoom.us/oauth/token?grant_type=client_credentials"
-    credentials = f"{CLIENT_ID}:{CLIENT_SECRET}"
-    encoded_credentials = base64.b64encode(credentials.encode()).decode()
-    logger.debug(encoded_credentials)
-    headers = {
-        "Authorization": f"Basic {encoded_credentials}"
-    }
+    # Cached per client and refreshed in the background before it expires
+    try:
+        token = get_token_manager(CLIENT_ID, CLIENT_SECRET).get_token()
+        logger.debug("🔐 Using cached Zoom access token.")
+        return token
+    except TokenError as e:
+        logger.error(f"❌ Zoom token request failed: {e}")
+        return None
 
-    logger.debug("🔐 Requesting Zoom access token...")
-    response = requests.post(url, headers=headers)
 
-    logger.debug(f"🛰️ Token request sent to: {url}")
-    logger.debug(f"📨 Response status: {response.status_code}")
-    logger.debug(f"📨 Response body: {response.text}")
 
-    if response.status_code == 200:
-        token_data = response.json()
-        logger.info("✅ Zoom access token received.")
-        return token_data.get("access_token")
-    else:
-        logger.error(f"❌ Zoom token request failed: {response.status_code} {response.text}")
-        return None
+def handle_zoom_event(event, payload, event_data):
+    logger.info(f"🧠 Parsed Event: {event}")
+    logger.debug(f"📦 Payload: {payload}")
 
+    if event == "meeting.rtms_started":
+        meeting_uuid = payload.get("meeting_uuid")
+        stream_id = payload.get("rtms_stream_id")
+        server_url = payload.get("server_urls")
+        logger.info(f"🚀 Triggering signaling WebSocket for {meeting_uuid}")
+        rtms_client.submit_stream(meeting_uuid, stream_id, server_url)
+
+    elif event == "meeting.rtms_stopped":
+        meeting_uuid = payload.get("meeting_uuid")
+        logger.info(f"🛑 Closing signaling for {meeting_uuid}")
+        rtms_client.submit_stop(meeting_uuid)
 
 
 def start_zoom_event_websocket():
@@ -190,92 +131,20 @@ def start_zoom_event_websocket():
     base_ws_url = os.getenv("ZOOM_EVENT_WS_BASE")
     if not base_ws_url:
         logger.error("❌ Missing ZOOM_EVENT_WS_BASE in environment.")
-        return
-
-    access_token = get_zoom_access_token()
-    if not access_token:
-        logger.error("❌ Failed to obtain Zoom access token.")
-        return
-
-    full_ws_url = f"{base_ws_url}&access_token={access_token}"
-    logger.debug(f"🔗 Full WebSocket URL: {full_ws_url}")
-
-    def on_open(ws):
-        logger.info("✅ WebSocket connection established.")
-        logger.debug("🫀 Starting heartbeat thread every 30s...")
-
-        def heartbeat():
-            try:
-                initial = {"module": "heartbeat"}
-                ws.send(json.dumps(initial))
-                logger.debug(f"💓 Sent initial heartbeat: {initial}")
-            except Exception as e:
-                logger.error(f"❌ Failed to send initial heartbeat: {e}")
-                return
-
-            while True:
-                time.sleep(30)
-                try:
-                    ws.send(json.dumps({"module": "heartbeat"}))
-                    logger.debug("💓 Heartbeat sent.")
-                except Exception as e:
-                    logger.error(f"❌ Heartbeat error: {e}")
-                    break
-
-        threading.Thread(target=heartbeat, daemon=True).start()
-
-    def on_message(ws, message):
-        logger.info("📥 Received message from Zoom Event WebSocket.")
-        logger.debug(f"🔍 Raw Message:\n{message}")
-
-        try:
-            msg = json.loads(message)
-            if msg.get("module") == "message":
-                content = msg.get("content")
-                if content:
-                    event_data = json.loads(content)
-                    event = event_data.get("event")
-                    payload = event_data.get("payload", {})
-
-                    logger.info(f"🧠 Parsed Event: {event}")
-                    logger.debug(f"📦 Payload: {payload}")
-
-                    if event == "meeting.rtms_started":
-                        meeting_uuid = payload.get("meeting_uuid")
-                        stream_id = payload.get("rtms_stream_id")
-                        server_url = payload.get("server_urls")
-                        logger.info(f"🚀 Triggering signaling WebSocket for {meeting_uuid}")
-                        connect_to_signaling_ws(meeting_uuid, stream_id, server_url)
-
-                    elif event == "meeting.rtms_stopped":
-                        meeting_uuid = payload.get("meeting_uuid")
-                        if meeting_uuid in active_connections:
-                            logger.info(f"🛑 Closing signaling for {meeting_uuid}")
-                            for conn in active_connections[meeting_uuid].values():
-                                try:
-                                    conn.close()
-                                except Exception:
-                                    pass
-                            del active_connections[meeting_uuid]
-
-        except Exception as e:
-            logger.error(f"❌ Error processing message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"⚠️ WebSocket Error: {error}")
-
-    def on_close(ws, close_status_code, close_msg):
-        logger.warning(f"🔌 WebSocket closed | Code: {close_status_code}, Message: {close_msg}")
+        return None
 
-    ws = websocket.WebSocketApp(
-        full_ws_url,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close
+    # Reconnects with jittered backoff and a fresh cached token, drops replayed events
+    event_stream = ZoomEventStream(
+        base_ws_url,
+        get_zoom_access_token,
+        handle_zoom_event,
+        on_unauthorized=get_token_manager(CLIENT_ID, CLIENT_SECRET).invalidate,
+        keepalive=keepalive,
+        dead_after=EVENT_WS_DEAD_AFTER,
+        max_backoff=EVENT_WS_MAX_BACKOFF
     )
-
-    threading.Thread(target=ws.run_forever, daemon=True).start()
+    event_stream.start()
+    return event_stream
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+"""Pick a few representative stills per user out of the video stream.
+
+Zoom sends JPEG frames at the requested fps, but a participant's picture
+rarely changes between them. `FrameSampler` sits in front of `FrameStore`:
+
+1. a per-user rate limit (`min_interval` seconds between saved frames),
+   checked before the frame payload is even decoded
+2. perceptual-hash change detection: a 64-bit difference hash (dHash) of
+   each candidate is compared with the last saved frame, and frames within
+   `hash_threshold` bits are skipped
+3. optional downscale/re-encode to `thumbnail_size` thumbnails
+
+Hashing and thumbnailing run on worker threads (Pillow releases the GIL
+while decoding and encoding), with each user pinned to one worker so its
+frames are compared in order. Without Pillow installed only the rate limit
+applies and frames are saved as received.
+"""
+import io
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # change detection and thumbnails need Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a PIL image."""
+    # draft() lets the JPEG decoder downscale by up to 8x while decoding
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size)).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class FrameSampler:
+    """Rate-limit, deduplicate and optionally thumbnail frames before `store.save`."""
+
+    def __init__(self, store, min_interval=1.0, hash_threshold=6, thumbnail_size=None,
+                 thumbnail_quality=80, workers=2):
+        self.store = store
+        self.min_interval = min_interval
+        self.hash_threshold = hash_threshold if Image is not None else 0
+        self.thumbnail_size = thumbnail_size if Image is not None else None
+        self.thumbnail_quality = thumbnail_quality
+
+        self.received = 0
+        self.rate_limited = 0
+        self.unchanged = 0
+        self.saved = 0
+
+        self._last_accepted = {}
+        self._last_hash = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"frame-sampler-{i}")
+            for i in range(workers)
+        ]
+        if Image is None and (hash_threshold or thumbnail_size):
+            logger.warning("Pillow is not installed; frame change detection and thumbnails are disabled")
+
+    def due(self, user_key, now=None):
+        """True if `user_key` may save another frame now (call before decoding it)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.received += 1
+            last = self._last_accepted.get(user_key)
+            if last is not None and now - last < self.min_interval:
+                self.rate_limited += 1
+                return False
+            self._last_accepted[user_key] = now
+            return True
+
+    def submit(self, user_key, name, data):
+        """Hash/thumbnail the frame on a worker and save it if it changed."""
+        if not (self.hash_threshold or self.thumbnail_size):
+            with self._lock:
+                self.saved += 1
+            return self.store.save(user_key, name, data)
+        worker = self._workers[zlib.crc32(user_key.encode()) % len(self._workers)]
+        return worker.submit(self._process, user_key, name, data)
+
+    def reset(self):
+        """Forget rate limits and hashes so every user's next frame is kept (e.g. after a gap)."""
+        with self._lock:
+            self._last_accepted.clear()
+            self._last_hash.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self.received,
+                "rate_limited": self.rate_limited,
+                "unchanged": self.unchanged,
+                "saved": self.saved
+            }
+
+    def close(self):
+        for worker in self._workers:
+            worker.shutdown(wait=True)
+
+    def _process(self, user_key, name, data):
+        try:
+            image = Image.open(io.BytesIO(data))
+            if self.hash_threshold:
+                frame_hash = dhash(image)
+                with self._lock:
+                    last_hash = self._last_hash.get(user_key)
+                    unchanged = last_hash is not None and bin(frame_hash ^ last_hash).count("1") <= self.hash_threshold
+                    if unchanged:
+                        self.unchanged += 1
+                    else:
+                        self._last_hash[user_key] = frame_hash
+                if unchanged:
+                    logger.debug("⏭️ Skipping unchanged frame for %s", user_key)
+                    return
+                image = Image.open(io.BytesIO(data))
+            if self.thumbnail_size:
+                image.draft("RGB", self.thumbnail_size)
+                image = image.convert("RGB")
+                image.thumbnail(self.thumbnail_size)
+                out = io.BytesIO()
+                image.save(out, format="JPEG", quality=self.thumbnail_quality)
+                data = out.getvalue()
+        except Exception as e:
+            logger.error(f"❌ Failed to sample frame for {user_key}: {e}")
+            return
+        with self._lock:
+            self.saved += 1
+        return self.store.save(user_key, name, data)
@@ -0,0 +1,127 @@
+"""Keep the newest N frames per user on disk without rescanning directories.
+
+`save_video_frame` used to mkdir, glob and stat every file in the user's
+folder for every frame just to find the oldest one. `FrameStore` keeps an
+in-memory ring of saved paths per user instead: the folder is created (and
+any files left from an earlier run are indexed) once, and every later save
+is an append to the ring plus, once it is full, an unlink of the evicted
+path. File writes and deletes run on writer threads; each user is pinned to
+one writer, which appends to the ring only after the file is written.
+Saves and evictions are logged at DEBUG only; `stats()` reports the counts.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStore:
+    """Save frames under `root/<user_key>/`, keeping `max_files_per_user` each."""
+
+    def __init__(self, root, max_files_per_user=3, writers=2, file_ext="jpg", on_write=None):
+        self.root = Path(root)
+        self.max_files_per_user = max_files_per_user
+        self.file_ext = file_ext
+        # Called with the seconds each file write took (e.g. to export a latency metric)
+        self.on_write = on_write
+        # Updated by every writer thread, under self._lock
+        self.saved = 0
+        self.evicted = 0
+        self.errors = 0
+
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._writers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"frame-writer-{i}")
+            for i in range(writers)
+        ]
+
+    def save(self, user_key, name, data):
+        """Queue `data` to be written as `<name>.<ext>` and evict the oldest frame if needed."""
+        writer = self._writers[zlib.crc32(user_key.encode()) % len(self._writers)]
+        with self._lock:
+            ring = self._rings.get(user_key)
+            if ring is None:
+                ring = self._rings[user_key] = collections.deque()
+                writer.submit(self._open_user, user_key, ring)
+        path = self.root / user_key / f"{name}.{self.file_ext}"
+        writer.submit(self._write, user_key, ring, path, data)
+        return path
+
+    def mark_gap(self, gap):
+        """Append a media gap (a dict) to `root/gaps.jsonl` so the missing span is on record."""
+        self._writers[0].submit(self._write_gap, gap)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._rings),
+                "saved": self.saved,
+                "evicted": self.evicted,
+                "errors": self.errors
+            }
+
+    def close(self):
+        for writer in self._writers:
+            writer.shutdown(wait=True)
+
+    # --------------------------------------------------------------- writers
+
+    def _open_user(self, user_key, ring):
+        # Runs once per user: create the folder and index frames from earlier runs
+        folder = self.root / user_key
+        folder.mkdir(parents=True, exist_ok=True)
+        existing = sorted(
+            (entry.stat().st_mtime, Path(entry.path))
+            for entry in os.scandir(folder)
+            if entry.name.endswith(f".{self.file_ext}")
+        )
+        ring.extend(path for _, path in existing)
+
+    def _write_gap(self, gap):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / "gaps.jsonl", 'a') as f:
+                f.write(json.dumps(gap) + "\n")
+        except OSError as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"❌ Failed to record media gap: {e}")
+
+    def _write(self, user_key, ring, path, data):
+        try:
+            started = time.perf_counter()
+            with open(path, 'wb') as f:
+                f.write(data)
+            if self.on_write is not None:
+                self.on_write(time.perf_counter() - started)
+            with self._lock:
+                self.saved += 1
+            logger.debug("💾 Saved frame for %s to %s", user_key, path)
+        except OSError as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"❌ Failed to save frame for {user_key}: {e}")
+            return
+
+        # The ring is only touched on this user's writer thread, after the write
+        ring.append(path)
+        while len(ring) > self.max_files_per_user:
+            oldest = ring.popleft()
+            # A frame saved twice under one name is still in the ring
+            if oldest in ring:
+                continue
+            try:
+                oldest.unlink()
+                with self._lock:
+                    self.evicted += 1
+                logger.debug("🗑️ Deleted oldest frame for %s: %s", user_key, oldest.name)
+            except FileNotFoundError:
+                pass
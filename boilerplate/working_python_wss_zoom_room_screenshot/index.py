@@ -1,17 +1,28 @@
 import os
-import json
-import hmac
-import hashlib
 import logging
-import random
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-import websocket
 import threading
-import base64
-import requests
+from flask import Flask, jsonify
+from dotenv import load_dotenv
 import time
 from pathlib import Path
+import sys
+
+# Shared RTMS helpers live in python_common/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python_common"))
+from rtms_common.client import RTMSClient, MEDIA_TYPE_ALL
+from rtms_common.tokens import TokenError, get_token_manager
+from rtms_common.keepalive import default_keepalive
+from rtms_common.event_stream import ZoomEventStream
+from rtms_common.pipeline import MediaPipeline, DROP_OLDEST
+from rtms_common.scheduler import TimerWheel
+from rtms_common.zoom_api import ZoomAPIClient
+from rtms_common.room_inventory import RoomInventory
+from rtms_common.retry_queue import RetryQueue
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.capture import CaptureWriter
+from rtms_common.logs import MediaLog, setup_logging
+from frame_store import FrameStore
+from frame_sampler import FrameSampler
 
 # Load environment variables
 load_dotenv()
@@ -21,346 +32,265 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
 ZOOM_SECRET_TOKEN = os.getenv("ZOOM_SECRET_TOKEN")
 CLIENT_ID = os.getenv("ZM_CLIENT_ID")
 CLIENT_SECRET = os.getenv("ZM_CLIENT_SECRET")
+# Close (and report) the event WebSocket if nothing arrives for this many seconds
+EVENT_WS_DEAD_AFTER = float(os.getenv("EVENT_WS_DEAD_AFTER", 75))
+# Upper bound (seconds) of the jittered backoff between event WebSocket reconnects
+EVENT_WS_MAX_BACKOFF = float(os.getenv("EVENT_WS_MAX_BACKOFF", 60))
 ACCOUNT_ID = os.getenv("ZOOM_ACCOUNT_ID")
 S2S_CLIENT_ID = os.getenv("S2S_ZM_CLIENT_ID")
 S2S_CLIENT_SECRET = os.getenv("S2S_ZM_CLIENT_SECRET")
 MEETING_NUMBER = os.getenv("ZOOM_MEETING_NUMBER")
 MEETING_PASSCODE = os.getenv("ZOOM_MEETING_PASSCODE")
-
-# Setup logging
-logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
+# Frames buffered per meeting and media type between the socket and the disk
+MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", 32))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", 4))
+FRAME_WRITERS = int(os.getenv("FRAME_WRITERS", 2))
+# Keyframe sampling: at most one frame per user every FRAME_SAMPLE_SECONDS, skipping
+# frames whose perceptual hash is within FRAME_HASH_THRESHOLD bits of the last saved one
+FRAME_SAMPLE_SECONDS = float(os.getenv("FRAME_SAMPLE_SECONDS", 1.0))
+FRAME_HASH_THRESHOLD = int(os.getenv("FRAME_HASH_THRESHOLD", 6))
+# e.g. 320x180 to save thumbnails instead of full frames (needs Pillow)
+THUMBNAIL_SIZE = os.getenv("THUMBNAIL_SIZE", "")
+SAMPLER_WORKERS = int(os.getenv("SAMPLER_WORKERS", 2))
+# Zoom Room REST calls in flight at once, and how long joined rooms stay in the meeting
+ROOM_API_CONCURRENCY = int(os.getenv("ROOM_API_CONCURRENCY", 16))
+ROOM_LEAVE_DELAY = float(os.getenv("ROOM_LEAVE_DELAY", 30))
+# Room list cache: reused for ROOM_CACHE_TTL seconds, persisted across restarts in ROOM_CACHE_FILE.
+# Up to ROOM_CACHE_MAX_STALE seconds old it is still used while it is revalidated in the background
+ROOM_CACHE_TTL = float(os.getenv("ROOM_CACHE_TTL", 300))
+ROOM_CACHE_MAX_STALE = float(os.getenv("ROOM_CACHE_MAX_STALE", 600))
+ROOM_CACHE_FILE = os.getenv("ROOM_CACHE_FILE", "rooms_cache.json")
+# Record every received RTMS message to this file for offline replay (a .zst name compresses it)
+RTMS_CAPTURE = os.getenv("RTMS_CAPTURE")
+# Verify the RTMS servers' TLS certificates; set to false only for local servers with self-signed certificates
+RTMS_VERIFY_TLS = os.getenv("RTMS_VERIFY_TLS", "true").lower() != "false"
+# Media lines logged: every Nth message per meeting and at most N lines/sec, by msg_type (e.g. "14=100,*=1")
+LOG_MEDIA_SAMPLE = os.getenv("LOG_MEDIA_SAMPLE", "")
+LOG_MEDIA_RATE = os.getenv("LOG_MEDIA_RATE", "*=1")
+# Seconds between per-meeting message/byte summaries (0 = off)
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", 10))
+
+# Setup logging; lines are formatted and written on a background thread, never on the event loop
+setup_logging(getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
 logger = logging.getLogger(__name__)
+media_log = MediaLog(sample=LOG_MEDIA_SAMPLE, rate=LOG_MEDIA_RATE, summary_interval=LOG_SUMMARY_INTERVAL)
+
+# One timer thread drives heartbeats and dead-peer checks for every socket
+keepalive = default_keepalive()
 
 app = Flask(__name__)
-active_connections = {}
 
-RETRY_FILE = 'retry_rooms.json'
+# Message rates, decode/handshake latency and keep-alive timings, served at GET /metrics
+metrics = RTMSMetrics()
+metrics.attach(app)
+
+# Rooms that failed to join, with their next retry time (SQLite, crash-safe)
+RETRY_DB = os.getenv("RETRY_DB", "retry_rooms.db")
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 30))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 3600))
+LEGACY_RETRY_FILE = 'retry_rooms.json'
 MAX_FILES_PER_USER = 3
 user_frame_counters = {}
-retry_rooms = []
-
-
-def generate_signature(client_id, meeting_uuid, stream_id, client_secret):
-    message = f"{client_id},{meeting_uuid},{stream_id}"
-    signature = hmac.new(client_secret.encode(), message.encode(), hashlib.sha256).hexdigest()
-    return signature
-
-def connect_to_media_ws(media_url, meeting_uuid, stream_id, signaling_socket):
-    logger.info(f"Connecting to media WebSocket at {media_url}")
-
-
-
-
-    def on_open(ws):
-        signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-        handshake = {
-            "msg_type": 3,
-            "protocol_version": 1,
-            "meeting_uuid": meeting_uuid,
-            "rtms_stream_id": stream_id,
-            "signature": signature,
-            "media_type": 32,
-            "payload_encryption": False,
-            "media_params": {
-                "audio": {
-                    "content_type": 1,
-                    "sample_rate": 1,
-                    "channel": 1,
-                    "codec": 1,
-                    "data_opt": 1,
-                    "send_rate": 100
-                },
-                "video": {
-                    "codec": 5, #JPG
-                     # "data_opt":3, # VIDEO_SINGLE_ACTIVE_STREAM
-                    "resolution": 2, #720p, use 3 for #1080p
-                    "fps": 5
-                }
-            }
-        }
-        ws.send(json.dumps(handshake))
-
-    def on_message(ws, message):
-        # logger.info(f"Received message from media WebSocket: {message}")
+# save_video_frame runs on every media pipeline worker
+user_frame_counters_lock = threading.Lock()
+# In-memory index of saved frames; writes and evictions run on writer threads
+frame_store = FrameStore(
+    "recordings",
+    max_files_per_user=MAX_FILES_PER_USER,
+    writers=FRAME_WRITERS,
+    on_write=lambda seconds: metrics.observe_sink_write("frame_store", seconds)
+)
+frame_sampler = FrameSampler(
+    frame_store,
+    min_interval=FRAME_SAMPLE_SECONDS,
+    hash_threshold=FRAME_HASH_THRESHOLD,
+    thumbnail_size=tuple(int(v) for v in THUMBNAIL_SIZE.lower().split("x")) if THUMBNAIL_SIZE else None,
+    workers=SAMPLER_WORKERS
+)
+retry_queue = RetryQueue(RETRY_DB, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY)
+
+
+def process_media(stream, frame):
+    # Runs on a media pipeline worker thread, never on the socket event loop
+    msg_type = frame.msg_type
+    # Every message is counted in the per-meeting summaries; only a sample gets its own lines
+    log_frame = media_log.observe(stream, frame)
+
+    if msg_type == 14:
+        # logger.info("Audio")
+        pass
+    elif msg_type == 15:
+        # logger.info("Video")
+
+        content = frame.content
+
+        timestamp = content.get("timestamp")
+        user_name = content.get("user_name")
+        user_id = str(content.get("user_id"))
+    
+        if log_frame:
+            logger.debug("🧾 Extracted fields — user_name: '%s', user_id: '%s', timestamp: '%s'", user_name, user_id, timestamp)
         try:
-            msg = json.loads(message)
-            msg_type = msg.get("msg_type")
-
-            if msg_type == 4 and msg.get("status_code") == 0:
-                signaling_socket.send(json.dumps({
-                    "msg_type": 7,
-                    "rtms_stream_id": stream_id
-                }))
-                logger.info("Media handshake successful, sent start streaming request")
-                logger.info("Starting Room Joiners")
-
-            elif msg_type == 12:
-                ws.send(json.dumps({
-                    "msg_type": 13,
-                    "timestamp": msg["timestamp"]
-                }))
-                logger.info("Responded to Media KEEP_ALIVE_REQ")
-            elif msg_type == 14:
-                # logger.info("Audio")
-                pass
-            elif msg_type == 15:
-                # logger.info("Video")
-
-                content = msg.get("content", {})
-
-                video_data_b64 = content.get("data")
-                timestamp = content.get("timestamp")
-                user_name = content.get("user_name")
-                user_id = str(content.get("user_id"))
-            
-                logger.debug(f"🧾 Extracted fields — user_name: '{user_name}', user_id: '{user_id}', timestamp: '{timestamp}'")
-                logger.debug(f"📏 video_data_b64 is None: {video_data_b64 is None}, type: {type(video_data_b64)}")
-                try:
-                    logger.debug(f"📦 Decoding video frame for user {user_name} ({user_id}) at {timestamp}")
-                    buffer = base64.b64decode(video_data_b64)
-                    save_video_frame(buffer, user_id, timestamp, user_name)
-                except Exception as e:
-                    logger.error(f"❌ Failed to process video data for {user_id}: {e}")
-            elif msg_type == 17:
-                logger.info("Received TRANSCRIPT data")
-                # Handle transcript data if needed
+            if log_frame:
+                logger.debug("📦 Sampling video frame for user %s (%s) at %s", user_name, user_id, timestamp)
+            # Pass the frame itself so the JPEG is only decoded if it will be kept
+            save_video_frame(frame, user_id, timestamp, user_name)
         except Exception as e:
-            logger.error(f"Error processing media message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"Media socket error: {error}")
-
-    def on_close(ws, close_status_code, close_msg):
-        logger.info("Media socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("media", None)
-
-    ws = websocket.WebSocketApp(media_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    active_connections[meeting_uuid]["media"] = ws
-    threading.Thread(target=ws.run_forever, daemon=True).start()
-
-def connect_to_signaling_ws(meeting_uuid, stream_id, server_url):
-    logger.info(f"Connecting to signaling WebSocket for meeting {meeting_uuid}")
-
-    def on_open(ws):
-        signature = generate_signature(CLIENT_ID, meeting_uuid, stream_id, CLIENT_SECRET)
-        handshake = {
-            "msg_type": 1,
-            "protocol_version": 1,
-            "meeting_uuid": meeting_uuid,
-            "rtms_stream_id": stream_id,
-            "sequence": random.randint(0, int(1e9)),
-            "signature": signature
+            logger.error(f"❌ Failed to process video data for {user_id}: {e}")
+    elif msg_type == 17:
+        if log_frame:
+            logger.info("Received TRANSCRIPT data")
+        # Handle transcript data if needed
+
+# Bounded queues between receive and processing: slow disk writes drop old
+# video frames instead of stalling socket reads and keep-alive replies
+media_pipeline = MediaPipeline(
+    process_media,
+    maxsize=MEDIA_QUEUE_SIZE,
+    policies={
+        15: DROP_OLDEST  # only the newest frames are worth saving
+    },
+    workers=MEDIA_WORKERS
+)
+metrics.watch_pipeline(media_pipeline)
+
+def handle_gap(stream, gap):
+    # Media resumed after a reconnect: record the gap and keep the next frame of every user
+    logger.warning(f"⏸️ {gap.duration:.2f}s media gap in meeting {stream.meeting_uuid} ({gap.reason})")
+    frame_store.mark_gap(gap.to_dict())
+    frame_sampler.reset()
+
+def handle_media(stream, frame):
+    # Only msg_type is read up front; the frame is parsed on a worker thread
+    if frame.msg_type == 15:
+        media_pipeline.submit(stream, frame)
+
+# All signaling/media sockets run on one background event loop
+rtms_client = RTMSClient(
+    CLIENT_ID,
+    CLIENT_SECRET,
+    media_type=MEDIA_TYPE_ALL,
+    media_params={
+        "audio": {
+            "content_type": 1,
+            "sample_rate": 1,
+            "channel": 1,
+            "codec": 1,
+            "data_opt": 1,
+            "send_rate": 100
+        },
+        "video": {
+            "codec": 5, #JPG
+             # "data_opt":3, # VIDEO_SINGLE_ACTIVE_STREAM
+            "resolution": 2, #720p, use 3 for #1080p
+            "fps": 5
         }
-        ws.send(json.dumps(handshake))
-        logger.info("Sent handshake to signaling server")
-
-    def on_message(ws, message):
-        try:
-            msg = json.loads(message)
-            if msg.get("msg_type") == 2 and msg.get("status_code") == 0:
-                media_url = msg.get("media_server", {}).get("server_urls", {}).get("all")
-                if media_url:
-                    connect_to_media_ws(media_url, meeting_uuid, stream_id, ws)
-            elif msg.get("msg_type") == 12:
-                ws.send(json.dumps({
-                    "msg_type": 13,
-                    "timestamp": msg["timestamp"]
-                }))
-                logger.info("Responded to Signaling KEEP_ALIVE_REQ")
-        except Exception as e:
-            logger.error(f"Error processing signaling message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"Signaling socket error: {error}")
+    },
+    on_media=handle_media,
+    verify_tls=RTMS_VERIFY_TLS,
+    on_gap=handle_gap,
+    metrics=metrics,
+    capture=CaptureWriter(RTMS_CAPTURE) if RTMS_CAPTURE else None
+)
 
-    def on_close(ws, close_status_code, close_msg):
-        logger.info("Signaling socket closed")
-        if meeting_uuid in active_connections:
-            active_connections[meeting_uuid].pop("signaling", None)
+def get_zoom_access_token():
+    # Cached per client and refreshed in the background before it expires
+    try:
+        token = get_token_manager(CLIENT_ID, CLIENT_SECRET).get_token()
+        logger.debug("🔐 Using cached Zoom access token.")
+        return token
+    except TokenError as e:
+        logger.error(f"❌ Zoom token request failed: {e}")
+        return None
 
-    ws = websocket.WebSocketApp(server_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
-    active_connections[meeting_uuid] = {"signaling": ws}
-    threading.Thread(target=ws.run_forever, daemon=True).start()
 
-def get_zoom_access_token():
-    url = "https://zoom.us/oauth/token?grant_type=client_credentials"
-    credentials = f"{CLIENT_ID}:{CLIENT_SECRET}"
-    encoded_credentials = base64.b64encode(credentials.encode()).decode()
-    logger.debug(encoded_credentials)
-    headers = {
-        "Authorization": f"Basic {encoded_credentials}"
-    }
 
-    logger.debug("🔐 Requesting Zoom access token...")
-    response = requests.post(url, headers=headers)
+def handle_zoom_event(event, payload, event_data):
+    logger.info(f"🧠 Parsed Event: {event}")
+    logger.debug(f"📦 Payload: {payload}")
 
-    logger.debug(f"🛰️ Token request sent to: {url}")
-    logger.debug(f"📨 Response status: {response.status_code}")
-    logger.debug(f"📨 Response body: {response.text}")
+    if event == "meeting.rtms_started":
+        meeting_uuid = payload.get("meeting_uuid")
+        stream_id = payload.get("rtms_stream_id")
+        server_url = payload.get("server_urls")
+        logger.info(f"🚀 Triggering signaling WebSocket for {meeting_uuid}")
+        rtms_client.submit_stream(meeting_uuid, stream_id, server_url)
 
-    if response.status_code == 200:
-        token_data = response.json()
-        logger.info("✅ Zoom access token received.")
-        return token_data.get("access_token")
-    else:
-        logger.error(f"❌ Zoom token request failed: {response.status_code} {response.text}")
-        return None
+    elif event == "meeting.rtms_stopped":
+        meeting_uuid = payload.get("meeting_uuid")
+        logger.info(f"🛑 Closing signaling for {meeting_uuid}")
+        rtms_client.submit_stop(meeting_uuid)
+        media_pipeline.close(meeting_uuid)
 
 
+# Set once the event WebSocket consumer is running
+event_stream = None
 
 def start_zoom_event_websocket():
+    global event_stream
     logger.info("🔌 Initiating Zoom Event WebSocket connection...")
 
     base_ws_url = os.getenv("ZOOM_EVENT_WS_BASE")
     if not base_ws_url:
         logger.error("❌ Missing ZOOM_EVENT_WS_BASE in environment.")
-        return
-
-    access_token = get_zoom_access_token()
-    if not access_token:
-        logger.error("❌ Failed to obtain Zoom access token.")
-        return
-
-    full_ws_url = f"{base_ws_url}&access_token={access_token}"
-    logger.debug(f"🔗 Full WebSocket URL: {full_ws_url}")
-
-    def on_open(ws):
-        logger.info("✅ WebSocket connection established.")
-        logger.debug("🫀 Starting heartbeat thread every 30s...")
-
-        def heartbeat():
-            try:
-                initial = {"module": "heartbeat"}
-                ws.send(json.dumps(initial))
-                logger.debug(f"💓 Sent initial heartbeat: {initial}")
-            except Exception as e:
-                logger.error(f"❌ Failed to send initial heartbeat: {e}")
-                return
-
-            while True:
-                time.sleep(30)
-                try:
-                    ws.send(json.dumps({"module": "heartbeat"}))
-                    logger.debug("💓 Heartbeat sent.")
-                except Exception as e:
-                    logger.error(f"❌ Heartbeat error: {e}")
-                    break
-
-        threading.Thread(target=heartbeat, daemon=True).start()
-
-    def on_message(ws, message):
-        logger.info("📥 Received message from Zoom Event WebSocket.")
-        logger.debug(f"🔍 Raw Message:\n{message}")
-
-        try:
-            msg = json.loads(message)
-            if msg.get("module") == "message":
-                content = msg.get("content")
-                if content:
-                    event_data = json.loads(content)
-                    event = event_data.get("event")
-                    payload = event_data.get("payload", {})
-
-                    logger.info(f"🧠 Parsed Event: {event}")
-                    logger.debug(f"📦 Payload: {payload}")
-
-                    if event == "meeting.rtms_started":
-                        meeting_uuid = payload.get("meeting_uuid")
-                        stream_id = payload.get("rtms_stream_id")
-                        server_url = payload.get("server_urls")
-                        logger.info(f"🚀 Triggering signaling WebSocket for {meeting_uuid}")
-                        connect_to_signaling_ws(meeting_uuid, stream_id, server_url)
-
-                    elif event == "meeting.rtms_stopped":
-                        meeting_uuid = payload.get("meeting_uuid")
-                        if meeting_uuid in active_connections:
-                            logger.info(f"🛑 Closing signaling for {meeting_uuid}")
-                            for conn in active_connections[meeting_uuid].values():
-                                try:
-                                    conn.close()
-                                except Exception:
-                                    pass
-                            del active_connections[meeting_uuid]
-
-        except Exception as e:
-            logger.error(f"❌ Error processing message: {e}")
-
-    def on_error(ws, error):
-        logger.error(f"⚠️ WebSocket Error: {error}")
-
-    def on_close(ws, close_status_code, close_msg):
-        logger.warning(f"🔌 WebSocket closed | Code: {close_status_code}, Message: {close_msg}")
+        return None
 
-    ws = websocket.WebSocketApp(
-        full_ws_url,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close
+    # Reconnects with jittered backoff and a fresh cached token, drops replayed events
+    event_stream = ZoomEventStream(
+        base_ws_url,
+        get_zoom_access_token,
+        handle_zoom_event,
+        on_unauthorized=get_token_manager(CLIENT_ID, CLIENT_SECRET).invalidate,
+        keepalive=keepalive,
+        dead_after=EVENT_WS_DEAD_AFTER,
+        max_backoff=EVENT_WS_MAX_BACKOFF
     )
-
-    threading.Thread(target=ws.run_forever, daemon=True).start()
+    event_stream.start()
+    return event_stream
 
 def load_retry_list():
-    global retry_rooms
-    if os.path.exists(RETRY_FILE):
-        with open(RETRY_FILE, 'r') as f:
-            retry_rooms = json.load(f)
-            logger.info(f"✅ Loaded {len(retry_rooms)} rooms from retry list.")
-    else:
-        logger.info("ℹ️ No retry file found. Starting fresh.")
-
+    # Rooms saved by older versions of this sample are retried on the next sweep
+    imported = retry_queue.import_json(LEGACY_RETRY_FILE)
+    if imported:
+        logger.info(f"✅ Imported {imported} rooms from {LEGACY_RETRY_FILE}.")
+    logger.info(f"✅ Retry queue: {retry_queue.stats()}")
 
-def save_retry_list():
-    with open(RETRY_FILE, 'w') as f:
-        json.dump(retry_rooms, f, indent=2)
-        logger.info(f"💾 Saved {len(retry_rooms)} rooms to retry list.")
 
-
-def remove_room_from_retry_list(room_id):
-    global retry_rooms
-    before = len(retry_rooms)
-    retry_rooms = [room for room in retry_rooms if room['id'] != room_id]
-    after = len(retry_rooms)
-    logger.debug(f"🧹 Removed room {room_id} from retry list. ({before} -> {after})")
+def get_api_token_manager():
+    return get_token_manager(S2S_CLIENT_ID, S2S_CLIENT_SECRET, "account_credentials", ACCOUNT_ID)
 
 
 def get_zoom_api_token():
+    # Server-to-Server OAuth token, cached per account until shortly before it expires
     logger.debug("🔐 Requesting Zoom API token...")
-    credentials = f"{S2S_CLIENT_ID}:{S2S_CLIENT_SECRET}"
-    encoded = base64.b64encode(credentials.encode()).decode()
-    url = f"https://zoom.us/oauth/token?grant_type=account_credentials&account_id={ACCOUNT_ID}"
-    headers = {"Authorization": f"Basic {encoded}"}
-    res = requests.post(url, headers=headers)
-    res.raise_for_status()
-    token = res.json().get("access_token")
-    logger.info("✅ Obtained Zoom API token.")
+    token = get_api_token_manager().get_token()
+    logger.debug("✅ Obtained Zoom API token.")
     return token
 
 
-def list_zoom_rooms(token):
+# Pooled REST client for Zoom Room calls: keep-alive connections, bounded
+# concurrency, and a 429 pauses every call until Retry-After
+zoom_api = ZoomAPIClient(
+    get_zoom_api_token,
+    max_concurrency=ROOM_API_CONCURRENCY,
+    on_unauthorized=lambda: get_api_token_manager().invalidate()
+)
+# One timer thread for all scheduled room leaves; the leaves run on the API pool
+room_timers = TimerWheel(tick=0.5, executor=zoom_api.executor, name="room-timers")
+# Every page of available rooms, cached with a TTL and revalidated by ETag
+room_inventory = RoomInventory(zoom_api, status="available", ttl=ROOM_CACHE_TTL, max_stale=ROOM_CACHE_MAX_STALE,
+                               cache_path=ROOM_CACHE_FILE or None)
+
+
+def list_zoom_rooms():
     logger.debug("📡 Listing available Zoom Rooms...")
-    url = "https://api.zoom.us/v2/rooms?status=available"
-    headers = {"Authorization": f"Bearer {token}"}
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    rooms = res.json().get("rooms", [])
+    rooms = room_inventory.rooms()
     logger.info(f"🏢 Found {len(rooms)} available Zoom Rooms.")
     return rooms
 
 
-def join_zoom_room(token, room):
+def join_zoom_room(room):
     logger.debug(f"🔗 Attempting to join room: {room['name']} ({room['id']})")
-    url = f"https://api.zoom.us/v2/rooms/{room['id']}/events"
     payload = {
         "method": "zoomroom.meeting_join",
         "params": {
@@ -368,87 +298,104 @@ def join_zoom_room(token, room):
             "passcode": MEETING_PASSCODE
         }
     }
-    res = requests.patch(url, headers={
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }, json=payload)
+    res = zoom_api.request("PATCH", f"/rooms/{room['id']}/events", json=payload)
     if res.status_code == 202:
         logger.info(f"✅ Room '{room['name']}' successfully joined the meeting.")
-        remove_room_from_retry_list(room['id'])
-    else:
-        logger.warning(f"❌ Failed to join room '{room['name']}': HTTP {res.status_code}")
-        if room not in retry_rooms:
-            retry_rooms.append(room)
+        return True
+    logger.warning(f"❌ Failed to join room '{room['name']}': HTTP {res.status_code}")
+    return False
 
 
-def leave_zoom_room(token, room):
+def leave_zoom_room(room):
     logger.debug(f"🚪 Attempting to leave room: {room['name']} ({room['id']})")
-    url = f"https://api.zoom.us/v2/rooms/{room['id']}/events"
     payload = {"method": "zoomroom.meeting_leave", "params": {}}
-    res = requests.patch(url, headers={
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }, json=payload)
+    res = zoom_api.request("PATCH", f"/rooms/{room['id']}/events", json=payload)
     if res.status_code == 202:
         logger.info(f"👋 Room '{room['name']}' left the meeting.")
     else:
         logger.warning(f"⚠️ Failed to leave room '{room['name']}': HTTP {res.status_code}")
 
 
-def schedule_room_leave(token, room, delay=30):
+def schedule_room_leave(room, delay=ROOM_LEAVE_DELAY):
     logger.debug(f"🕒 Scheduling leave for room '{room['name']}' in {delay} seconds.")
-    def leave_later():
-        time.sleep(delay)
-        leave_zoom_room(token, room)
-    threading.Thread(target=leave_later, daemon=True).start()
+    return room_timers.call_later(delay, leave_zoom_room, room)
 
 
-def save_video_frame(video_data, user_id, timestamp, user_name):
-    buffer = video_data if isinstance(video_data, bytes) else base64.b64decode(video_data)
-    file_ext = 'jpg'
+def save_video_frame(frame, user_id, timestamp, user_name):
     safe_user = f"{user_name}_{user_id}".replace('/', '_').replace('\\', '_')
     user_key = safe_user
 
-    if user_key not in user_frame_counters:
-        logger.debug(f"🆕 Initializing frame counter for {user_key}")
-        user_frame_counters[user_key] = 0
-    user_frame_counters[user_key] += 1
-
-    if user_frame_counters[user_key] <= 3:
-        logger.info(f"⏭️ Skipping early frame #{user_frame_counters[user_key]} for {user_key}")
+    payload = frame.payload
+    if not payload:
+        logger.debug("⏭️ Skipping video frame without data for %s", user_key)
         return
 
-    folder = Path("recordings") / user_key
-    folder.mkdir(parents=True, exist_ok=True)
-    files = sorted(folder.glob(f"*.{file_ext}"), key=os.path.getmtime)
+    with user_frame_counters_lock:
+        if user_key not in user_frame_counters:
+            logger.debug("🆕 Initializing frame counter for %s", user_key)
+            user_frame_counters[user_key] = 0
+        user_frame_counters[user_key] += 1
+        count = user_frame_counters[user_key]
 
-    if len(files) >= MAX_FILES_PER_USER:
-        oldest = files[0]
-        oldest.unlink()
-        logger.info(f"🗑️ Deleted oldest frame for {user_key}: {oldest.name}")
+    if count <= 3:
+        logger.info("⏭️ Skipping early frame #%d for %s", count, user_key)
+        return
+
+    if not frame_sampler.due(user_key):
+        return
 
-    filename = f"{timestamp}.{file_ext}"
-    path = folder / filename
-    with open(path, 'wb') as f:
-        f.write(buffer)
-    logger.info(f"💾 Saved frame for {user_key} to {path}")
+    frame_sampler.submit(user_key, timestamp, payload)
+    logger.debug("📝 Queued frame for %s", user_key)
+
+
+@app.route('/stats', methods=['GET'])
+def media_stats():
+    # Queue depth and drop counters per meeting/msg_type
+    return jsonify({
+        "totals": media_pipeline.totals(),
+        "streams": rtms_client.stream_stats(),
+        "connections": rtms_client.streams.counts(),
+        "queues": media_pipeline.stats(),
+        "sampler": frame_sampler.stats(),
+        "frame_store": frame_store.stats(),
+        "zoom_api": zoom_api.stats(),
+        "room_timers": room_timers.stats(),
+        "room_inventory": room_inventory.stats(),
+        "retry_queue": retry_queue.stats(),
+        "keepalive": keepalive.stats(),
+        "event_stream": event_stream.stats() if event_stream else None
+    })
 
 
 def run_zoom_room_joiner():
     logger.info("🚀 Starting Zoom Room join orchestration...")
     load_retry_list()
-    token = get_zoom_api_token()
-    available_rooms = list_zoom_rooms(token)
-    room_map = {r['id']: r for r in available_rooms + retry_rooms}
-    unique_rooms = list(room_map.values())
-    logger.info(f"🔁 Attempting to join {len(unique_rooms)} total rooms (including retries).")
-
-    for room in unique_rooms:
-        join_zoom_room(token, room)
-        schedule_room_leave(token, room)
-
-    save_retry_list()
-    logger.info("✅ Zoom Room join orchestration complete.")
+    available_rooms = list_zoom_rooms()
+    # Failed rooms come back once their backoff has passed, even if they are listed as available
+    retry_stats = retry_queue.stats()
+    unique_rooms = retry_queue.select(available_rooms)
+    logger.info(f"🔁 Attempting to join {len(unique_rooms)} total rooms "
+                f"({retry_stats['due']} retries due, {retry_stats['queued'] - retry_stats['due']} in backoff).")
+
+    # Joins run concurrently on the API pool; results are applied here, one at a time
+    joins = [(room, zoom_api.executor.submit(join_zoom_room, room)) for room in unique_rooms]
+    for room, future in joins:
+        try:
+            joined = future.result()
+            error = None
+        except Exception as e:
+            logger.warning(f"❌ Failed to join room '{room['name']}': {e}")
+            joined, error = False, e
+        if joined:
+            retry_queue.remove(room['id'])
+        else:
+            next_attempt = retry_queue.record_failure(room['id'], room, error)
+            if next_attempt:
+                logger.debug(f"🔁 Room '{room['name']}' will be retried in {next_attempt - time.time():.0f}s")
+        schedule_room_leave(room)
+
+    retry_queue.compact()
+    logger.info(f"✅ Zoom Room join orchestration complete. API: {zoom_api.stats()}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,307 @@
+"""End-to-end throughput and latency of every Python sample against the RTMS simulator.
+
+Each entry point is started as its own process with throwaway credentials
+and a scratch working directory, then driven by `RTMSSimulator` at every
+meeting count of the sweep. Once all meetings are streaming, a measurement
+window records:
+
+- packets/sec the sample received (from its `/metrics`) and the simulator sent
+- CPU per stream (% of one core) and RSS per stream over the idle baseline,
+  for the sample's whole process tree
+- webhook (or event) to first media packet latency
+- keep-alive RTT (simulator KEEP_ALIVE_REQ 12 -> RESP 13)
+
+Results are written as JSON. CPU and RSS come from psutil when it is
+installed, otherwise from /proc (Linux only).
+
+    python benchmarks/bench_e2e.py [--meetings 10,100,500] [--entry-points save_audio,print_audio] \\
+        [--measure 20] [--output bench_e2e.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python_common"))
+from rtms_common.simulator import RTMSSimulator
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CLIENT_ID = "benchmark-client-id"
+CLIENT_SECRET = "benchmark-client-secret"
+
+# name -> script, how events reach it, fixed port (None = any free port)
+ENTRY_POINTS = {
+    "working_python": ("boilerplate/working_python/index.py", "webhook", None),
+    "working_python_wss": ("boilerplate/working_python_wss/index.py", "websocket", None),
+    "save_audio": ("audio/save_audio_python/save_incoming_audio.py", "webhook", None),
+    "print_audio": ("audio/print_audio_python/print_incoming_audio.py", "webhook", None),
+    "print_transcripts": ("transcript/print_incoming_transcripts_python/print_transcripts.py", "webhook", None),
+    # rtms.py always listens on port 3000
+    "manual_start_stop_rtms": ("rtms_api/python_manual_start_stop_rtms/rtms.py", "webhook", 3000),
+}
+
+MEDIA_MSG_TYPES = {"5", "14", "15", "16", "17"}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+# ---- process tree usage (psutil, or /proc)
+
+def _proc_children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after its ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _proc_usage(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+
+def tree_usage(pid):
+    """CPU seconds (user + system) and RSS bytes of `pid` and all its descendants."""
+    if psutil is not None:
+        try:
+            parent = psutil.Process(pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0.0, 0
+        cpu = rss = 0
+        for process in processes:
+            try:
+                times = process.cpu_times()
+                cpu += times.user + times.system
+                rss += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return cpu, rss
+
+    cpu = rss = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            process_cpu, process_rss = _proc_usage(current)
+        except OSError:
+            continue
+        cpu += process_cpu
+        rss += process_rss
+        pending.extend(_proc_children(current))
+    return cpu, rss
+
+
+def received_media_packets(port):
+    """Media messages the sample has received so far, summed from its `rtms_messages_total`."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    total = 0
+    for line in text.splitlines():
+        if line.startswith("rtms_messages_total{"):
+            labels, value = line.rsplit(" ", 1)
+            if labels.split('msg_type="', 1)[1].split('"', 1)[0] in MEDIA_MSG_TYPES:
+                total += float(value)
+    return total
+
+
+# ---- one run
+
+def launch(name, port, sim_port, workdir):
+    script = ENTRY_POINTS[name][0]
+    token_cache = workdir / "tokens.json"
+    # A cached token keeps working_python_wss from calling zoom.us
+    token_cache.write_text(json.dumps({f"client_credentials::{CLIENT_ID}": {
+        "access_token": "benchmark-token", "expires_at": time.time() + 86400
+    }}))
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEBHOOK_PATH="/webhook",
+        LOG_LEVEL="WARNING",
+        ZM_CLIENT_ID=CLIENT_ID,
+        ZM_CLIENT_SECRET=CLIENT_SECRET,
+        ZOOM_CLIENT_ID=CLIENT_ID,
+        ZOOM_CLIENT_SECRET=CLIENT_SECRET,
+        ZOOM_SECRET_TOKEN="benchmark-secret-token",
+        ZOOM_TOKEN_CACHE=str(token_cache),
+        ZOOM_EVENT_WS_BASE=f"ws://127.0.0.1:{sim_port}/events?subscriptionId=benchmark",
+        PYTHONUNBUFFERED="1",
+    )
+    log = open(workdir / "sample.log", "wb")
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / script)], cwd=workdir, env=env,
+        stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    return process, log
+
+
+def stop(process, log):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+    log.close()
+
+
+async def run_once(name, meetings, args, workdir):
+    _, delivery, fixed_port = ENTRY_POINTS[name]
+    port = fixed_port or free_port()
+    simulator = RTMSSimulator(
+        port=0, webhook_url=f"http://127.0.0.1:{port}/webhook", meetings=meetings, duration=None,
+        ramp=args.ramp, audio_rate=args.audio_rate, audio_bytes=args.audio_bytes,
+        video_rate=args.video_rate, video_bytes=args.video_bytes, transcript_rate=args.transcript_rate,
+        keepalive_interval=args.keepalive_interval, event_websocket=delivery == "websocket")
+    await simulator.start()
+    process, log = launch(name, port, simulator.port, workdir)
+    loop = asyncio.get_running_loop()
+    result = {"entry_point": name, "meetings": meetings}
+    try:
+        if not await loop.run_in_executor(None, wait_for_port, port, args.startup_timeout):
+            result["error"] = f"sample did not listen on port {port}"
+            return result
+        if delivery == "websocket":
+            await asyncio.wait_for(simulator.event_client_connected.wait(), args.startup_timeout)
+        await asyncio.sleep(1.0)
+        _, baseline_rss = tree_usage(process.pid)
+
+        meetings_task = asyncio.create_task(simulator.run())
+        # Wait until every meeting streams, then let the rates settle
+        deadline = loop.time() + meetings / args.ramp + args.startup_timeout
+        while simulator.stats()["streaming"] < meetings and loop.time() < deadline:
+            await asyncio.sleep(0.2)
+        await asyncio.sleep(args.warmup)
+
+        cpu_start, _ = tree_usage(process.pid)
+        sent_start = simulator.stats()["frames_sent"]
+        received_start = await loop.run_in_executor(None, received_media_packets, port)
+        window_start = time.perf_counter()
+        peak_rss = 0
+        while time.perf_counter() - window_start < args.measure:
+            await asyncio.sleep(0.5)
+            peak_rss = max(peak_rss, tree_usage(process.pid)[1])
+        elapsed = time.perf_counter() - window_start
+        cpu_end, _ = tree_usage(process.pid)
+        sent_end = simulator.stats()["frames_sent"]
+        received_end = await loop.run_in_executor(None, received_media_packets, port)
+
+        simulator.end_meetings()
+        await meetings_task
+        stats = simulator.stats()
+        streaming = stats["streaming"]
+        result.update({
+            "streams": streaming,
+            "packets_per_sec_sent": round((sent_end - sent_start) / elapsed, 1),
+            "packets_per_sec_received": (
+                round((received_end - received_start) / elapsed, 1)
+                if received_start is not None and received_end is not None else None),
+            "cpu_percent": round((cpu_end - cpu_start) / elapsed * 100, 2),
+            "cpu_percent_per_stream": round((cpu_end - cpu_start) / elapsed * 100 / streaming, 4) if streaming else None,
+            "rss_baseline_mb": round(baseline_rss / 2**20, 1),
+            "rss_peak_mb": round(peak_rss / 2**20, 1),
+            "rss_kb_per_stream": round((peak_rss - baseline_rss) / 1024 / streaming, 1) if streaming else None,
+            "webhook_to_first_packet": stats["webhook_to_first_frame"],
+            "keepalive_rtt": stats["keepalive_rtt"],
+            "webhook_errors": stats["webhook_errors"],
+        })
+        return result
+    finally:
+        simulator.end_meetings()
+        await loop.run_in_executor(None, stop, process, log)
+        await simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS),
+                        help=f"comma-separated subset of: {', '.join(ENTRY_POINTS)}")
+    parser.add_argument("--meetings", default="10,50,100", help="comma-separated concurrent meeting counts")
+    parser.add_argument("--ramp", type=float, default=100.0, help="meetings started per second")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds after the ramp before measuring")
+    parser.add_argument("--measure", type=float, default=15.0, help="seconds in the measurement window")
+    parser.add_argument("--audio-rate", type=float, default=50.0)
+    parser.add_argument("--audio-bytes", type=int, default=640)
+    parser.add_argument("--video-rate", type=float, default=0.0)
+    parser.add_argument("--video-bytes", type=int, default=20000)
+    parser.add_argument("--transcript-rate", type=float, default=1.0)
+    parser.add_argument("--keepalive-interval", type=float, default=2.0)
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", default="bench_e2e.json")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.entry_points.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry point(s): {', '.join(unknown)}")
+    counts = [int(count) for count in args.meetings.split(",")]
+
+    results = []
+    for name in names:
+        for meetings in counts:
+            with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+                result = asyncio.run(run_once(name, meetings, args, Path(workdir)))
+            results.append(result)
+            print(json.dumps(result))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "usage_source": "psutil" if psutil is not None else "/proc",
+        },
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
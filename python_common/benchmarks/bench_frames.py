@@ -0,0 +1,81 @@
+"""Micro-benchmark: per-frame decode cost of the media-frame fast path.
+
+Compares the path the samples used before (`json.loads` + `base64.b64decode`
+of `content.data`) with `rtms_common.frames.decode_media_frame`.
+
+    python benchmarks/bench_frames.py [--iterations 20000]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rtms_common.frames import JSON_BACKEND, b64decode, decode_media_frame
+
+
+def make_frame(msg_type, payload_size):
+    return json.dumps({
+        "msg_type": msg_type,
+        "content": {
+            "user_id": 16778240,
+            "user_name": "Work Room",
+            "data": base64.b64encode(os.urandom(payload_size)).decode(),
+            "timestamp": 1750742052108
+        }
+    })
+
+
+def baseline(raw):
+    msg = json.loads(raw)
+    if msg["msg_type"] in (14, 15):
+        return msg["content"]["user_id"], base64.b64decode(msg["content"]["data"])
+    return None
+
+
+def fast_path(raw):
+    frame = decode_media_frame(raw)
+    if frame.msg_type in (14, 15):
+        return frame.content["user_id"], frame.payload
+    return None
+
+
+def baseline_route(raw):
+    # What the boilerplate on_message does: parse, then branch on msg_type
+    return json.loads(raw).get("msg_type")
+
+
+def fast_route(raw):
+    return decode_media_frame(raw).msg_type
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = [
+        ("keep-alive (msg_type 12)", json.dumps({"msg_type": 12, "timestamp": 1750742052108})),
+        ("audio 20ms L16 (640 B)", make_frame(14, 640)),
+        ("video 720p JPEG (~60 KB)", make_frame(15, 60 * 1024)),
+    ]
+
+    print(f"JSON backend: {JSON_BACKEND}, base64: {b64decode.__module__}, iterations: {args.iterations}")
+    for title, slow, fast in (
+        ("decode metadata + payload", baseline, fast_path),
+        ("route by msg_type only", baseline_route, fast_route),
+    ):
+        print(f"\n{title}")
+        print(f"{'frame':<28}{'baseline us':>14}{'fast path us':>14}{'speedup':>10}")
+        for name, raw in cases:
+            assert slow(raw) == fast(raw)
+            iterations = args.iterations if len(raw) < 10000 else max(args.iterations // 20, 1)
+            slow_us = timeit.timeit(lambda: slow(raw), number=iterations) / iterations * 1e6
+            fast_us = timeit.timeit(lambda: fast(raw), number=iterations) / iterations * 1e6
+            print(f"{name:<28}{slow_us:>14.2f}{fast_us:>14.2f}{slow_us / fast_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
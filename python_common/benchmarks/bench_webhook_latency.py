@@ -0,0 +1,95 @@
+"""Measure webhook latency of rtms.py under concurrent `meeting.rtms_started` bursts.
+
+Every webhook points its stream at a local TCP server that accepts the
+connection and never answers, so each stream stays "connecting" for the whole
+run, the way a live stream would occupy its runner. The webhook must still
+return immediately.
+
+    python benchmarks/bench_webhook_latency.py [--requests 2000] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "rtms_api" / "python_manual_start_stop_rtms"))
+os.environ.setdefault("ZOOM_CLIENT_ID", "benchmark-client-id")
+os.environ.setdefault("ZOOM_CLIENT_SECRET", "benchmark-client-secret")
+
+
+def start_silent_server():
+    """Start a TCP server that accepts connections and never replies; returns its port."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    holder = {}
+
+    async def hold(reader, writer):
+        await reader.read()
+
+    async def serve():
+        server = await asyncio.start_server(hold, "127.0.0.1", 0)
+        holder["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        await server.serve_forever()
+
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+    ready.wait()
+    return holder["port"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    import rtms
+    rtms.print = lambda *a, **k: None
+
+    port = start_silent_server()
+    server_url = f"ws://127.0.0.1:{port}/signaling"
+    app = rtms.app
+
+    def post(i):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post("/webhook", json={
+            "event": "meeting.rtms_started",
+            "payload": {
+                "meeting_uuid": f"bench-meeting-{i}",
+                "rtms_stream_id": f"bench-stream-{i}",
+                "server_urls": server_url
+            }
+        })
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, response.status_code
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(post, range(args.requests)))
+    wall = time.perf_counter() - wall_started
+
+    latencies = [ms for ms, status in results]
+    errors = sum(1 for ms, status in results if status != 200)
+    time.sleep(0.5)
+    print(f"requests: {args.requests}, concurrency: {args.concurrency}, errors: {errors}, wall: {wall:.2f}s")
+    print(f"webhook latency ms  p50={statistics.median(latencies):.2f}  "
+          f"p95={percentile(latencies, 95):.2f}  p99={percentile(latencies, 99):.2f}  max={max(latencies):.2f}")
+    print(f"session runner: {rtms.session_runner.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared helpers for the Python RTMS samples."""
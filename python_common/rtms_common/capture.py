@@ -0,0 +1,466 @@
+"""Record RTMS sessions to a binary log and replay them through the same handlers.
+
+A production problem usually depends on the exact sequence and timing of
+the frames `on_media` saw, which logs do not keep. `CaptureWriter` records
+every signaling and media frame an `RTMSClient` receives, with its receive
+time, and `CaptureReplayer` feeds a capture back into a client's
+`on_media` / `on_signaling` callbacks at real-time, N× or maximum speed,
+for reproducing bugs, regression-testing throughput and profiling the
+handlers on real traffic shapes:
+
+    capture = CaptureWriter("session.rtmscap.zst")      # .zst: zstd blocks
+    rtms_client = RTMSClient(..., capture=capture)
+
+    stats = asyncio.run(CaptureReplayer.for_client("session.rtmscap.zst", rtms_client, speed=10).run())
+
+    python -m rtms_common.capture info session.rtmscap.zst
+    python -m rtms_common.capture replay session.rtmscap.zst \\
+        --sample ../audio/save_audio_python/save_incoming_audio.py --speed 0
+
+File layout (little-endian):
+
+    header   "RTMSCAP\\x01", flags (bit 0: zstd), created_ns
+    block    stored_len, raw_len, record_count, first_ts_ns, then stored_len bytes
+    ...        (raw block = records: ts_ns, channel, kind, len(meeting_uuid),
+               len(stream_id), len(payload), then those three fields' bytes)
+    index    per block: file offset, first_ts_ns, last_ts_ns, record_count
+    footer   index offset, block count, "RTMSIDX\\x01"
+
+Records are buffered into blocks of about `block_size` bytes (or every
+`flush_interval` seconds) and compressed and written on a background
+thread, so recording costs the event loop one buffer append per frame.
+The index is written on `close()`; a capture cut short by a crash has no
+index and is read by scanning its blocks. zstd needs `pip install zstandard`.
+"""
+import argparse
+import asyncio
+import atexit
+import importlib.util
+import inspect
+import json
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from .client import STATE_STREAMING, RTMSStream
+from .frames import MediaFrame, decode_media_frame
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RTMSCAP\x01"
+INDEX_MAGIC = b"RTMSIDX\x01"
+FLAG_ZSTD = 1
+
+HEADER = struct.Struct("<8sBq")
+BLOCK = struct.Struct("<IIIq")
+RECORD = struct.Struct("<qBBHHI")
+INDEX_ENTRY = struct.Struct("<QqqI")
+FOOTER = struct.Struct("<QI8s")
+
+CHANNEL_SIGNALING = 0
+CHANNEL_MEDIA = 1
+_CHANNELS = {"signaling": CHANNEL_SIGNALING, "media": CHANNEL_MEDIA}
+_CHANNEL_NAMES = {value: name for name, value in _CHANNELS.items()}
+
+KIND_TEXT = 0
+KIND_BINARY = 1
+
+CaptureRecord = namedtuple("CaptureRecord", "timestamp_ns channel meeting_uuid stream_id payload")
+BlockInfo = namedtuple("BlockInfo", "offset first_ts_ns last_ts_ns count")
+
+
+class CaptureError(Exception):
+    """Raised for files that are not RTMS captures, or when zstd is needed but not installed."""
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise CaptureError("zstd-compressed captures need the zstandard package (pip install zstandard)")
+
+
+class CaptureWriter:
+    """Append received frames to a capture file, safe to call from any thread.
+
+    `compress` is "zstd" or None; by default it is "zstd" when `path` ends
+    in ".zst".
+    """
+
+    def __init__(self, path, compress="auto", block_size=256 * 1024, flush_interval=1.0, level=3):
+        if compress == "auto":
+            compress = "zstd" if str(path).endswith(".zst") else None
+        if compress not in (None, "zstd"):
+            raise ValueError(f"Unsupported capture compression: {compress}")
+        if compress == "zstd":
+            _require_zstd()
+        self.path = path
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.bytes_written = 0
+        self.closed = False
+
+        self._compressor = zstandard.ZstdCompressor(level=level) if compress else None
+        # Opened with the first block, so a process that never receives a frame
+        # (e.g. the Flask reloader's parent) leaves no file behind
+        self._file = None
+        self._index = []
+        self._buffer = bytearray()
+        self._count = 0
+        self._first_ts = None
+        self._last_ts = None
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        # One thread, so blocks reach the file in order; a plain thread because
+        # executors refuse work once the interpreter starts exiting
+        self._blocks = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_blocks, name="rtms-capture", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, meeting_uuid, stream_id, channel, message, timestamp_ns=None):
+        """Record one received message (str or bytes) on `channel` ("signaling" or "media")."""
+        timestamp_ns = timestamp_ns or time.time_ns()
+        if isinstance(message, str):
+            payload, kind = message.encode(), KIND_TEXT
+        else:
+            payload, kind = bytes(message), KIND_BINARY
+        meeting = (meeting_uuid or "").encode()
+        stream = (stream_id or "").encode()
+        with self._lock:
+            if self.closed:
+                return
+            self._buffer += RECORD.pack(
+                timestamp_ns, _CHANNELS[channel], kind, len(meeting), len(stream), len(payload))
+            self._buffer += meeting
+            self._buffer += stream
+            self._buffer += payload
+            if self._first_ts is None:
+                self._first_ts = timestamp_ns
+            self._last_ts = timestamp_ns
+            self._count += 1
+            self.records += 1
+            if (len(self._buffer) >= self.block_size
+                    or time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._flush_locked()
+
+    def flush(self):
+        """Hand buffered records to the writer thread as a block."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._flushed_at = time.monotonic()
+        if not self._count:
+            return
+        block = (bytes(self._buffer), self._count, self._first_ts, self._last_ts)
+        self._buffer = bytearray()
+        self._count = 0
+        self._first_ts = self._last_ts = None
+        self._blocks.put(block)
+
+    def _write_blocks(self):
+        while True:
+            block = self._blocks.get()
+            if block is None:
+                return
+            try:
+                self._write_block(*block)
+            except Exception as e:
+                logger.error(f"Failed to write capture block to {self.path}: {e}")
+
+    def _write_block(self, raw, count, first_ts, last_ts):
+        if self._file is None:
+            self._file = open(self.path, "wb")
+            self._file.write(HEADER.pack(MAGIC, FLAG_ZSTD if self._compressor else 0, time.time_ns()))
+        stored = self._compressor.compress(raw) if self._compressor else raw
+        offset = self._file.tell()
+        self._file.write(BLOCK.pack(len(stored), len(raw), count, first_ts))
+        self._file.write(stored)
+        # Complete blocks survive a crash; only the index would be missing
+        self._file.flush()
+        self._index.append(BlockInfo(offset, first_ts, last_ts, count))
+        self.bytes_written += BLOCK.size + len(stored)
+
+    def close(self):
+        """Write the remaining records and the index; later records are ignored."""
+        with self._lock:
+            if self.closed:
+                return
+            self._flush_locked()
+            self.closed = True
+        self._blocks.put(None)
+        self._writer.join()
+        atexit.unregister(self.close)
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.write(FOOTER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+        logger.info(f"Capture {self.path} closed: {self.records} records in {len(self._index)} blocks")
+
+    def stats(self):
+        with self._lock:
+            return {"path": str(self.path), "records": self.records, "blocks": len(self._index),
+                    "bytes_written": self.bytes_written, "closed": self.closed}
+
+
+class CaptureReader:
+    """Read a capture file's blocks and records, using its index when it has one."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise CaptureError(f"{path} is not an RTMS capture")
+            magic, flags, created_ns = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise CaptureError(f"{path} is not an RTMS capture")
+            self.compressed = bool(flags & FLAG_ZSTD)
+            self.created_ns = created_ns
+            if self.compressed:
+                _require_zstd()
+            self.indexed, self.blocks = self._read_index(f)
+
+    def _read_index(self, f):
+        size = f.seek(0, os.SEEK_END)
+        if size >= HEADER.size + FOOTER.size:
+            f.seek(size - FOOTER.size)
+            index_offset, count, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic == INDEX_MAGIC:
+                f.seek(index_offset)
+                data = f.read(count * INDEX_ENTRY.size)
+                return True, [BlockInfo(*INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size)) for i in range(count)]
+        return False, self._scan(f, size)
+
+    def _scan(self, f, size):
+        # No index (the writer did not close): walk the blocks, keeping the complete ones
+        blocks = []
+        offset = HEADER.size
+        while offset + BLOCK.size <= size:
+            f.seek(offset)
+            stored_len, raw_len, count, first_ts = BLOCK.unpack(f.read(BLOCK.size))
+            if offset + BLOCK.size + stored_len > size:
+                logger.warning(f"Ignoring truncated block at offset {offset} of {self.path}")
+                break
+            last_ts = first_ts
+            if count:
+                raw = self._decompress(f.read(stored_len), raw_len)
+                last_ts = list(self._parse(raw))[-1].timestamp_ns
+            blocks.append(BlockInfo(offset, first_ts, last_ts, count))
+            offset += BLOCK.size + stored_len
+        return blocks
+
+    def _decompress(self, stored, raw_len):
+        if not self.compressed:
+            return stored
+        return zstandard.ZstdDecompressor().decompress(stored, max_output_size=raw_len)
+
+    @staticmethod
+    def _parse(raw):
+        view = memoryview(raw)
+        offset = 0
+        while offset < len(raw):
+            timestamp_ns, channel, kind, meeting_len, stream_len, payload_len = RECORD.unpack_from(raw, offset)
+            offset += RECORD.size
+            meeting_uuid = bytes(view[offset:offset + meeting_len]).decode()
+            offset += meeting_len
+            stream_id = bytes(view[offset:offset + stream_len]).decode()
+            offset += stream_len
+            payload = bytes(view[offset:offset + payload_len])
+            offset += payload_len
+            if kind == KIND_TEXT:
+                payload = payload.decode()
+            yield CaptureRecord(timestamp_ns, _CHANNEL_NAMES[channel], meeting_uuid, stream_id, payload)
+
+    def records(self, start_ns=None, end_ns=None, meetings=None):
+        """Yield records in receive order, optionally limited to a time range and a set of meetings."""
+        with open(self.path, "rb") as f:
+            for block in self.blocks:
+                if start_ns is not None and block.last_ts_ns < start_ns:
+                    continue
+                if end_ns is not None and block.first_ts_ns > end_ns:
+                    break
+                f.seek(block.offset)
+                stored_len, raw_len, _, _ = BLOCK.unpack(f.read(BLOCK.size))
+                for record in self._parse(self._decompress(f.read(stored_len), raw_len)):
+                    if start_ns is not None and record.timestamp_ns < start_ns:
+                        continue
+                    if end_ns is not None and record.timestamp_ns > end_ns:
+                        return
+                    if meetings is None or record.meeting_uuid in meetings:
+                        yield record
+
+    def info(self):
+        """Size, time span, and record counts per meeting and msg_type."""
+        meetings = {}
+        msg_types = {}
+        for record in self.records():
+            meetings[record.meeting_uuid] = meetings.get(record.meeting_uuid, 0) + 1
+            msg_type = str(_decode(record.payload).msg_type)
+            msg_types[msg_type] = msg_types.get(msg_type, 0) + 1
+        first = self.blocks[0].first_ts_ns if self.blocks else None
+        last = self.blocks[-1].last_ts_ns if self.blocks else None
+        return {
+            "path": str(self.path),
+            "compressed": self.compressed,
+            "indexed": self.indexed,
+            "file_bytes": os.path.getsize(self.path),
+            "blocks": len(self.blocks),
+            "records": sum(block.count for block in self.blocks),
+            "duration_s": round((last - first) / 1e9, 3) if first is not None else 0.0,
+            "meetings": meetings,
+            "msg_types": msg_types
+        }
+
+
+def _decode(message):
+    try:
+        return decode_media_frame(message)
+    except ValueError:
+        return MediaFrame(message, None)
+
+
+class CaptureReplayer:
+    """Feed a capture to `on_media` / `on_signaling` with the original pacing scaled by `speed`.
+
+    `speed` 1.0 replays in real time, 10 ten times faster, and 0 as fast as
+    the handlers allow. Each meeting gets its own `RTMSStream` in the
+    STREAMING state; sockets are None, so handlers that reply to the server
+    must tolerate that. With `metrics`, frames and decode times are recorded
+    as they would be live.
+    """
+
+    def __init__(self, path, on_media=None, on_signaling=None, speed=1.0, metrics=None, meetings=None):
+        self.reader = path if isinstance(path, CaptureReader) else CaptureReader(path)
+        self.on_media = on_media
+        self.on_signaling = on_signaling
+        self.speed = speed
+        self.metrics = metrics
+        self.meetings = meetings
+        self.streams = {}
+        self.replayed = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self.elapsed = 0.0
+        self.handler_seconds = {}
+        self.decode_seconds = 0.0
+
+    @classmethod
+    def for_client(cls, path, client, **kwargs):
+        """Replay into the callbacks (and metrics) a sample configured on its `RTMSClient`."""
+        kwargs.setdefault("metrics", client.metrics)
+        return cls(path, client.on_media, client.on_signaling, **kwargs)
+
+    def _stream(self, record):
+        stream = self.streams.get(record.meeting_uuid)
+        if stream is None:
+            stream = self.streams[record.meeting_uuid] = RTMSStream(record.meeting_uuid, record.stream_id, None)
+            stream.set_state(STATE_STREAMING)
+        return stream
+
+    async def run(self):
+        """Replay the whole capture; returns `stats()`."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first_ts = None
+        for record in self.reader.records(meetings=self.meetings):
+            if first_ts is None:
+                first_ts = record.timestamp_ns
+            if self.speed:
+                due = started + (record.timestamp_ns - first_ts) / 1e9 / self.speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+            await self._replay(record)
+        self.elapsed = loop.time() - started
+        return self.stats()
+
+    async def _replay(self, record):
+        stream = self._stream(record)
+        start = time.perf_counter()
+        frame = _decode(record.payload)
+        decoded = time.perf_counter()
+        self.decode_seconds += decoded - start
+        if self.metrics is not None:
+            self.metrics.record_frame(stream.meeting_uuid, frame, decoded - start)
+        callback = self.on_media if record.channel == "media" else self.on_signaling
+        if callback is not None:
+            try:
+                result = callback(stream, frame)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in RTMS callback for meeting {stream.meeting_uuid} during replay: {e}")
+            key = str(frame.msg_type)
+            self.handler_seconds[key] = self.handler_seconds.get(key, 0.0) + time.perf_counter() - decoded
+        self.replayed += 1
+
+    def stats(self):
+        elapsed = self.elapsed
+        return {
+            "records": self.replayed,
+            "meetings": len(self.streams),
+            "errors": self.errors,
+            "speed": self.speed,
+            "elapsed_s": round(elapsed, 3),
+            "records_per_sec": round(self.replayed / elapsed, 1) if elapsed else None,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "decode_s": round(self.decode_seconds, 6),
+            "handler_s": {key: round(value, 6) for key, value in self.handler_seconds.items()}
+        }
+
+
+def _load_sample(path, attribute):
+    """Import a sample script (without running its server) and return its RTMS client."""
+    directory = os.path.dirname(os.path.abspath(path))
+    sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location("rtms_capture_sample", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    client = getattr(module, attribute, None)
+    if client is None:
+        raise SystemExit(f"{path} has no module-level {attribute!r}")
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay an RTMS capture.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="print the capture's size, span and record counts")
+    info.add_argument("path")
+    replay = commands.add_parser("replay", help="feed the capture to a sample's handlers")
+    replay.add_argument("path")
+    replay.add_argument("--sample", required=True, help="sample script whose RTMS client handlers receive the frames")
+    replay.add_argument("--client", default="rtms_client", help="name of the sample's RTMSClient (default: rtms_client)")
+    replay.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = max speed")
+    replay.add_argument("--meeting", action="append", help="only replay these meeting UUIDs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "info":
+        print(json.dumps(CaptureReader(args.path).info(), indent=2))
+        return
+    client = _load_sample(args.sample, args.client)
+    replayer = CaptureReplayer.for_client(
+        args.path, client, speed=args.speed, meetings=set(args.meeting) if args.meeting else None)
+    print(json.dumps(asyncio.run(replayer.run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,597 @@
+"""Asyncio RTMS client shared by the Python samples.
+
+`RTMSClient` implements the signaling/media handshake once:
+
+1. connect to the signaling server and send SIGNALING_HAND_SHAKE_REQ (1)
+2. on SIGNALING_HAND_SHAKE_RESP (2), connect to the media server and send
+   DATA_HAND_SHAKE_REQ (3)
+3. on DATA_HAND_SHAKE_RESP (4), send CLIENT_READY_ACK (7) on signaling
+4. answer KEEP_ALIVE_REQ (12) with KEEP_ALIVE_RESP (13) on both sockets
+
+Each stream moves through CONNECTING -> HANDSHAKING -> READY -> STREAMING.
+If either socket drops before the stream is stopped, the stream goes to
+RECOVERING and reconnects through a fresh signaling handshake (the media
+URL can change between sessions). The time without media is measured and
+passed to `on_gap` before the first frame after the gap, so sinks can mark
+or fill it instead of silently losing that part of the meeting.
+
+Sockets are opened through the process-wide `rtms_common.connect.Connector`
+(one verifying TLS context with session resumption, cached DNS). Each stream
+keeps the time of every setup phase, from the webhook to its first media
+packet, in `stream.setup`.
+
+Every stream is a pair of coroutines on one event loop, so a single process
+can hold thousands of concurrent meetings. Samples only supply callbacks for
+the frames they care about. Async apps (FastAPI) call `start_stream` and
+`stop_stream` on their own loop; threaded apps (Flask) use `submit_stream`
+and `submit_stop`, which run the client on a background event-loop thread.
+"""
+import asyncio
+import hashlib
+import hmac
+import inspect
+import logging
+import random
+import threading
+import time
+
+import websockets
+
+from .connect import default_connector
+from .frames import MediaFrame, decode_media_frame, json_dumps
+from .keepalive import default_keepalive
+from .registry import ActiveConnectionRegistry
+
+logger = logging.getLogger(__name__)
+
+# Message types
+SIGNALING_HAND_SHAKE_REQ = 1
+SIGNALING_HAND_SHAKE_RESP = 2
+DATA_HAND_SHAKE_REQ = 3
+DATA_HAND_SHAKE_RESP = 4
+CLIENT_READY_ACK = 7
+KEEP_ALIVE_REQ = 12
+KEEP_ALIVE_RESP = 13
+
+# Media types for the DATA_HAND_SHAKE_REQ
+MEDIA_TYPE_AUDIO = 1
+MEDIA_TYPE_VIDEO = 2
+MEDIA_TYPE_DESKSHARE = 4
+MEDIA_TYPE_TRANSCRIPT = 8
+MEDIA_TYPE_CHAT = 16
+MEDIA_TYPE_ALL = 32
+
+# Stream states
+STATE_CONNECTING = "connecting"
+STATE_HANDSHAKING = "handshaking"
+STATE_READY = "ready"
+STATE_STREAMING = "streaming"
+STATE_RECOVERING = "recovering"
+STATE_CLOSED = "closed"
+
+# Media-socket messages that are protocol, not media
+_MEDIA_CONTROL_TYPES = (DATA_HAND_SHAKE_RESP, KEEP_ALIVE_REQ)
+# Messages the client itself reads, on either socket
+_CONTROL_TYPES = (SIGNALING_HAND_SHAKE_RESP, DATA_HAND_SHAKE_RESP, KEEP_ALIVE_REQ)
+
+
+def generate_signature(client_id, meeting_uuid, stream_id, client_secret):
+    """HMAC-SHA256 signature used by both handshakes."""
+    message = f"{client_id},{meeting_uuid},{stream_id}"
+    return hmac.new(client_secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+class StreamGap:
+    """A stretch of a stream without media, reported when media resumes.
+
+    `duration` is measured on the local clock from the moment a socket was
+    lost; `last_timestamp` and `resume_timestamp` are the media timestamps
+    of the frames on either side of the gap (None if unknown).
+    """
+
+    __slots__ = ("meeting_uuid", "started_at", "duration", "reason", "last_timestamp", "resume_timestamp")
+
+    def __init__(self, meeting_uuid, started_at, duration, reason, last_timestamp=None, resume_timestamp=None):
+        self.meeting_uuid = meeting_uuid
+        self.started_at = started_at
+        self.duration = duration
+        self.reason = reason
+        self.last_timestamp = last_timestamp
+        self.resume_timestamp = resume_timestamp
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RTMSStream:
+    """Connection state for one meeting's RTMS stream."""
+
+    def __init__(self, meeting_uuid, stream_id, server_urls, requested_at=None):
+        self.meeting_uuid = meeting_uuid
+        self.stream_id = stream_id
+        self.server_urls = server_urls
+        self.signaling = None
+        self.media = None
+        self.task = None
+        self.media_task = None
+
+        self.state = STATE_CONNECTING
+        self.state_changed_at = time.monotonic()
+        self.stopping = False
+        self.recoverable = True
+        self.recoveries = 0
+        self.recovery_attempts = 0
+        self.gaps = 0
+        self.gap_seconds = 0.0
+        self.invalid_frames = 0
+        self.last_frame = None
+        self.handshake_sent = {}
+        # Setup phase durations (seconds) up to the first media packet
+        self.requested_at = requested_at or time.monotonic()
+        self.ready_at = None
+        self.first_media_at = None
+        self.setup = {}
+        self._gap_started = None
+        self._gap_started_wall = None
+        self._gap_reason = None
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        logger.info(f"Stream {self.meeting_uuid}: {self.state} -> {state}")
+        self.state = state
+        self.state_changed_at = time.monotonic()
+
+    def begin_recovery(self, reason):
+        """Enter RECOVERING; the gap is measured from the first loss only."""
+        if self._gap_started is None:
+            self._gap_started = time.monotonic()
+            self._gap_started_wall = time.time()
+            self._gap_reason = reason
+            logger.warning(f"Stream {self.meeting_uuid} lost media ({reason}), recovering")
+        self.set_state(STATE_RECOVERING)
+
+    def end_gap(self, frame):
+        """Close an open gap when media resumes; returns the `StreamGap` or None."""
+        if self._gap_started is None:
+            return None
+        gap = StreamGap(
+            self.meeting_uuid,
+            self._gap_started_wall,
+            time.monotonic() - self._gap_started,
+            self._gap_reason,
+            _frame_timestamp(self.last_frame),
+            _frame_timestamp(frame)
+        )
+        self._gap_started = None
+        self.gaps += 1
+        self.gap_seconds += gap.duration
+        self.recoveries += 1
+        return gap
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "state_s": round(time.monotonic() - self.state_changed_at, 3),
+            "recoveries": self.recoveries,
+            "gaps": self.gaps,
+            "gap_s_total": round(self.gap_seconds, 3),
+            "invalid_frames": self.invalid_frames,
+            "setup_ms": {phase: round(seconds * 1000, 3) for phase, seconds in self.setup.items()}
+        }
+
+
+def _frame_timestamp(frame):
+    if frame is None or frame.msg_type is None:
+        return None
+    try:
+        return frame.content.get("timestamp")
+    except (AttributeError, ValueError):
+        return None
+
+
+class RTMSClient:
+    """Run RTMS signaling/media sessions for many meetings on one event loop.
+
+    `on_media(stream, frame)` is called for every frame received on a media
+    socket and `on_signaling(stream, frame)` for every signaling frame, after
+    the client has handled the protocol messages. `frame` is a lazily decoded
+    `rtms_common.frames.MediaFrame` (`msg_type` is None for non-JSON frames).
+    Callbacks may be plain functions or coroutines.
+
+    `on_gap(stream, gap)` is called with a `StreamGap` when media resumes
+    after a recovery, right before the first frame after the gap. A stream
+    gives up after `max_recoveries` failed reconnects in a row, or when the
+    signaling handshake is rejected (the meeting has ended). A rejected media
+    handshake is retried like a dropped media socket.
+
+    With `metrics` (an `rtms_common.metrics.RTMSMetrics`) every received
+    frame, its decode time, both handshake latencies and the setup phases
+    are recorded.
+    With `capture` (an `rtms_common.capture.CaptureWriter`) every received
+    message is written, as received, to a capture file for later replay.
+
+    Sockets are opened by `connector` (`default_connector(verify_tls)`
+    unless given); keep `verify_tls` on except for local test servers with
+    self-signed certificates.
+
+    Every socket is registered with `keepalive` (the process-wide
+    `KeepAliveService` by default), which tracks keep-alive timing and closes
+    sockets that stay silent for longer than its `dead_after`.
+    """
+
+    def __init__(self, client_id, client_secret, media_type=MEDIA_TYPE_AUDIO, media_params=None,
+                 media_url_key="all", on_media=None, on_signaling=None, verify_tls=True, keepalive=None,
+                 on_gap=None, max_recoveries=5, recovery_backoff=1.0, max_recovery_backoff=30.0, metrics=None,
+                 capture=None, connector=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.media_type = media_type
+        self.media_params = media_params
+        self.media_url_key = media_url_key
+        self.on_media = on_media
+        self.on_signaling = on_signaling
+        self.on_gap = on_gap
+        self.max_recoveries = max_recoveries
+        self.recovery_backoff = recovery_backoff
+        self.max_recovery_backoff = max_recovery_backoff
+        # Running streams by meeting UUID and by stream id, readable from any thread
+        self.streams = ActiveConnectionRegistry()
+        self.keepalive = keepalive or default_keepalive()
+        self.metrics = metrics
+        self.capture = capture
+        self.connector = connector or default_connector(verify_tls)
+        if metrics is not None:
+            metrics.watch_client(self)
+            metrics.watch_keepalive(self.keepalive)
+            metrics.watch_connector(self.connector)
+        self._tasks = set()
+
+        self.loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+
+    # ----------------------------------------------------------------- streams
+
+    def start_stream(self, meeting_uuid, stream_id, server_urls, requested_at=None):
+        """Start a stream as a task on the running loop and return the task.
+
+        `requested_at` (`time.monotonic()`) is when the webhook asked for the
+        stream, if that was earlier than now; setup timings start there.
+        """
+        requested_at = requested_at or time.monotonic()
+        task = asyncio.get_running_loop().create_task(
+            self.run_stream(meeting_uuid, stream_id, server_urls, requested_at))
+        # Keep a strong reference until the task finishes
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run_stream(self, meeting_uuid, stream_id, server_urls, requested_at=None):
+        """Run one stream until it is stopped or can no longer be recovered."""
+        requested_at = requested_at or time.monotonic()
+        existing = self.streams.get(meeting_uuid)
+        if existing and existing.stream_id == stream_id:
+            logger.info(f"Stream {stream_id} for meeting {meeting_uuid} is already running")
+            return
+        if existing:
+            await self.stop_stream(meeting_uuid)
+
+        stream = RTMSStream(meeting_uuid, stream_id, server_urls, requested_at)
+        self._record_setup(stream, {"queued": time.monotonic() - requested_at})
+        stream.task = asyncio.current_task()
+        self.streams.add(stream)
+        try:
+            while True:
+                stream.set_state(STATE_CONNECTING)
+                await self._run_signaling(stream)
+                await self._close_media(stream)
+                if stream.stopping or not stream.recoverable:
+                    break
+                if stream.recovery_attempts >= self.max_recoveries:
+                    logger.error(f"Giving up on meeting {meeting_uuid} after {stream.recovery_attempts} reconnects")
+                    break
+                stream.begin_recovery("signaling socket closed")
+                stream.recovery_attempts += 1
+                await asyncio.sleep(self._recovery_delay(stream.recovery_attempts))
+        finally:
+            if stream.media_task:
+                stream.media_task.cancel()
+            stream.set_state(STATE_CLOSED)
+            self.streams.remove(stream)
+            if self.metrics is not None and meeting_uuid not in self.streams:
+                self.metrics.stream_closed(meeting_uuid)
+
+    async def stop_stream(self, meeting_uuid):
+        """Close a meeting's sockets (concurrently) and cancel its tasks."""
+        stream = self.streams.pop(meeting_uuid)
+        if not stream:
+            return
+        stream.stopping = True
+        await self.streams.close_sockets(stream)
+        for task in (stream.media_task, stream.task):
+            if task and task is not asyncio.current_task() and not task.done():
+                task.cancel()
+
+    async def stop_streams(self, meeting_uuids=None):
+        """Stop several meetings (all by default) at once, so one slow close does not delay the rest."""
+        if meeting_uuids is None:
+            meeting_uuids = self.streams.meetings()
+        await asyncio.gather(*(self.stop_stream(meeting_uuid) for meeting_uuid in meeting_uuids))
+
+    def stream_stats(self):
+        """State, recoveries and gap totals per running stream."""
+        return {meeting_uuid: stream.stats() for meeting_uuid, stream in self.streams.items()}
+
+    def _recovery_delay(self, attempt):
+        # Full jitter; the first retry comes within `recovery_backoff` seconds
+        return random.uniform(0, min(self.max_recovery_backoff, self.recovery_backoff * (2 ** (attempt - 1))))
+
+    async def _close_media(self, stream):
+        """Drop the media socket of a session whose signaling socket is gone."""
+        task, stream.media_task = stream.media_task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # --------------------------------------------------------------- protocol
+
+    async def _run_signaling(self, stream):
+        logger.info(f"Connecting to signaling WebSocket for meeting {stream.meeting_uuid}")
+        peer = None
+        try:
+            phases = {}
+            async with self.connector.connect(stream.server_urls, phases, "signaling") as ws:
+                self._record_setup(stream, phases)
+                stream.signaling = ws
+                peer = self._watch(ws, f"signaling:{stream.meeting_uuid}")
+                stream.handshake_sent["signaling"] = time.perf_counter()
+                await ws.send(json_dumps({
+                    "msg_type": SIGNALING_HAND_SHAKE_REQ,
+                    "protocol_version": 1,
+                    "meeting_uuid": stream.meeting_uuid,
+                    "rtms_stream_id": stream.stream_id,
+                    "sequence": random.randint(0, int(1e9)),
+                    "signature": generate_signature(
+                        self.client_id, stream.meeting_uuid, stream.stream_id, self.client_secret)
+                }))
+                stream.set_state(STATE_HANDSHAKING)
+                logger.info("Sent handshake to signaling server")
+
+                async for message in ws:
+                    peer.seen()
+                    frame = self._receive(stream, message, "signaling")
+                    if frame is None:
+                        continue
+                    if frame.msg_type == SIGNALING_HAND_SHAKE_RESP:
+                        self._record_handshake(stream, "signaling")
+                        await self._on_signaling_handshake(stream, frame)
+                    elif frame.msg_type == KEEP_ALIVE_REQ:
+                        await self._answer_keep_alive(ws, frame, peer)
+                        logger.debug("Responded to Signaling KEEP_ALIVE_REQ")
+                    await self._dispatch(self.on_signaling, stream, frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Signaling socket error for meeting {stream.meeting_uuid}: {e}")
+        finally:
+            stream.signaling = None
+            if peer is not None:
+                self.keepalive.unregister(peer)
+            logger.info(f"Signaling socket closed for meeting {stream.meeting_uuid}")
+
+    async def _on_signaling_handshake(self, stream, frame):
+        if frame.msg.get("status_code") != 0:
+            logger.error(f"Signaling handshake failed for meeting {stream.meeting_uuid}: {frame.msg}")
+            # Zoom rejects the handshake once the stream is over; do not retry
+            stream.recoverable = False
+            await stream.signaling.close()
+            return
+        server_urls = frame.msg.get("media_server", {}).get("server_urls", {})
+        media_url = server_urls.get(self.media_url_key) or server_urls.get("all")
+        if not media_url:
+            logger.error(f"No media server URL in handshake response for meeting {stream.meeting_uuid}")
+            return
+        stream.media_task = asyncio.get_running_loop().create_task(self._run_media(stream, media_url))
+
+    async def _run_media(self, stream, media_url):
+        logger.info(f"Connecting to media WebSocket at {media_url}")
+        peer = None
+        try:
+            phases = {}
+            async with self.connector.connect(media_url, phases, "media") as ws:
+                self._record_setup(stream, phases)
+                stream.media = ws
+                peer = self._watch(ws, f"media:{stream.meeting_uuid}")
+                handshake = {
+                    "msg_type": DATA_HAND_SHAKE_REQ,
+                    "protocol_version": 1,
+                    "meeting_uuid": stream.meeting_uuid,
+                    "rtms_stream_id": stream.stream_id,
+                    "signature": generate_signature(
+                        self.client_id, stream.meeting_uuid, stream.stream_id, self.client_secret),
+                    "media_type": self.media_type,
+                    "payload_encryption": False
+                }
+                if self.media_params:
+                    handshake["media_params"] = self.media_params
+                stream.handshake_sent["media"] = time.perf_counter()
+                await ws.send(json_dumps(handshake))
+
+                async for message in ws:
+                    peer.seen()
+                    frame = self._receive(stream, message, "media")
+                    if frame is None:
+                        continue
+                    if frame.msg_type == DATA_HAND_SHAKE_RESP:
+                        self._record_handshake(stream, "media")
+                        await self._on_media_handshake(stream, frame)
+                    elif frame.msg_type == KEEP_ALIVE_REQ:
+                        await self._answer_keep_alive(ws, frame, peer)
+                        logger.debug("Responded to Media KEEP_ALIVE_REQ")
+                    elif stream.state != STATE_STREAMING:
+                        await self._on_media_resumed(stream, frame)
+                    await self._dispatch(self.on_media, stream, frame)
+                    if frame.msg_type not in _MEDIA_CONTROL_TYPES:
+                        stream.last_frame = frame
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Media socket error for meeting {stream.meeting_uuid}: {e}")
+        finally:
+            stream.media = None
+            if peer is not None:
+                self.keepalive.unregister(peer)
+            logger.info(f"Media socket closed for meeting {stream.meeting_uuid}")
+
+        # The media socket ended on its own: recover through a fresh signaling handshake
+        signaling = stream.signaling
+        if not stream.stopping and signaling is not None:
+            stream.begin_recovery("media socket closed")
+            await signaling.close()
+
+    async def _on_media_resumed(self, stream, frame):
+        if stream.first_media_at is None:
+            self._on_first_media(stream)
+        stream.set_state(STATE_STREAMING)
+        stream.recovery_attempts = 0
+        gap = stream.end_gap(frame)
+        if gap is not None:
+            logger.warning(f"Stream {stream.meeting_uuid} resumed after a {gap.duration:.2f}s gap")
+            await self._dispatch(self.on_gap, stream, gap)
+
+    async def _on_media_handshake(self, stream, frame):
+        if frame.msg.get("status_code") != 0:
+            logger.error(f"Media handshake failed for meeting {stream.meeting_uuid}: {frame.msg}")
+            # Closing the media socket recovers through a fresh signaling handshake
+            if stream.media is not None:
+                await stream.media.close()
+            return
+        if stream.signaling is not None:
+            await stream.signaling.send(json_dumps({
+                "msg_type": CLIENT_READY_ACK,
+                "rtms_stream_id": stream.stream_id
+            }))
+            stream.set_state(STATE_READY)
+            stream.ready_at = time.monotonic()
+            logger.info("Media handshake successful, sent start streaming request")
+
+    def _watch(self, ws, name):
+        """Register a socket with the keep-alive service; a dead peer gets its socket closed."""
+        loop = asyncio.get_running_loop()
+        return self.keepalive.register(
+            name,
+            on_dead=lambda peer: asyncio.run_coroutine_threadsafe(ws.close(), loop)
+        )
+
+    @staticmethod
+    async def _answer_keep_alive(ws, frame, peer):
+        received_at = time.monotonic()
+        timestamp = frame.msg.get("timestamp")
+        await ws.send(json_dumps({
+            "msg_type": KEEP_ALIVE_RESP,
+            "timestamp": timestamp
+        }))
+        peer.replied(received_at, timestamp if isinstance(timestamp, (int, float)) else None)
+
+    def _receive(self, stream, message, channel):
+        """Decode a received message, recording it when metrics or capture are enabled.
+
+        Returns None for a protocol message that is not valid JSON; it is
+        counted and dropped rather than left to fail in the read loop.
+        """
+        if self.capture is not None:
+            self.capture.record(stream.meeting_uuid, stream.stream_id, channel, message)
+        if self.metrics is None:
+            frame = self._decode(message)
+        else:
+            start = time.perf_counter()
+            frame = self._decode(message)
+            self.metrics.record_frame(stream.meeting_uuid, frame, time.perf_counter() - start)
+        if frame.msg_type in _CONTROL_TYPES:
+            # Small and always read by the client, so parse it here
+            try:
+                frame.msg
+            except ValueError as e:
+                stream.invalid_frames += 1
+                if self.metrics is not None:
+                    self.metrics.record_invalid_frame(channel)
+                logger.warning("Dropped an invalid %s message for meeting %s: %s", channel, stream.meeting_uuid, e)
+                return None
+        return frame
+
+    def _record_handshake(self, stream, phase):
+        sent = stream.handshake_sent.pop(phase, None)
+        if sent is None:
+            return
+        seconds = time.perf_counter() - sent
+        if stream.first_media_at is None:
+            stream.setup[f"{phase}_handshake"] = seconds
+        if self.metrics is not None:
+            self.metrics.record_handshake(phase, seconds)
+
+    def _record_setup(self, stream, phases):
+        """Keep connection phase timings on the stream (first setup only) and in metrics."""
+        if stream.first_media_at is None:
+            stream.setup.update(phases)
+        if self.metrics is not None:
+            for phase, seconds in phases.items():
+                self.metrics.record_setup_phase(phase, seconds)
+
+    def _on_first_media(self, stream):
+        now = time.monotonic()
+        phases = {"total": now - stream.requested_at}
+        if stream.ready_at is not None:
+            phases["first_media"] = now - stream.ready_at
+        self._record_setup(stream, phases)
+        stream.first_media_at = now
+        breakdown = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in stream.setup.items())
+        logger.info(f"First media for meeting {stream.meeting_uuid}: {breakdown}")
+
+    @staticmethod
+    def _decode(message):
+        try:
+            return decode_media_frame(message)
+        except ValueError:
+            return MediaFrame(message, None)
+
+    @staticmethod
+    async def _dispatch(callback, stream, frame):
+        if callback is None:
+            return
+        try:
+            result = callback(stream, frame)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Error in RTMS callback for meeting {stream.meeting_uuid}: {e}")
+
+    # ------------------------------------------------------ threaded helpers
+
+    def start_background(self):
+        """Run the client's event loop on a daemon thread (for threaded apps)."""
+        with self._loop_lock:
+            if self._loop_thread is None:
+                self.loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self.loop.run_forever, name="rtms-client", daemon=True)
+                self._loop_thread.start()
+        return self.loop
+
+    def submit_stream(self, meeting_uuid, stream_id, server_urls):
+        """Thread-safe `run_stream` on the background loop; returns a Future."""
+        loop = self.start_background()
+        return asyncio.run_coroutine_threadsafe(
+            self.run_stream(meeting_uuid, stream_id, server_urls, time.monotonic()), loop)
+
+    def submit_stop(self, meeting_uuid):
+        """Thread-safe `stop_stream` on the background loop; returns a Future."""
+        loop = self.start_background()
+        return asyncio.run_coroutine_threadsafe(self.stop_stream(meeting_uuid), loop)
@@ -0,0 +1,296 @@
+"""Connection setup for the RTMS WebSockets: one TLS context, resumed sessions, cached DNS.
+
+Every stream opens a signaling and a media socket to the same few Zoom
+hosts. Opening each with its own context (or with verification turned off)
+costs a DNS lookup and a full TLS handshake per socket. `Connector` sets up
+connections the same way for the whole process:
+
+- one `SessionCachingContext` with certificate and hostname verification
+  (system CA store, plus certifi's bundle when it is installed)
+- TLS session resumption: the context hands the last session it saw for a
+  host to the next connection to that host, so reconnects and the sockets
+  of later meetings skip the full handshake. asyncio has no `session=`
+  parameter; the context passes the session in `wrap_bio` instead
+- a small TTL cache of resolved addresses, with concurrent lookups for the
+  same host shared
+- per-phase timings (DNS, TCP connect, TLS + WebSocket upgrade) for every
+  connection, which `RTMSClient` combines into a webhook -> first media
+  packet breakdown per stream
+
+    connector = default_connector()
+    phases = {}
+    async with connector.connect("wss://host/path", phases, "media") as ws:
+        ...                    # phases == {"media_dns": ..., "media_tcp": ..., "media_tls_ws": ...}
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import ssl
+import threading
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import websockets
+
+try:
+    import certifi
+except ImportError:
+    certifi = None
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCachingContext(ssl.SSLContext):
+    """A client TLS context that resumes the last session it saw for each host.
+
+    Sessions are read from the host's most recent connection when the next
+    one starts (with TLS 1.3 the ticket only arrives after the handshake).
+    A session the server no longer accepts just means a full handshake.
+    """
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        return super().__new__(cls, protocol, *args, **kwargs)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.handshakes = 0
+        self.resumed = 0
+        self._sessions = {}
+        self._latest = {}
+        self._session_lock = threading.Lock()
+
+    def _harvest(self, server_hostname):
+        latest = self._latest.get(server_hostname)
+        if latest is not None:
+            try:
+                session = latest.session
+            except (AttributeError, ValueError):
+                session = None
+            if session is not None and session.has_ticket:
+                self._sessions[server_hostname] = session
+
+    def keep_session(self, server_hostname):
+        """Save the session of the host's open connection now.
+
+        Needed for blocking sockets, which drop their session when closed;
+        call it once the connection is established.
+        """
+        with self._session_lock:
+            self._harvest(server_hostname)
+
+    def _session_for(self, server_hostname):
+        with self._session_lock:
+            self._harvest(server_hostname)
+            return self._sessions.get(server_hostname)
+
+    def _remember(self, server_hostname, ssl_object):
+        with self._session_lock:
+            self._latest[server_hostname] = ssl_object
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        # Used by asyncio transports
+        if not server_side and server_hostname and session is None:
+            session = self._session_for(server_hostname)
+        ssl_object = super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                      server_hostname=server_hostname, session=session)
+        if not server_side and server_hostname:
+            self._remember(server_hostname, ssl_object)
+        return ssl_object
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        # Used by blocking clients (websocket-client)
+        if not server_side and server_hostname and session is None:
+            session = self._session_for(server_hostname)
+        ssl_socket = super().wrap_socket(sock, server_side=server_side,
+                                         do_handshake_on_connect=do_handshake_on_connect,
+                                         suppress_ragged_eofs=suppress_ragged_eofs,
+                                         server_hostname=server_hostname, session=session)
+        if not server_side and server_hostname:
+            self._remember(server_hostname, ssl_socket)
+        return ssl_socket
+
+    def record_handshake(self, ssl_object):
+        """Count a finished handshake and whether it resumed a session."""
+        with self._session_lock:
+            self.handshakes += 1
+            if ssl_object is not None and ssl_object.session_reused:
+                self.resumed += 1
+
+    def stats(self):
+        with self._session_lock:
+            return {
+                "handshakes": self.handshakes,
+                "resumed": self.resumed,
+                "hosts_with_session": len(self._sessions),
+                "verify": self.verify_mode != ssl.CERT_NONE
+            }
+
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+def default_tls_context(verify=True):
+    """The process-wide client TLS context (one verifying, one not)."""
+    with _contexts_lock:
+        context = _contexts.get(verify)
+        if context is None:
+            context = SessionCachingContext()
+            context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+            if certifi is not None:
+                context.load_verify_locations(certifi.where())
+            if not verify:
+                logger.warning("TLS certificate verification is disabled for RTMS connections")
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            _contexts[verify] = context
+        return context
+
+
+class DNSCache:
+    """Resolved addresses per (host, port), kept for `ttl` seconds."""
+
+    def __init__(self, ttl=60.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._inflight = {}
+
+    async def resolve(self, host, port):
+        """Return every `(family, sockaddr)` for host:port in getaddrinfo order, from the cache when fresh."""
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            return [((socket.AF_INET6 if address.version == 6 else socket.AF_INET), (host, port))]
+
+        key = (host, port)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+        # Concurrent streams to the same host share one lookup (per event loop)
+        inflight_key = (id(asyncio.get_running_loop()), host, port)
+        pending = self._inflight.get(inflight_key)
+        if pending is None:
+            pending = self._inflight[inflight_key] = asyncio.ensure_future(self._lookup(host, port))
+            pending.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        return await asyncio.shield(pending)
+
+    async def _lookup(self, host, port):
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        # Keep them all: the first may be unreachable (e.g. IPv6 on an IPv4-only host)
+        addresses = [(family, sockaddr) for family, _, _, _, sockaddr in infos]
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host, port):
+        self._entries.pop((host, port), None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class Connector:
+    """Open WebSockets through a shared TLS context and DNS cache, timing each phase."""
+
+    def __init__(self, tls_context=None, dns_cache=None, connect_timeout=10.0):
+        self.tls_context = tls_context or default_tls_context()
+        self.dns = dns_cache or DNSCache()
+        self.connect_timeout = connect_timeout
+
+    @asynccontextmanager
+    async def connect(self, url, phases=None, prefix=None, **kwargs):
+        """`async with` a connected WebSocket; phase durations (seconds) go into `phases`."""
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        host = parts.hostname
+        port = parts.port or (443 if secure else 80)
+        loop = asyncio.get_running_loop()
+        timings = {}
+
+        started = time.perf_counter()
+        addresses = await self.dns.resolve(host, port)
+        resolved = time.perf_counter()
+        timings["dns"] = resolved - started
+
+        sock = await self._connect_socket(loop, host, port, addresses)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connected = time.perf_counter()
+        timings["tcp"] = connected - resolved
+
+        try:
+            connection = websockets.connect(url, sock=sock, ssl=self.tls_context if secure else None, **kwargs)
+        except Exception:
+            sock.close()
+            raise
+        async with connection as ws:
+            timings["tls_ws"] = time.perf_counter() - connected
+            if secure:
+                self.tls_context.record_handshake(ws.transport.get_extra_info("ssl_object"))
+            if phases is not None:
+                for name, seconds in timings.items():
+                    phases[f"{prefix}_{name}" if prefix else name] = seconds
+            yield ws
+
+    async def _connect_socket(self, loop, host, port, addresses):
+        # Try each address in turn, like loop.create_connection()
+        errors = []
+        for family, sockaddr in addresses:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                await self._sock_connect(loop, sock, sockaddr)
+                return sock
+            except (OSError, asyncio.TimeoutError) as e:
+                sock.close()
+                errors.append(e)
+                logger.debug("Connecting to %s:%s at %s failed: %r", host, port, sockaddr, e)
+            except BaseException:
+                sock.close()
+                raise
+        # The host may have moved; resolve again next time
+        self.dns.invalidate(host, port)
+        if len(errors) == 1:
+            raise errors[0]
+        raise OSError(f"Could not connect to {host}:{port} at any of its {len(errors)} addresses: "
+                      + "; ".join(repr(e) for e in errors))
+
+    async def _sock_connect(self, loop, sock, sockaddr):
+        # Not asyncio.wait_for: before Python 3.12 it drops a cancel that arrives as the connect completes,
+        # and a stream being torn down would keep its new socket
+        connecting = asyncio.ensure_future(loop.sock_connect(sock, sockaddr))
+        try:
+            done, _ = await asyncio.wait((connecting,), timeout=self.connect_timeout)
+        finally:
+            if not connecting.done():
+                connecting.cancel()
+        if not done:
+            raise asyncio.TimeoutError(f"Connecting to {sockaddr} timed out after {self.connect_timeout}s")
+        connecting.result()
+
+    def stats(self):
+        return {"tls": self.tls_context.stats(), "dns": self.dns.stats()}
+
+
+_connectors = {}
+_connectors_lock = threading.Lock()
+
+
+def default_connector(verify_tls=True):
+    """The process-wide `Connector`, sharing its TLS context and DNS cache across clients."""
+    with _connectors_lock:
+        connector = _connectors.get(verify_tls)
+        if connector is None:
+            connector = _connectors[verify_tls] = Connector(default_tls_context(verify_tls))
+        return connector
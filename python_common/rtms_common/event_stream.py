@@ -0,0 +1,257 @@
+"""Supervised consumer for the Zoom event WebSocket.
+
+A bare `WebSocketApp.run_forever()` returns for good after the first network
+blip, and the process silently stops receiving `meeting.rtms_started` until
+someone restarts it. `ZoomEventStream` owns the connection on a supervisor
+thread instead:
+
+- when the socket closes (or the keep-alive service declares it dead) it
+  reconnects after a full-jitter exponential backoff, starting at
+  `min_backoff` seconds so a stream started during a blip is picked up
+  within seconds, and resetting once a connection opens
+- every connect asks `token_provider` for the token, so it picks up the
+  cached token the token manager refreshed in the meantime; a 401 on the
+  upgrade calls `on_unauthorized` (e.g. `TokenManager.invalidate`) first
+- events Zoom delivers again after a reconnect are dropped by event id, so
+  a replayed `meeting.rtms_started` never opens a second stream
+- the time from losing the connection to the next successful open is
+  logged and reported by `stats()`
+- TLS goes through the process-wide verifying context of
+  `rtms_common.connect`, which resumes the previous session on reconnect
+
+    stream = ZoomEventStream(base_url, tokens.get_token, on_event, on_unauthorized=tokens.invalidate)
+    stream.start()
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import websocket
+
+from .connect import default_tls_context
+from .keepalive import default_keepalive
+
+logger = logging.getLogger(__name__)
+
+
+class ZoomEventStream:
+    """Keep one Zoom event WebSocket connected and hand each new event to `on_event`.
+
+    `on_event(event, payload, event_data)` runs on the socket thread for every
+    `module: message` frame not seen before and should return quickly.
+    """
+
+    def __init__(self, base_url, token_provider, on_event, on_unauthorized=None, keepalive=None,
+                 heartbeat_interval=30, dead_after=75, min_backoff=1.0, max_backoff=60.0,
+                 dedupe_size=10000, name="zoom-event-ws", tls_context=None):
+        self.base_url = base_url
+        self.token_provider = token_provider
+        self.on_event = on_event
+        self.on_unauthorized = on_unauthorized
+        self.keepalive = keepalive or default_keepalive()
+        self.heartbeat_interval = heartbeat_interval
+        self.dead_after = dead_after
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.dedupe_size = dedupe_size
+        self.name = name
+        self.tls_context = tls_context or default_tls_context()
+        self._host = urlsplit(base_url).hostname
+
+        self.connects = 0
+        self.disconnects = 0
+        self.events = 0
+        self.duplicates = 0
+        self.last_reconnect = None
+        self.max_reconnect = 0.0
+        self._reconnect_total = 0.0
+
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._ws = None
+        self._peer = None
+        self._opened = False
+        self._disconnected_at = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Connect and keep reconnecting on a daemon thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        ws = self._ws
+        if ws is not None:
+            ws.close()
+
+    @property
+    def connected(self):
+        return self._peer is not None
+
+    def stats(self):
+        with self._lock:
+            reconnects = self.connects - 1 if self.connects else 0
+            return {
+                "connected": self.connected,
+                "connects": self.connects,
+                "disconnects": self.disconnects,
+                "events": self.events,
+                "duplicates": self.duplicates,
+                "reconnect_s_last": None if self.last_reconnect is None else round(self.last_reconnect, 3),
+                "reconnect_s_avg": round(self._reconnect_total / reconnects, 3) if reconnects else None,
+                "reconnect_s_max": round(self.max_reconnect, 3)
+            }
+
+    # ------------------------------------------------------------- supervisor
+
+    def _run(self):
+        attempt = 0
+        while not self._stopped.is_set():
+            self._opened = False
+            token = None
+            try:
+                token = self.token_provider()
+            except Exception as e:
+                logger.error(f"{self.name}: could not get an access token: {e}")
+
+            if token:
+                logger.info(f"{self.name}: connecting to {self.base_url}")
+                self._ws = websocket.WebSocketApp(
+                    f"{self.base_url}&access_token={token}",
+                    on_open=self._on_open,
+                    on_message=self._on_message,
+                    on_error=self._on_error,
+                    on_close=self._on_close
+                )
+                try:
+                    self._ws.run_forever(sslopt={"context": self.tls_context})
+                except Exception as e:
+                    logger.error(f"{self.name}: socket loop failed: {e}")
+                self._ws = None
+                self._release_peer()
+
+            if self._stopped.is_set():
+                break
+            if self._disconnected_at is None and self.connects:
+                self._disconnected_at = time.monotonic()
+            # A connection that opened resets the backoff; failed attempts grow it
+            attempt = 0 if self._opened else attempt + 1
+            delay = self._backoff_delay(attempt)
+            logger.warning(f"{self.name}: reconnecting in {delay:.1f}s")
+            self._stopped.wait(delay)
+
+    def _backoff_delay(self, attempt):
+        # Full jitter, so many processes that lost Zoom together do not reconnect together
+        return random.uniform(0, min(self.max_backoff, self.min_backoff * (2 ** attempt)))
+
+    # -------------------------------------------------------------- callbacks
+
+    def _on_open(self, ws):
+        now = time.monotonic()
+        self._opened = True
+        with self._lock:
+            self.connects += 1
+            if self._disconnected_at is not None:
+                took = now - self._disconnected_at
+                self.last_reconnect = took
+                self.max_reconnect = max(self.max_reconnect, took)
+                self._reconnect_total += took
+                logger.info(f"{self.name}: reconnected after {took:.2f}s")
+            else:
+                logger.info(f"{self.name}: connected")
+            self._disconnected_at = None
+        if self._host and hasattr(self.tls_context, "keep_session"):
+            # The blocking socket loses its session on close; keep it for the reconnect
+            self.tls_context.keep_session(self._host)
+        self._peer = self.keepalive.register(
+            self.name,
+            send=lambda: ws.send(json.dumps({"module": "heartbeat"})),
+            on_dead=lambda peer: ws.close(),
+            interval=self.heartbeat_interval,
+            dead_after=self.dead_after
+        )
+
+    def _on_message(self, ws, message):
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            logger.warning(f"{self.name}: ignoring non-JSON message")
+            return
+
+        peer = self._peer
+        if peer is not None:
+            if msg.get("module") == "heartbeat":
+                peer.ack()
+            else:
+                peer.seen()
+
+        if msg.get("module") != "message" or not msg.get("content"):
+            return
+        content = msg["content"]
+        try:
+            event_data = json.loads(content)
+        except ValueError:
+            logger.warning(f"{self.name}: ignoring message with non-JSON content")
+            return
+
+        if self._is_duplicate(self._event_id(msg, event_data, content)):
+            logger.info(f"{self.name}: dropping replayed event {event_data.get('event')}")
+            return
+        with self._lock:
+            self.events += 1
+        try:
+            self.on_event(event_data.get("event"), event_data.get("payload", {}), event_data)
+        except Exception as e:
+            logger.error(f"{self.name}: event handler failed: {e}")
+
+    def _on_error(self, ws, error):
+        logger.error(f"{self.name}: {error}")
+        if getattr(error, "status_code", None) == 401 and self.on_unauthorized is not None:
+            # The cached token was rejected; make the next connect fetch a new one
+            self.on_unauthorized()
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        logger.warning(f"{self.name}: closed (code {close_status_code}, {close_msg})")
+        if self._opened:
+            with self._lock:
+                self.disconnects += 1
+                if self._disconnected_at is None:
+                    self._disconnected_at = time.monotonic()
+        self._release_peer()
+
+    def _release_peer(self):
+        peer, self._peer = self._peer, None
+        if peer is not None:
+            self.keepalive.unregister(peer)
+
+    # ----------------------------------------------------------------- dedupe
+
+    @staticmethod
+    def _event_id(msg, event_data, content):
+        """Zoom's message id if present, otherwise a digest of the event body."""
+        for key in ("messageId", "message_id", "event_id"):
+            value = msg.get(key) or event_data.get(key)
+            if value:
+                return str(value)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _is_duplicate(self, event_id):
+        with self._lock:
+            if event_id in self._seen:
+                self._seen.move_to_end(event_id)
+                self.duplicates += 1
+                return True
+            self._seen[event_id] = None
+            if len(self._seen) > self.dedupe_size:
+                self._seen.popitem(last=False)
+            return False
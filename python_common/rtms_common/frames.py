@@ -0,0 +1,179 @@
+"""Fast decoding of RTMS media frames.
+
+Media sockets deliver every audio/video packet as a JSON object with a
+base64 `content.data` field. Parsing the whole frame with `json.loads` and
+then calling `base64.b64decode` costs more CPU than anything else the samples
+do, so this module:
+
+- picks the fastest available JSON backend (orjson, msgspec, then json) and
+  base64 decoder (pybase64, then binascii),
+- reads a top-level `msg_type` with a cheap scan before anything is parsed,
+  so frames a handler ignores are never parsed at all,
+- decodes `content.data` only when the payload is actually used, and for
+  large frames parses just the small metadata part and decodes the payload
+  straight from a memoryview of the raw frame.
+"""
+import binascii
+import json
+import os
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+# Frames whose content.data is base64 media (audio, video, screen share)
+BINARY_MEDIA_MSG_TYPES = {14, 15, 16}
+
+# Below this size a full parse is cheaper than cutting the data out first
+SPLIT_MIN_FRAME_SIZE = 8 * 1024
+
+_MSG_TYPE_RE = re.compile(r'"msg_type"\s*:\s*(\d+)')
+_MSG_TYPE_RE_B = re.compile(rb'"msg_type"\s*:\s*(\d+)')
+_DATA_RE = re.compile(r'"data"\s*:\s*"')
+_DATA_RE_B = re.compile(rb'"data"\s*:\s*"')
+_CONTENT_KEY = '"content"'
+_CONTENT_KEY_B = b'"content"'
+# RTMS frames are JSON objects; anything else is rejected before it is wrapped
+_OBJECT_RE = re.compile(r'\s*\{')
+_OBJECT_RE_B = re.compile(rb'\s*\{')
+
+
+def _select_backend(name):
+    if name in ("auto", "orjson") and orjson is not None:
+        return "orjson", orjson.loads, lambda obj: orjson.dumps(obj).decode()
+    if name in ("auto", "msgspec") and msgspec is not None:
+        decoder = msgspec.json.Decoder()
+        encoder = msgspec.json.Encoder()
+
+        def loads(raw):
+            # Match json/orjson, whose decode errors are ValueErrors
+            try:
+                return decoder.decode(raw)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e)) from e
+
+        return "msgspec", loads, lambda obj: encoder.encode(obj).decode()
+    return "json", json.loads, json.dumps
+
+
+# RTMS_JSON_BACKEND=json forces the standard library (e.g. to compare results)
+JSON_BACKEND, json_loads, json_dumps = _select_backend(os.getenv("RTMS_JSON_BACKEND", "auto"))
+b64decode = pybase64.b64decode if pybase64 is not None else binascii.a2b_base64
+
+
+def peek_msg_type(raw):
+    """Return the msg_type of a raw frame without parsing it, or None.
+
+    Only a msg_type key that comes before any nested object or array is
+    taken, so one inside `content` is never mistaken for the frame's own;
+    other layouts return None and are parsed in full.
+    """
+    is_text = isinstance(raw, str)
+    match = (_MSG_TYPE_RE if is_text else _MSG_TYPE_RE_B).search(raw)
+    if not match:
+        return None
+    start = raw.find("{" if is_text else b"{") + 1
+    end = match.start()
+    if raw.find("{" if is_text else b"{", start, end) >= 0 or raw.find("[" if is_text else b"[", start, end) >= 0:
+        return None
+    return int(match.group(1))
+
+
+class MediaFrame:
+    """A lazily decoded RTMS frame.
+
+    `msg_type` is available immediately and `msg` is parsed on first use. For
+    binary media frames the base64 data is kept out of `msg` (its
+    `content.data` is an empty string) and decoded on first use of `payload`.
+    """
+
+    __slots__ = ("raw", "msg_type", "_msg", "_data", "_payload")
+
+    def __init__(self, raw, msg_type):
+        self.raw = raw
+        self.msg_type = msg_type
+        self._msg = None
+        self._data = None
+        self._payload = None
+
+    @property
+    def msg(self):
+        if self._msg is None:
+            self._parse()
+        return self._msg
+
+    @property
+    def content(self):
+        content = self.msg.get("content")
+        return content if isinstance(content, dict) else {}
+
+    @property
+    def payload(self):
+        """The decoded `content.data` bytes, or None if the frame has no data."""
+        if self._msg is None:
+            self._parse()
+        if self._payload is None and self._data:
+            self._payload = b64decode(self._data)
+            self._data = None
+        return self._payload
+
+    def _parse(self):
+        raw = self.raw
+        if self.msg_type in BINARY_MEDIA_MSG_TYPES and len(raw) >= SPLIT_MIN_FRAME_SIZE:
+            is_text = isinstance(raw, str)
+            # content.data comes after the "content" key; a "data" key elsewhere must not match
+            content_at = raw.find(_CONTENT_KEY if is_text else _CONTENT_KEY_B)
+            match = (_DATA_RE if is_text else _DATA_RE_B).search(raw, content_at) if content_at >= 0 else None
+            if match:
+                start = match.end()
+                end = raw.find('"' if is_text else b'"', start)
+                # Escaped characters (e.g. "\/") need the full JSON parser
+                if end > 0 and raw.find('\\' if is_text else b'\\', start, end) < 0:
+                    msg = json_loads(raw[:start] + raw[end:])
+                    content = msg.get("content") if isinstance(msg, dict) else None
+                    # A nested "data" key inside content may come first; then parse the whole frame
+                    if isinstance(content, dict) and content.get("data") == "":
+                        self._msg = msg
+                        self._data = raw[start:end] if is_text else memoryview(raw)[start:end]
+                        return
+        self._set_msg(json_loads(raw))
+
+    def _set_msg(self, msg):
+        if not isinstance(msg, dict):
+            raise ValueError(f"RTMS frame is not a JSON object: {type(msg).__name__}")
+        self._msg = msg
+        if self.msg_type in BINARY_MEDIA_MSG_TYPES:
+            content = msg.get("content")
+            if isinstance(content, dict) and content.get("data"):
+                self._data = content["data"]
+                content["data"] = ""
+
+
+def decode_media_frame(raw):
+    """Wrap a raw text/bytes frame received from a signaling or media socket.
+
+    Raises ValueError if the frame is not a JSON object.
+    """
+    if not (_OBJECT_RE if isinstance(raw, str) else _OBJECT_RE_B).match(raw):
+        # Lists, numbers and strings are valid JSON but not RTMS messages
+        raise ValueError("RTMS frame is not a JSON object")
+    msg_type = peek_msg_type(raw)
+    if msg_type is None:
+        # Unusual layout; parse eagerly to find the type
+        msg = json_loads(raw)
+        frame = MediaFrame(raw, msg.get("msg_type"))
+        frame._set_msg(msg)
+        return frame
+    return MediaFrame(raw, msg_type)
@@ -0,0 +1,191 @@
+"""One keep-alive service for every socket in the process.
+
+The event WebSocket used to start a heartbeat thread per connection that
+slept 30 s between sends, and the RTMS sockets only answered keep-alives
+without ever noticing a peer that had gone quiet. `KeepAliveService` runs a
+single timer thread for all of them. Each socket registers a `Peer` and
+reports inbound traffic; the service then
+
+- sends the peer's heartbeat every `interval` seconds (for sockets where we
+  drive the heartbeat, like the Zoom event WebSocket)
+- measures the round trip from each heartbeat to its ack
+- declares the peer dead when nothing has been seen for `dead_after`
+  seconds and calls its `on_dead` callback (close the socket so the owner
+  can reconnect), long before TCP would notice
+
+For RTMS sockets Zoom drives the keep-alive (KEEP_ALIVE_REQ -> RESP), so the
+peer records how long we took to answer each request instead: a growing
+reply time means the event loop is stalled.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Peer:
+    """Keep-alive state of one registered socket."""
+
+    def __init__(self, name, send, on_dead, interval, dead_after):
+        self.name = name
+        self.send = send
+        self.on_dead = on_dead
+        self.interval = interval
+        self.dead_after = dead_after
+
+        now = time.monotonic()
+        self.registered_at = now
+        self.last_seen = now
+        self.next_heartbeat = now if send else None
+        self.ping_sent_at = None
+        self.last_rtt = None
+        self.rtt_total = 0.0
+        self.rtt_max = 0.0
+        self.acks = 0
+        self.pings = 0
+        self.last_reply = None
+        self.reply_max = 0.0
+        self.server_lag = None
+        self.dead = False
+
+    def seen(self):
+        """Record inbound traffic of any kind."""
+        self.last_seen = time.monotonic()
+
+    def ack(self):
+        """Record the ack of our last heartbeat and update the RTT."""
+        now = time.monotonic()
+        self.last_seen = now
+        if self.ping_sent_at is None:
+            return
+        rtt = now - self.ping_sent_at
+        self.ping_sent_at = None
+        self.last_rtt = rtt
+        self.rtt_total += rtt
+        self.rtt_max = max(self.rtt_max, rtt)
+        self.acks += 1
+
+    def replied(self, received_at, sent_timestamp_ms=None):
+        """Record that a peer-initiated keep-alive received at `received_at` was answered.
+
+        `sent_timestamp_ms` is the peer's own send time (epoch ms), if the
+        request carried one; the difference to our clock is network latency
+        plus event-loop delay plus clock skew.
+        """
+        reply = time.monotonic() - received_at
+        self.last_reply = reply
+        self.reply_max = max(self.reply_max, reply)
+        if sent_timestamp_ms:
+            lag = time.time() - sent_timestamp_ms / 1000
+            # Ignore timestamps that are clearly not epoch milliseconds
+            if abs(lag) < 3600:
+                self.server_lag = lag
+
+    def stats(self):
+        return {
+            "idle_s": round(time.monotonic() - self.last_seen, 3),
+            "pings": self.pings,
+            "acks": self.acks,
+            "rtt_ms": None if self.last_rtt is None else round(self.last_rtt * 1000, 3),
+            "rtt_ms_avg": round(self.rtt_total / self.acks * 1000, 3) if self.acks else None,
+            "rtt_ms_max": round(self.rtt_max * 1000, 3),
+            "reply_ms": None if self.last_reply is None else round(self.last_reply * 1000, 3),
+            "reply_ms_max": round(self.reply_max * 1000, 3),
+            "server_lag_ms": None if self.server_lag is None else round(self.server_lag * 1000, 3)
+        }
+
+
+class KeepAliveService:
+    """Drive heartbeats and dead-peer checks for many sockets from one thread."""
+
+    def __init__(self, interval=30.0, dead_after=90.0, tick=1.0, name="keepalive"):
+        self.interval = interval
+        self.dead_after = dead_after
+        self.tick = tick
+        self.name = name
+        self.dead_peers = 0
+
+        self._peers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, name, send=None, on_dead=None, interval=None, dead_after=None):
+        """Track a socket; `send()` (if given) sends one heartbeat, starting now."""
+        peer = Peer(
+            name,
+            send,
+            on_dead,
+            self.interval if interval is None else interval,
+            self.dead_after if dead_after is None else dead_after
+        )
+        with self._lock:
+            self._peers.add(peer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return peer
+
+    def unregister(self, peer):
+        with self._lock:
+            self._peers.discard(peer)
+
+    def stats(self):
+        """Per-peer keep-alive numbers plus the number of live and dead peers."""
+        with self._lock:
+            peers = list(self._peers)
+        return {
+            "peers": len(peers),
+            "dead_peers": self.dead_peers,
+            "sockets": {peer.name: peer.stats() for peer in peers}
+        }
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            now = time.monotonic()
+            with self._lock:
+                peers = list(self._peers)
+            for peer in peers:
+                if peer.dead:
+                    continue
+                if peer.dead_after and now - peer.last_seen > peer.dead_after:
+                    self._declare_dead(peer, f"nothing received for {now - peer.last_seen:.0f}s")
+                    continue
+                if peer.next_heartbeat is not None and now >= peer.next_heartbeat:
+                    self._heartbeat(peer, now)
+
+    def _heartbeat(self, peer, now):
+        peer.next_heartbeat = now + peer.interval
+        try:
+            peer.send()
+        except Exception as e:
+            self._declare_dead(peer, f"heartbeat failed: {e}")
+            return
+        peer.pings += 1
+        peer.ping_sent_at = now
+        logger.debug(f"Heartbeat sent to {peer.name}")
+
+    def _declare_dead(self, peer, reason):
+        peer.dead = True
+        self.dead_peers += 1
+        self.unregister(peer)
+        logger.warning(f"Keep-alive: {peer.name} looks dead ({reason})")
+        if peer.on_dead is not None:
+            try:
+                peer.on_dead(peer)
+            except Exception as e:
+                logger.error(f"Error closing dead peer {peer.name}: {e}")
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def default_keepalive():
+    """The process-wide `KeepAliveService` shared by the samples."""
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = KeepAliveService()
+        return _default_service
@@ -0,0 +1,333 @@
+"""Logging that stays off the media hot path.
+
+The samples logged every media packet: `print(json.dumps(msg, indent=2))`,
+`data.hex()` of binary frames, per-message INFO lines and per-frame DEBUG
+f-strings. At RTMS packet rates that formatting alone keeps a core busy, and
+every line is a blocking write to stdout/stderr from the event loop thread
+that also answers keep-alives. This module keeps logging cheap:
+
+- `setup_logging()` replaces `logging.basicConfig()`. Records go through a
+  bounded queue to one writer thread, so a slow terminal or pipe never
+  blocks the caller. When the queue is full, records are dropped and
+  counted instead of waited for.
+- Records are formatted on the writer thread. Pass values as arguments,
+  wrapping expensive ones in `Lazy`
+  (`logger.info("Message: %s", Lazy(json.dumps, msg, indent=2))`), and
+  nothing is formatted for records that are filtered out or dropped.
+- `MediaLog` decides which frames are worth a line: every Nth frame of a
+  msg_type per meeting, and at most R lines per second per msg_type. Every
+  frame is still counted.
+- In summary mode (`summary_interval`) `MediaLog` logs one line per meeting
+  each interval with the messages and bytes received per msg_type and how
+  many of them were not logged.
+
+    setup_logging(LOG_LEVEL)
+    media_log = MediaLog(sample="14=100", rate="*=1", summary_interval=10)
+
+    def handle_media(stream, frame):
+        if media_log.observe(stream, frame):
+            logger.info("Media JSON Message: %s", Lazy(json.dumps, frame.msg, indent=2))
+
+Records are formatted after the call returns, so only pass arguments that
+are not modified afterwards.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger(__name__)
+
+# Key for the msg_types a per-type setting does not name
+ANY_MSG_TYPE = "*"
+
+MSG_TYPE_NAMES = {5: "transcript", 14: "audio", 15: "video", 16: "deskshare", 17: "transcript", 18: "chat"}
+
+
+class Lazy:
+    """Call `func(*args, **kwargs)` only when the log record is formatted."""
+
+    __slots__ = ("func", "args", "kwargs")
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+
+def parse_per_type(value, cast=float):
+    """Parse a per-msg_type setting such as "14=100,17=1,*=5".
+
+    Returns a dict keyed by int msg_type, with `ANY_MSG_TYPE` for the default.
+    Dicts are returned as they are; None and "" give an empty dict.
+    """
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return value
+    settings = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        key, _, setting = item.partition("=")
+        key = key.strip()
+        try:
+            settings[key if key == ANY_MSG_TYPE else int(key)] = cast(setting)
+        except ValueError:
+            raise ValueError(f"Invalid per-msg_type setting {item.strip()!r} (expected e.g. 14=100 or *=1)") from None
+    return settings
+
+
+# ---- async handler
+
+class AsyncLogHandler(QueueHandler):
+    """Hand records to a writer thread without ever blocking the caller.
+
+    `handlers` (e.g. a `StreamHandler`) run on the writer thread, which also
+    formats the records. A child process started by fork gets its own queue
+    and writer thread. After `stop()` records are handled synchronously.
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.handlers = list(handlers)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._unreported = 0
+        self._listener = None
+        self._stopped = False
+        self._start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        self.queue = queue.Queue(self.maxsize)
+        self._listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def _after_fork(self):
+        # The writer thread does not survive a fork
+        self._listener = None
+        self._unreported = 0
+        if not self._stopped:
+            self._start()
+
+    def prepare(self, record):
+        # Unlike QueueHandler, leave formatting to the writer thread
+        return record
+
+    def enqueue(self, record):
+        if self._unreported:
+            self._report_dropped()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+    def _report_dropped(self):
+        notice = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            "Dropped %d log records: the log queue was full", (self._unreported,), None)
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            return
+        self._unreported = 0
+
+    def handle(self, record):
+        if self._stopped:
+            # Late records (e.g. from atexit handlers) are written directly
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return True
+        return super().handle(record)
+
+    def stop(self):
+        """Write out the queued records and stop the writer thread."""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
+
+
+def setup_logging(level=logging.INFO, fmt=logging.BASIC_FORMAT, stream=None, maxsize=10000):
+    """Configure the root logger like `logging.basicConfig()`, writing from a background thread.
+
+    `level` is a logging level or its name. Replaces the root logger's
+    handlers and returns the `AsyncLogHandler`; queued records are written
+    out at exit.
+    """
+    if isinstance(level, str):
+        level = getattr(logging, level.upper(), logging.INFO)
+    output = logging.StreamHandler(stream)
+    output.setFormatter(logging.Formatter(fmt))
+    handler = AsyncLogHandler([output], maxsize)
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        if isinstance(old, AsyncLogHandler):
+            old.stop()
+    root.addHandler(handler)
+    root.setLevel(level)
+    atexit.register(handler.stop)
+    return handler
+
+
+# ---- media sampling and summaries
+
+class _TypeCounts:
+    __slots__ = ("messages", "bytes", "logged")
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.logged = 0
+
+
+class MediaLog:
+    """Choose which media frames get a log line, and summarise all of them per meeting.
+
+    `sample` logs every Nth frame of a msg_type per meeting, counting from
+    the first frame of each summary interval; `rate` caps the lines per second per msg_type across all
+    meetings, with bursts of up to one second's worth. Both take a dict or a
+    string like "14=100,*=1" (see `parse_per_type`); msg_types they do not
+    name are not limited. A rate of 0 turns per-frame lines off for that
+    type. With `summary_interval` > 0 a background thread logs the
+    per-meeting counters at INFO every interval; with 0 the counters are
+    only reset every `RESET_INTERVAL` seconds, so ended meetings are
+    forgotten.
+    """
+
+    RESET_INTERVAL = 60.0
+
+    def __init__(self, sample=None, rate=None, summary_interval=10.0, log=None):
+        self.sample = {key: int(every) for key, every in parse_per_type(sample).items()}
+        self.rate = parse_per_type(rate)
+        self.summary_interval = summary_interval
+        self.log = log or logger
+
+        self.observed = 0
+        self.logged = 0
+        # (meeting_uuid, msg_type) -> _TypeCounts since the last summary
+        self._counts = {}
+        # msg_type -> [tokens, last refill time]
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def observe(self, stream, frame):
+        """Count a received frame; returns True if this one should be logged."""
+        msg_type = frame.msg_type
+        key = (stream.meeting_uuid, msg_type)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = _TypeCounts()
+                if self._thread is None:
+                    self._start()
+            counts.messages += 1
+            counts.bytes += len(frame.raw)
+            self.observed += 1
+
+            every = self.sample.get(msg_type, self.sample.get(ANY_MSG_TYPE, 1))
+            if every <= 0 or (every > 1 and (counts.messages - 1) % every):
+                return False
+            rate = self.rate.get(msg_type, self.rate.get(ANY_MSG_TYPE))
+            if rate is not None and not self._take(msg_type, rate):
+                return False
+            counts.logged += 1
+            self.logged += 1
+            return True
+
+    def _take(self, msg_type, rate):
+        if rate <= 0:
+            return False
+        capacity = max(1.0, rate)
+        now = time.monotonic()
+        bucket = self._buckets.get(msg_type)
+        if bucket is None:
+            bucket = self._buckets[msg_type] = [capacity, now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "meetings": len({meeting for meeting, _ in self._counts}),
+                "observed": self.observed,
+                "logged": self.logged,
+                "suppressed": self.observed - self.logged
+            }
+
+    def close(self):
+        """Stop the background thread, logging a final summary in summary mode."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ---- summaries
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="rtms-log-summary", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last = time.monotonic()
+        interval = self.summary_interval if self.summary_interval > 0 else self.RESET_INTERVAL
+        while not self._stopped.wait(interval):
+            last = self._summarise(last)
+        self._summarise(last)
+
+    def _summarise(self, since):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        now = time.monotonic()
+        if self.summary_interval <= 0:
+            return now
+        meetings = {}
+        for (meeting_uuid, msg_type), type_counts in counts.items():
+            meetings.setdefault(meeting_uuid, []).append((msg_type, type_counts))
+        for meeting_uuid, types in meetings.items():
+            self.log.info("Meeting %s, last %.1fs: %s", meeting_uuid, now - since, Lazy(_format_types, types))
+        return now
+
+
+def _format_types(types):
+    parts = []
+    not_logged = 0
+    for msg_type, counts in sorted(types, key=lambda item: (item[0] is None, item[0] or 0)):
+        name = MSG_TYPE_NAMES.get(msg_type, "other") if msg_type is not None else "binary"
+        label = f"{name}({msg_type})" if msg_type is not None else name
+        parts.append(f"{label} {counts.messages} msgs {counts.bytes / 1024:.1f} KB")
+        not_logged += counts.messages - counts.logged
+    return f"{', '.join(parts)}; {not_logged} not logged"
@@ -0,0 +1,359 @@
+"""Prometheus metrics for the RTMS hot paths, without extra dependencies.
+
+The samples only logged lines like "Received audio chunk, total chunks: N",
+which cannot size an instance or point at a slow consumer. `RTMSMetrics`
+collects the numbers that can and serves them in the Prometheus text format
+from a `/metrics` route on the sample's existing Flask or FastAPI app:
+
+- messages and bytes received by msg_type, in total and per meeting
+  (`rate()` of the counters gives messages/sec)
+- time spent decoding each frame's envelope, by msg_type
+- handshake latency, SIGNALING_HAND_SHAKE_REQ -> RESP (1 -> 2) and
+  DATA_HAND_SHAKE_REQ -> RESP (3 -> 4)
+- keep-alive RTT / reply time per socket (from the keep-alive service)
+- stream setup phases from the webhook to the first media packet (queue,
+  DNS, TCP, TLS + upgrade, handshakes), TLS session resumption and DNS
+  cache hits
+- pipeline queue depths and sink write latency, where a sample has them
+
+    metrics = RTMSMetrics()
+    rtms_client = RTMSClient(..., metrics=metrics)
+    metrics.watch_pipeline(media_pipeline)
+    metrics.attach(app)
+
+Counters and histograms are plain dicts keyed by label tuples behind one
+lock each, so recording a frame costs a few dict updates. Per-meeting
+series are dropped when the stream closes.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .keepalive import default_keepalive
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; decode times are micro- to milliseconds, network phases milli- to whole seconds
+DECODE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def remove(self, labels):
+        with self._lock:
+            self._values.pop(labels, None)
+
+    def remove_matching(self, predicate):
+        with self._lock:
+            for labels in [labels for labels in self._values if predicate(labels)]:
+                del self._values[labels]
+
+    def collect(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (plus +Inf), then sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, labels=()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def collect(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, labels, le), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), cumulative
+
+
+class CallbackGauge:
+    """A gauge whose values are read from `callback()` at scrape time.
+
+    `callback` returns an iterable of `(label_values, value)` pairs.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self):
+        for labels, value in self.callback():
+            if value is not None:
+                yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class CallbackCounter(CallbackGauge):
+    """A counter whose values are read from `callback()` at scrape time (a running total kept elsewhere)."""
+
+    kind = "counter"
+
+
+class MetricsRegistry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, callback):
+        return self.register(CallbackGauge(name, documentation, labelnames, callback))
+
+    def callback_counter(self, name, documentation, labelnames, callback):
+        return self.register(CallbackCounter(name, documentation, labelnames, callback))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.collect():
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+            except Exception as e:
+                logger.error(f"Failed to collect metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def _msg_type_label(msg_type):
+    return "binary" if msg_type is None else str(msg_type)
+
+
+class RTMSMetrics:
+    """The RTMS metrics of one process, plus the `/metrics` route that serves them."""
+
+    def __init__(self, registry=None, per_meeting=True):
+        self.registry = registry or MetricsRegistry()
+        self.per_meeting = per_meeting
+        r = self.registry
+
+        self.messages = r.counter(
+            "rtms_messages_total", "RTMS messages received, by msg_type", ["msg_type"])
+        self.bytes = r.counter(
+            "rtms_received_bytes_total", "RTMS message bytes received, by msg_type", ["msg_type"])
+        self.meeting_messages = r.counter(
+            "rtms_meeting_messages_total", "RTMS messages received per running meeting",
+            ["meeting_uuid", "msg_type"])
+        self.meeting_bytes = r.counter(
+            "rtms_meeting_received_bytes_total", "RTMS message bytes received per running meeting",
+            ["meeting_uuid", "msg_type"])
+        self.invalid_frames = r.counter(
+            "rtms_invalid_frames_total", "RTMS protocol messages dropped because they are not valid JSON, by socket",
+            ["socket"])
+        self.decode_seconds = r.histogram(
+            "rtms_decode_seconds", "Time to decode a frame's envelope, by msg_type", ["msg_type"],
+            buckets=DECODE_BUCKETS)
+        self.handshake_seconds = r.histogram(
+            "rtms_handshake_seconds", "Handshake request to response latency (signaling 1->2, media 3->4)",
+            ["phase"])
+        self.sink_write_seconds = r.histogram(
+            "rtms_sink_write_seconds", "Time to write one item to a sink (file, frame store)", ["sink"])
+        self.setup_seconds = r.histogram(
+            "rtms_setup_phase_seconds",
+            "Stream setup phase durations, webhook to first media packet (queued, <socket>_dns/_tcp/_tls_ws, "
+            "first_media, total; handshakes are in rtms_handshake_seconds)", ["phase"])
+
+    # --------------------------------------------------------------- hot path
+
+    def record_frame(self, meeting_uuid, frame, decode_seconds):
+        """Count one received frame and the time it took to decode."""
+        msg_type = _msg_type_label(frame.msg_type)
+        size = len(frame.raw)
+        labels = (msg_type,)
+        self.messages.inc(labels)
+        self.bytes.inc(labels, size)
+        self.decode_seconds.observe(decode_seconds, labels)
+        if self.per_meeting:
+            meeting_labels = (meeting_uuid, msg_type)
+            self.meeting_messages.inc(meeting_labels)
+            self.meeting_bytes.inc(meeting_labels, size)
+
+    def record_invalid_frame(self, channel):
+        self.invalid_frames.inc((channel,))
+
+    def record_handshake(self, phase, seconds):
+        self.handshake_seconds.observe(seconds, (phase,))
+
+    def record_setup_phase(self, phase, seconds):
+        self.setup_seconds.observe(seconds, (phase,))
+
+    def time_sink_write(self, sink):
+        """Context manager timing one sink write: `with metrics.time_sink_write("wav"): ...`."""
+        return self.sink_write_seconds.time((sink,))
+
+    def observe_sink_write(self, sink, seconds):
+        self.sink_write_seconds.observe(seconds, (sink,))
+
+    def stream_closed(self, meeting_uuid):
+        """Drop a finished meeting's per-meeting series."""
+        for counter in (self.meeting_messages, self.meeting_bytes):
+            counter.remove_matching(lambda labels: labels[0] == meeting_uuid)
+
+    # ------------------------------------------------------------ scrape-time
+
+    def watch_client(self, client):
+        """Export the client's stream counts by state."""
+        def streams():
+            for state, count in client.streams.counts()["states"].items():
+                yield (state,), count
+        self.registry.gauge("rtms_streams", "Running RTMS streams, by state", ["state"], streams)
+
+    def watch_keepalive(self, service=None):
+        """Export per-socket keep-alive timings of a `KeepAliveService` (the shared one by default)."""
+        service = service or default_keepalive()
+
+        def values(key, scale):
+            def collect():
+                for name, peer in service.stats()["sockets"].items():
+                    value = peer.get(key)
+                    if value is not None:
+                        yield (name,), value * scale
+            return collect
+        self.registry.gauge(
+            "rtms_keepalive_rtt_seconds", "Last heartbeat round-trip time, for sockets we send heartbeats on",
+            ["socket"], values("rtt_ms", 0.001))
+        self.registry.gauge(
+            "rtms_keepalive_reply_seconds", "Time taken to answer the last keep-alive request from the server",
+            ["socket"], values("reply_ms", 0.001))
+        self.registry.gauge(
+            "rtms_keepalive_idle_seconds", "Time since anything was received on the socket",
+            ["socket"], values("idle_s", 1))
+
+    def watch_connector(self, connector):
+        """Export TLS handshakes (and how many resumed a session) and DNS cache hits of a `Connector`."""
+        def tls():
+            stats = connector.tls_context.stats()
+            yield ("full",), stats["handshakes"] - stats["resumed"]
+            yield ("resumed",), stats["resumed"]
+
+        def dns():
+            stats = connector.dns.stats()
+            yield ("hit",), stats["hits"]
+            yield ("miss",), stats["misses"]
+        self.registry.callback_counter(
+            "rtms_tls_handshakes_total", "TLS handshakes since start, full or resumed", ["kind"], tls)
+        self.registry.callback_counter(
+            "rtms_dns_lookups_total", "Address lookups since start, by cache result", ["result"], dns)
+
+    def watch_pipeline(self, pipeline):
+        """Export queue depth and drops of a `MediaPipeline`, per meeting and msg_type."""
+        def values(key):
+            def collect():
+                for queue_key, queue_stats in pipeline.stats().items():
+                    meeting_uuid, _, msg_type = queue_key.rpartition("/")
+                    yield (meeting_uuid, msg_type), queue_stats[key]
+            return collect
+        self.registry.gauge(
+            "rtms_queue_depth", "Frames waiting in a pipeline queue", ["meeting_uuid", "msg_type"], values("depth"))
+        self.registry.callback_counter(
+            "rtms_queue_dropped_total", "Frames dropped by a pipeline queue since it was created",
+            ["meeting_uuid", "msg_type"], values("dropped"))
+
+    # ------------------------------------------------------------------ route
+
+    def render(self):
+        return self.registry.render()
+
+    def attach(self, app, path="/metrics"):
+        """Add a `GET <path>` route serving the metrics to a Flask or FastAPI app."""
+        if hasattr(app, "add_url_rule"):
+            from flask import Response
+
+            app.add_url_rule(path, "metrics", lambda: Response(self.render(), content_type=CONTENT_TYPE))
+        elif hasattr(app, "add_api_route"):
+            from starlette.responses import Response
+
+            async def metrics_endpoint():
+                return Response(self.render(), media_type=CONTENT_TYPE)
+
+            app.add_api_route(path, metrics_endpoint, methods=["GET"], include_in_schema=False)
+        else:
+            raise TypeError(f"Cannot attach metrics to {type(app).__name__}; expected a Flask or FastAPI app")
+        return app
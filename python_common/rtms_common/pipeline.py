@@ -0,0 +1,245 @@
+"""Bounded receive -> process pipeline for media frames.
+
+`RTMSClient` callbacks run on the event loop that also reads every socket and
+answers keep-alives. A callback that writes to disk stalls all of that, so
+Zoom sees late KEEP_ALIVE_RESPs and drops the stream. `MediaPipeline` moves
+the work to a small thread pool behind bounded queues, one per meeting and
+msg_type, so a slow sink only ever affects its own queue. Keep-alives never
+enter a queue: the client answers them before the callback runs.
+
+When a queue is full its overflow policy decides what happens:
+
+- `DROP_OLDEST` discards the oldest queued frame (video: the newest frame is
+  the one worth keeping)
+- `DROP_NEWEST` discards the incoming frame
+- `BLOCK` waits for space, up to `block_timeout`, then drops the incoming
+  frame. This pushes back on the socket reader, so only use it when the
+  caller is allowed to wait.
+- `SPILL` appends the overflow to a temporary file and replays it in order
+  once the queue drains (audio: nothing is lost, memory stays bounded)
+"""
+import collections
+import logging
+import queue
+import struct
+import tempfile
+import threading
+
+from .frames import MediaFrame
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+SPILL = "spill"
+
+_SPILL_HEADER = struct.Struct("<?iI")  # raw is bytes, msg_type (-1 = None), length
+
+
+class FrameQueue:
+    """Bounded FIFO of frames for one meeting and msg_type."""
+
+    def __init__(self, meeting_uuid, msg_type, maxsize, policy):
+        self.meeting_uuid = meeting_uuid
+        self.msg_type = msg_type
+        self.maxsize = maxsize
+        self.policy = policy
+        self.stream = None
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.high_water = 0
+
+        self.closed = False
+        self.scheduled = False
+        self._frames = collections.deque()
+        self._spill = None
+        self._spill_read = 0
+        self._spill_write = 0
+        self._spill_pending = 0
+        self._not_full = threading.Condition(threading.Lock())
+
+    @property
+    def depth(self):
+        return len(self._frames) + self._spill_pending
+
+    def put(self, frame, block_timeout):
+        """Queue a frame under this queue's policy; False if a frame was dropped."""
+        with self._not_full:
+            accepted = True
+            if self._spill_pending or len(self._frames) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self._frames.popleft()
+                    self.dropped += 1
+                    accepted = False
+                elif self.policy == SPILL:
+                    self._spill_frame(frame)
+                    self.enqueued += 1
+                    return True
+                elif self.policy == BLOCK and self._not_full.wait_for(
+                        lambda: len(self._frames) < self.maxsize, block_timeout):
+                    pass
+                else:
+                    self.dropped += 1
+                    return False
+            self._frames.append(frame)
+            self.enqueued += 1
+            self.high_water = max(self.high_water, self.depth)
+            return accepted
+
+    def get(self):
+        """Pop the next frame in arrival order, or None when empty."""
+        with self._not_full:
+            if self._frames:
+                frame = self._frames.popleft()
+            elif self._spill_pending:
+                frame = self._unspill_frame()
+            else:
+                return None
+            self._not_full.notify()
+            return frame
+
+    def discard(self):
+        with self._not_full:
+            self._frames.clear()
+            self._spill_pending = 0
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+            self._not_full.notify_all()
+
+    def _spill_frame(self, frame):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        raw = frame.raw
+        is_bytes = isinstance(raw, (bytes, bytearray))
+        data = bytes(raw) if is_bytes else raw.encode()
+        msg_type = -1 if frame.msg_type is None else frame.msg_type
+        self._spill.seek(self._spill_write)
+        self._spill.write(_SPILL_HEADER.pack(is_bytes, msg_type, len(data)))
+        self._spill.write(data)
+        self._spill_write = self._spill.tell()
+        self._spill_pending += 1
+        self.spilled += 1
+        self.high_water = max(self.high_water, self.depth)
+
+    def _unspill_frame(self):
+        self._spill.seek(self._spill_read)
+        is_bytes, msg_type, length = _SPILL_HEADER.unpack(self._spill.read(_SPILL_HEADER.size))
+        data = self._spill.read(length)
+        self._spill_read = self._spill.tell()
+        self._spill_pending -= 1
+        if not self._spill_pending:
+            # Fully drained; reuse the file from the start
+            self._spill.truncate(0)
+            self._spill_read = self._spill_write = 0
+        raw = data if is_bytes else data.decode()
+        return MediaFrame(raw, None if msg_type == -1 else msg_type)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "high_water": self.high_water
+        }
+
+
+class MediaPipeline:
+    """Run `handler(stream, frame)` on worker threads behind bounded queues.
+
+    `policies` maps msg_type to an overflow policy; other types use
+    `default_policy`. Frames of one meeting and msg_type are always handled
+    in order and by one thread at a time.
+    """
+
+    def __init__(self, handler, maxsize=64, policies=None, default_policy=DROP_OLDEST,
+                 workers=4, block_timeout=1.0, batch_size=16):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policies = policies or {}
+        self.default_policy = default_policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._ready = queue.SimpleQueue()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"media-pipeline-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, stream, frame):
+        """Queue a frame for processing; returns False if a frame was dropped."""
+        key = (stream.meeting_uuid, frame.msg_type)
+        with self._lock:
+            frame_queue = self._queues.get(key)
+            if frame_queue is None:
+                policy = self.policies.get(frame.msg_type, self.default_policy)
+                frame_queue = self._queues[key] = FrameQueue(stream.meeting_uuid, frame.msg_type, self.maxsize, policy)
+            frame_queue.stream = stream
+        accepted = frame_queue.put(frame, self.block_timeout)
+        if not accepted and frame_queue.dropped % 100 == 1:
+            logger.warning(f"Media queue full for meeting {stream.meeting_uuid} msg_type {frame.msg_type}, "
+                           f"{frame_queue.dropped} frames dropped")
+        self._schedule(frame_queue)
+        return accepted
+
+    def close(self, meeting_uuid, drain=True):
+        """Forget a meeting's queues, after processing what is queued if `drain`."""
+        with self._lock:
+            for key in [key for key in self._queues if key[0] == meeting_uuid]:
+                frame_queue = self._queues.pop(key)
+                frame_queue.closed = True
+                if not drain:
+                    frame_queue.discard()
+
+    def stats(self):
+        """Per-queue depth and counters, keyed by "meeting_uuid/msg_type"."""
+        with self._lock:
+            queues = list(self._queues.values())
+        return {f"{q.meeting_uuid}/{q.msg_type}": q.stats() for q in queues}
+
+    def totals(self):
+        totals = collections.Counter()
+        for queue_stats in self.stats().values():
+            totals.update(queue_stats)
+        totals.pop("high_water", None)
+        return dict(totals)
+
+    # --------------------------------------------------------------- workers
+
+    def _schedule(self, frame_queue):
+        with self._lock:
+            if frame_queue.scheduled:
+                return
+            frame_queue.scheduled = True
+        self._ready.put(frame_queue)
+
+    def _work(self):
+        while True:
+            frame_queue = self._ready.get()
+            for _ in range(self.batch_size):
+                frame = frame_queue.get()
+                if frame is None:
+                    break
+                try:
+                    self.handler(frame_queue.stream, frame)
+                except Exception as e:
+                    logger.error(f"Error processing media for meeting {frame_queue.meeting_uuid}: {e}")
+                frame_queue.processed += 1
+            with self._lock:
+                frame_queue.scheduled = False
+                if not frame_queue.depth:
+                    continue
+                frame_queue.scheduled = True
+            # More frames are waiting; requeue behind other meetings to stay fair
+            self._ready.put(frame_queue)
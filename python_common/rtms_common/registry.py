@@ -0,0 +1,141 @@
+"""Registry of the RTMS streams a process is running.
+
+A module-level `active_connections` dict mutated from webhook handlers,
+socket callbacks and stop handlers has no locking and no index by stream
+id, and closing a meeting's sockets one after the other makes a burst of
+`meeting.rtms_stopped` events wait on every slow close handshake in turn.
+`ActiveConnectionRegistry` keeps each stream under its meeting UUID and its
+stream id behind one lock, so both lookups are O(1) from any thread, and
+closes sockets concurrently with a bounded wait:
+
+    registry.add(stream)
+    registry.by_stream_id(stream_id)
+    await registry.close(meeting_uuid)            # both sockets at once
+    await registry.close_many(meeting_uuids)      # every meeting at once
+"""
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveConnectionRegistry:
+    """Streams indexed by meeting UUID and stream id, safe to update from any thread.
+
+    Stored objects need `meeting_uuid`, `stream_id`, `signaling` and `media`
+    attributes (an `RTMSStream`); `state` is used by `counts()` if present.
+    """
+
+    def __init__(self, close_timeout=5.0):
+        self.close_timeout = close_timeout
+        self.added = 0
+        self.closed = 0
+
+        self._by_meeting = {}
+        self._by_stream = {}
+        self._lock = threading.Lock()
+
+    def add(self, stream):
+        """Register `stream`; returns the stream it replaced for that meeting, if any."""
+        with self._lock:
+            previous = self._by_meeting.get(stream.meeting_uuid)
+            if previous is not None:
+                self._by_stream.pop(previous.stream_id, None)
+            self._by_meeting[stream.meeting_uuid] = stream
+            self._by_stream[stream.stream_id] = stream
+            self.added += 1
+        return previous
+
+    def remove(self, stream):
+        """Unregister `stream` if it is still the meeting's current stream."""
+        with self._lock:
+            if self._by_meeting.get(stream.meeting_uuid) is not stream:
+                return False
+            del self._by_meeting[stream.meeting_uuid]
+            if self._by_stream.get(stream.stream_id) is stream:
+                del self._by_stream[stream.stream_id]
+            return True
+
+    def pop(self, meeting_uuid):
+        """Unregister and return a meeting's stream (None if there is none)."""
+        with self._lock:
+            stream = self._by_meeting.pop(meeting_uuid, None)
+            if stream is not None and self._by_stream.get(stream.stream_id) is stream:
+                del self._by_stream[stream.stream_id]
+            return stream
+
+    def get(self, meeting_uuid, default=None):
+        with self._lock:
+            return self._by_meeting.get(meeting_uuid, default)
+
+    def by_stream_id(self, stream_id):
+        with self._lock:
+            return self._by_stream.get(stream_id)
+
+    def items(self):
+        """A snapshot of `(meeting_uuid, stream)` pairs."""
+        with self._lock:
+            return list(self._by_meeting.items())
+
+    def meetings(self):
+        with self._lock:
+            return list(self._by_meeting)
+
+    def __contains__(self, meeting_uuid):
+        with self._lock:
+            return meeting_uuid in self._by_meeting
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_meeting)
+
+    def counts(self):
+        """Live numbers: streams, open sockets and streams per state."""
+        with self._lock:
+            streams = list(self._by_meeting.values())
+        states = {}
+        for stream in streams:
+            state = getattr(stream, "state", None)
+            states[state] = states.get(state, 0) + 1
+        return {
+            "streams": len(streams),
+            "signaling_sockets": sum(1 for stream in streams if stream.signaling is not None),
+            "media_sockets": sum(1 for stream in streams if stream.media is not None),
+            "states": states,
+            "added": self.added,
+            "closed": self.closed
+        }
+
+    # ---------------------------------------------------------------- closing
+
+    async def close(self, meeting_uuid):
+        """Unregister a meeting and close its sockets concurrently; returns the stream."""
+        stream = self.pop(meeting_uuid)
+        if stream is None:
+            return None
+        await self.close_sockets(stream)
+        return stream
+
+    async def close_many(self, meeting_uuids=None):
+        """Close several meetings (all of them by default) at once; returns the closed streams."""
+        if meeting_uuids is None:
+            meeting_uuids = self.meetings()
+        streams = await asyncio.gather(*(self.close(meeting_uuid) for meeting_uuid in meeting_uuids))
+        return [stream for stream in streams if stream is not None]
+
+    async def close_sockets(self, stream):
+        sockets = [ws for ws in (stream.media, stream.signaling) if ws is not None]
+        if sockets:
+            await asyncio.gather(*(self._close_socket(stream, ws) for ws in sockets))
+        with self._lock:
+            self.closed += 1
+
+    async def _close_socket(self, stream, ws):
+        # A peer that never answers the close handshake must not hold up the others
+        try:
+            await asyncio.wait_for(ws.close(), self.close_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out closing a socket for meeting {stream.meeting_uuid}")
+        except Exception as e:
+            logger.debug(f"Error closing socket for {stream.meeting_uuid}: {e}")
@@ -0,0 +1,189 @@
+"""Durable retry queue backed by SQLite.
+
+Keeping failed items in a JSON list means rewriting the whole file on every
+save and scanning the list for every lookup. `RetryQueue` stores one row per
+item id in a SQLite table (WAL mode, so each update is a small append that
+survives a crash), with an index on the next attempt time:
+
+- `record_failure(item_id, item)` upserts the item and schedules its next
+  attempt with exponential backoff and jitter
+- `remove(item_id)` deletes it after a success
+- `due()` returns the items whose next attempt has come
+- `select(candidates)` merges a fresh candidate list with the due items and
+  leaves out candidates that are still waiting out their backoff
+- `compact()` checkpoints the WAL and vacuums once a quarter of the file is
+  free pages; it also runs automatically every `compact_every` deletes
+
+Every operation is O(log n) in the number of queued items.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS retries (
+    id TEXT PRIMARY KEY,
+    item TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS retries_next_attempt ON retries (next_attempt);
+"""
+
+
+class RetryQueue:
+    """Failed items keyed by id, each with its own backoff schedule."""
+
+    def __init__(self, path, base_delay=30.0, max_delay=3600.0, max_attempts=0, compact_every=1000):
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.compact_every = compact_every
+
+        self._deleted = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def record_failure(self, item_id, item, error=None):
+        """Queue `item` (or bump its attempt count) and schedule the next try."""
+        item_id = str(item_id)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM retries WHERE id = ?", (item_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            if self.max_attempts and attempts > self.max_attempts:
+                logger.warning(f"Giving up on {item_id} after {attempts - 1} attempts")
+                self._delete(item_id)
+                return None
+            next_attempt = now + self._delay(attempts)
+            self._db.execute(
+                "INSERT INTO retries (id, item, attempts, next_attempt, last_error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET item = excluded.item, attempts = excluded.attempts, "
+                "next_attempt = excluded.next_attempt, last_error = excluded.last_error, "
+                "updated_at = excluded.updated_at",
+                (item_id, json.dumps(item), attempts, next_attempt, None if error is None else str(error), now)
+            )
+        return next_attempt
+
+    def remove(self, item_id):
+        """Forget an item, e.g. after it finally succeeded."""
+        with self._lock:
+            self._delete(str(item_id))
+
+    def due(self, now=None, limit=None):
+        """Items whose next attempt is at or before `now`, oldest schedule first."""
+        now = time.time() if now is None else now
+        query = "SELECT item FROM retries WHERE next_attempt <= ? ORDER BY next_attempt"
+        params = (now,)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            return [json.loads(item) for (item,) in self._db.execute(query, params)]
+
+    def pending_ids(self, now=None):
+        """Ids of the items still waiting out their backoff at `now`."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {item_id for (item_id,) in self._db.execute(
+                "SELECT id FROM retries WHERE next_attempt > ?", (now,))}
+
+    def select(self, candidates, key="id", now=None):
+        """Items to try now: `candidates` not in backoff, plus the queued items that are due.
+
+        A candidate that failed before is only tried again once its backoff
+        has passed, even if it is still in the fresh list.
+        """
+        now = time.time() if now is None else now
+        pending = self.pending_ids(now)
+        selected = {}
+        for item in list(candidates) + self.due(now):
+            item_id = str(item[key])
+            if item_id not in pending:
+                selected.setdefault(item_id, item)
+        return list(selected.values())
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT item, attempts, next_attempt, last_error FROM retries WHERE id = ?", (str(item_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"item": json.loads(row[0]), "attempts": row[1], "next_attempt": row[2], "last_error": row[3]}
+
+    def __contains__(self, item_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM retries WHERE id = ?", (str(item_id),)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM retries").fetchone()[0]
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            total, due = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(next_attempt <= ?), 0) FROM retries", (now,)
+            ).fetchone()
+        return {"queued": total, "due": due}
+
+    def compact(self):
+        """Fold the WAL into the database and reclaim space left by deleted rows."""
+        with self._lock:
+            self._compact()
+
+    def import_json(self, json_path, key="id"):
+        """Queue every item of a legacy JSON list (due immediately) and rename the file."""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path) as f:
+            items = json.load(f)
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO retries (id, item, attempts, next_attempt, last_error, updated_at) "
+                "VALUES (?, ?, 0, ?, NULL, ?)",
+                [(str(item[key]), json.dumps(item), now, now) for item in items]
+            )
+        os.replace(json_path, f"{json_path}.imported")
+        logger.info(f"Imported {len(items)} items from {json_path}")
+        return len(items)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _delete(self, item_id):
+        # Caller holds self._lock
+        if self._db.execute("DELETE FROM retries WHERE id = ?", (item_id,)).rowcount:
+            self._deleted += 1
+            if self.compact_every and self._deleted >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        # Caller holds self._lock
+        self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        free_pages = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+        if pages and free_pages / pages > 0.25:
+            self._db.execute("VACUUM")
+        self._deleted = 0
+
+    def _delay(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        # +/-20% jitter so items that failed together are not retried together
+        return delay * random.uniform(0.8, 1.2)
@@ -0,0 +1,189 @@
+"""Cached, paginated Zoom Room inventory.
+
+`GET /rooms` returns at most `page_size` rooms per call plus a
+`next_page_token`; reading only the first page silently ignores every other
+room on large accounts. `RoomInventory` follows the tokens (requesting the
+next page while the current one is being consumed, since a page token is
+only known once the previous page arrives) and caches the result:
+
+- within `ttl` seconds the cached list is returned without any API call
+- after that every page is revalidated with its own page token and
+  `If-None-Match` (all pages at once). Only if every page answers `304` is
+  the cache kept, with its age reset; any other answer (a changed page, an
+  expired page token) drops it and the whole list is fetched again
+- up to `max_stale` seconds after the last successful fetch or
+  revalidation, a stale list is returned immediately while the refresh runs
+  in the background; after that callers wait for the refresh, so a room
+  that stopped being available is not served for longer than `max_stale`
+- with `cache_path` the list survives restarts, so a join sweep started
+  within the TTL of the previous one does no listing at all
+
+Each full fetch also reports which room ids were added or removed.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RoomInventory:
+    """List Zoom Rooms through a `ZoomAPIClient`, following pagination, with a TTL cache."""
+
+    def __init__(self, api, status="available", page_size=300, ttl=300, max_stale=600, cache_path=None):
+        self.api = api
+        self.status = status
+        self.page_size = page_size
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.cache_path = cache_path
+
+        self.fetched_at = 0.0
+        # (next_page_token used to request the page, its ETag) per page of the cached list
+        self.pages = []
+        self.fetches = 0
+        self.revalidated = 0
+        self.last_changes = {"added": [], "removed": []}
+
+        self._rooms = None
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._load()
+
+    def rooms(self, force=False):
+        """Return the room list, fetching or revalidating it only when needed."""
+        with self._lock:
+            age = time.time() - self.fetched_at
+            if self._rooms is not None and not force:
+                if age < self.ttl:
+                    return list(self._rooms.values())
+                if age < self.max_stale:
+                    # Serve the stale list now and refresh behind it
+                    self._refresh_in_background()
+                    return list(self._rooms.values())
+        return self.refresh()
+
+    def refresh(self):
+        """Fetch (or revalidate) the full list now and return it."""
+        if self._rooms is not None and self._revalidate():
+            with self._lock:
+                self.fetched_at = time.time()
+                self.revalidated += 1
+                rooms = list(self._rooms.values())
+            logger.info(f"🏢 Room list unchanged ({len(rooms)} rooms), keeping cache.")
+            self._save()
+            return rooms
+
+        rooms = {}
+        pages = []
+        for token, etag, page in self._pages():
+            rooms.update((room["id"], room) for room in page)
+            pages.append((token, etag))
+
+        with self._lock:
+            previous = self._rooms or {}
+            self.last_changes = {
+                "added": [room_id for room_id in rooms if room_id not in previous],
+                "removed": [room_id for room_id in previous if room_id not in rooms]
+            }
+            self._rooms = rooms
+            self.pages = pages
+            self.fetched_at = time.time()
+            self.fetches += 1
+        logger.info(f"🏢 Fetched {len(rooms)} rooms "
+                    f"(+{len(self.last_changes['added'])} / -{len(self.last_changes['removed'])}).")
+        self._save()
+        return list(rooms.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rooms": len(self._rooms or {}),
+                "age_s": round(time.time() - self.fetched_at, 1) if self._rooms is not None else None,
+                "fetches": self.fetches,
+                "revalidated": self.revalidated
+            }
+
+    # ----------------------------------------------------------------- paging
+
+    def _params(self, token=None):
+        params = {"page_size": self.page_size}
+        if self.status:
+            params["status"] = self.status
+        if token:
+            params["next_page_token"] = token
+        return params
+
+    def _revalidate(self):
+        """True if every cached page is unchanged (`304`)."""
+        with self._lock:
+            pages = list(self.pages)
+        if not pages or not all(etag for _, etag in pages):
+            return False
+        pending = [
+            self.api.submit("GET", "/rooms", params=self._params(token), headers={"If-None-Match": etag})
+            for token, etag in pages
+        ]
+        # Wait for every request, even once one page has changed
+        return all([future.result().status_code == 304 for future in pending])
+
+    def _pages(self):
+        """Yield (page token, ETag, rooms) for each page of the full list."""
+        token = None
+        pending = self.api.submit("GET", "/rooms", params=self._params())
+        while pending is not None:
+            response = pending.result()
+            response.raise_for_status()
+            data = response.json()
+            next_token = data.get("next_page_token")
+            # Request the next page before handing this one to the caller
+            pending = self.api.submit("GET", "/rooms", params=self._params(next_token)) if next_token else None
+            yield token, response.headers.get("ETag"), data.get("rooms", [])
+            token = next_token
+
+    def _refresh_in_background(self):
+        # Caller holds self._lock
+        if self._refreshing is not None and self._refreshing.is_alive():
+            return
+        self._refreshing = threading.Thread(target=self._background_refresh, name="room-inventory", daemon=True)
+        self._refreshing.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"⚠️ Background room list refresh failed: {e}")
+
+    # ------------------------------------------------------------ persistence
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable room cache {self.cache_path}: {e}")
+            return
+        if cached.get("status") != self.status:
+            return
+        self._rooms = {room["id"]: room for room in cached.get("rooms", [])}
+        self.fetched_at = cached.get("fetched_at", 0.0)
+        self.pages = [tuple(page) for page in cached.get("pages", [])]
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            cached = {
+                "status": self.status,
+                "fetched_at": self.fetched_at,
+                "pages": self.pages,
+                "rooms": list(self._rooms.values())
+            }
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, self.cache_path)
@@ -0,0 +1,125 @@
+"""Background session runner for threaded (WSGI) webhook servers.
+
+A webhook handler must answer Zoom within a few seconds, but an RTMS stream
+lives as long as the meeting. `SessionRunner` decouples the two: the handler
+only enqueues a start/stop job and returns, and a dedicated event-loop thread
+(the `RTMSClient` background loop) drains the queue and runs the streams.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRunner:
+    """Queue stream-start jobs from any thread and run them on the client's loop.
+
+    `max_concurrent_streams` (0 = unlimited) bounds how many streams run at
+    once; further starts wait in the queue. `max_pending` bounds the queue
+    itself, and `submit_start` returns False once it is full.
+    """
+
+    def __init__(self, client, max_concurrent_streams=0, max_pending=10000):
+        self.client = client
+        self.max_concurrent_streams = max_concurrent_streams
+        self.max_pending = max_pending
+
+        self.started = 0
+        self.rejected = 0
+        self.running = 0
+        self._pending = 0
+        self._queued = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._jobs = None
+        self._slots = None
+
+    def start(self):
+        """Start the event-loop thread and the queue consumer (idempotent)."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = self.client.start_background()
+        asyncio.run_coroutine_threadsafe(self._consume(), self._loop)
+
+    def submit_start(self, meeting_uuid, stream_id, server_urls):
+        """Enqueue a stream start; returns immediately. False if the queue is full."""
+        self.start()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                logger.warning(f"Session queue full, rejecting stream for meeting {meeting_uuid}")
+                return False
+            self._pending += 1
+            self._queued[meeting_uuid] = self._queued.get(meeting_uuid, 0) + 1
+            self._cancelled.discard(meeting_uuid)
+        job = (meeting_uuid, stream_id, server_urls, time.monotonic())
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+        return True
+
+    def submit_stop(self, meeting_uuid):
+        """Stop a running stream, or drop it if it is still waiting in the queue."""
+        self.start()
+        with self._lock:
+            if meeting_uuid in self._queued:
+                self._cancelled.add(meeting_uuid)
+        return asyncio.run_coroutine_threadsafe(self.client.stop_stream(meeting_uuid), self._loop)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "running": self.running,
+                "started": self.started,
+                "rejected": self.rejected
+            }
+
+    # ------------------------------------------------------------ event loop
+
+    def _enqueue(self, job):
+        if self._jobs is None:
+            self._jobs = asyncio.Queue()
+        self._jobs.put_nowait(job)
+
+    async def _consume(self):
+        if self._jobs is None:
+            self._jobs = asyncio.Queue()
+        if self.max_concurrent_streams:
+            self._slots = asyncio.Semaphore(self.max_concurrent_streams)
+
+        while True:
+            meeting_uuid, stream_id, server_urls, queued_at = await self._jobs.get()
+            if self._slots is not None:
+                await self._slots.acquire()
+
+            with self._lock:
+                self._pending -= 1
+                self._queued[meeting_uuid] -= 1
+                if not self._queued[meeting_uuid]:
+                    del self._queued[meeting_uuid]
+                if meeting_uuid in self._cancelled:
+                    self._cancelled.discard(meeting_uuid)
+                    cancelled = True
+                else:
+                    cancelled = False
+                    self.started += 1
+                    self.running += 1
+            if cancelled:
+                logger.info(f"Skipping stream for meeting {meeting_uuid}, stopped while queued")
+                if self._slots is not None:
+                    self._slots.release()
+                continue
+
+            logger.debug(f"Starting stream for meeting {meeting_uuid} after {time.monotonic() - queued_at:.3f}s in queue")
+            # Setup timings include the time spent waiting in the queue
+            task = self.client.start_stream(meeting_uuid, stream_id, server_urls, queued_at)
+            task.add_done_callback(self._on_stream_done)
+
+    def _on_stream_done(self, task):
+        with self._lock:
+            self.running -= 1
+        if self._slots is not None:
+            self._slots.release()
@@ -0,0 +1,237 @@
+"""A single-thread hashed timer wheel for delayed jobs.
+
+Sleeping one thread per delayed action (leave this room in 30 s, stop that
+stream in 10 s) costs a thread and a stack per job and cannot be cancelled.
+`TimerWheel` keeps every pending job in one wheel of `slots` buckets that a
+single thread advances every `tick` seconds; scheduling and cancelling are
+O(1), and a job fires within one tick of its deadline. Jobs run on the wheel
+thread unless an `executor` is given, so slow jobs (HTTP calls) should pass
+one. The wheel also records how late jobs fired (`stats()["drift_ms_*"]`).
+
+`DelayedJobStore` adds named, persisted jobs on top of a wheel: pending jobs
+are kept in SQLite and rescheduled after a restart, scheduling a key again
+replaces its job, and jobs that come due within `batch_window` of each other
+are handed to the callback together.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """A scheduled job; `cancel()` it to stop it from running."""
+
+    __slots__ = ("deadline", "callback", "args", "rounds", "cancelled")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.rounds = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Run callbacks after a delay, all from one thread."""
+
+    def __init__(self, tick=0.1, slots=512, executor=None, name="timer-wheel"):
+        self.tick = tick
+        self.slots = slots
+        self.executor = executor
+        self.name = name
+
+        self.fired = 0
+        self.cancelled = 0
+        self._drift_total = 0.0
+        self._drift_max = 0.0
+
+        self._wheel = [[] for _ in range(slots)]
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._position = 0
+        self._pending = 0
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def call_later(self, delay, callback, *args):
+        """Run `callback(*args)` in `delay` seconds; returns a `TimerHandle`."""
+        return self.call_at(time.monotonic() + max(0.0, delay), callback, *args)
+
+    def call_at(self, deadline, callback, *args):
+        """Run `callback(*args)` at `deadline` (a `time.monotonic()` value)."""
+        self.start()
+        handle = TimerHandle(deadline, callback, args)
+        with self._lock:
+            # Ticks from now until the deadline, rounded up so jobs never fire early
+            ticks = max(1, -int(-(deadline - self._started_at) // self.tick) - self._position)
+            handle.rounds = (ticks - 1) // self.slots
+            self._wheel[(self._position + ticks) % self.slots].append(handle)
+            self._pending += 1
+        return handle
+
+    def start(self):
+        """Start the wheel thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "fired": self.fired,
+                "cancelled": self.cancelled,
+                "drift_ms_avg": round(self._drift_total / self.fired * 1000, 3) if self.fired else 0.0,
+                "drift_ms_max": round(self._drift_max * 1000, 3)
+            }
+
+    # ----------------------------------------------------------------- thread
+
+    def _run(self):
+        while not self._stopped.is_set():
+            next_tick = self._started_at + (self._position + 1) * self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+
+            with self._lock:
+                self._position += 1
+                slot = self._position % self.slots
+                due, waiting = [], []
+                for handle in self._wheel[slot]:
+                    if handle.cancelled:
+                        self._pending -= 1
+                        self.cancelled += 1
+                    elif handle.rounds:
+                        handle.rounds -= 1
+                        waiting.append(handle)
+                    else:
+                        self._pending -= 1
+                        due.append(handle)
+                self._wheel[slot] = waiting
+
+            now = time.monotonic()
+            for handle in due:
+                drift = max(0.0, now - handle.deadline)
+                with self._lock:
+                    self.fired += 1
+                    self._drift_total += drift
+                    self._drift_max = max(self._drift_max, drift)
+                if self.executor is not None:
+                    self.executor.submit(self._fire, handle)
+                else:
+                    self._fire(handle)
+
+    @staticmethod
+    def _fire(handle):
+        if handle.cancelled:
+            return
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            logger.error(f"Scheduled job {getattr(handle.callback, '__name__', handle.callback)} failed: {e}")
+
+
+class DelayedJobStore:
+    """Persisted, cancellable delayed jobs keyed by name, delivered in batches.
+
+    `on_due(batch)` receives a list of `(key, payload)` tuples on the wheel
+    thread (or its executor) and should hand slow work off quickly.
+    """
+
+    def __init__(self, wheel, path, on_due, batch_window=0.5):
+        self.wheel = wheel
+        self.on_due = on_due
+        self.batch_window = batch_window
+        self.batches = 0
+
+        self._handles = {}
+        self._batch = []
+        self._flush_handle = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, payload TEXT NOT NULL, run_at REAL NOT NULL)")
+        self._restore()
+
+    def schedule(self, key, delay, payload=None):
+        """Run the job `key` in `delay` seconds, replacing any pending job with that key."""
+        run_at = time.time() + delay
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (key, payload, run_at) VALUES (?, ?, ?)",
+                (key, json.dumps(payload), run_at)
+            )
+            self._arm(key, payload, run_at)
+
+    def cancel(self, key):
+        """Cancel a pending job; returns True if there was one."""
+        with self._lock:
+            handle = self._handles.pop(key, None)
+            self._db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    def pending(self):
+        with self._lock:
+            return list(self._handles)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._handles)
+        return {"pending_jobs": pending, "batches": self.batches, **self.wheel.stats()}
+
+    def _arm(self, key, payload, run_at):
+        # Caller holds self._lock
+        previous = self._handles.get(key)
+        if previous is not None:
+            previous.cancel()
+        deadline = time.monotonic() + max(0.0, run_at - time.time())
+        self._handles[key] = self.wheel.call_at(deadline, self._on_job_due, key, payload, run_at)
+
+    def _restore(self):
+        rows = self._db.execute("SELECT key, payload, run_at FROM jobs").fetchall()
+        with self._lock:
+            for key, payload, run_at in rows:
+                # Jobs that came due while the process was down run right away
+                self._arm(key, json.loads(payload), run_at)
+        if rows:
+            logger.info(f"Restored {len(rows)} pending scheduled jobs")
+
+    def _on_job_due(self, key, payload, run_at):
+        with self._lock:
+            # The key may have been scheduled again since this job fired
+            handle = self._handles.get(key)
+            if handle is not None and handle.args[2] == run_at:
+                del self._handles[key]
+            self._batch.append((key, payload, run_at))
+            if self._flush_handle is None:
+                self._flush_handle = self.wheel.call_later(self.batch_window, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            batch, self._batch = self._batch, []
+            self._flush_handle = None
+            # Match run_at too, so a job rescheduled within batch_window keeps its new row
+            self._db.executemany(
+                "DELETE FROM jobs WHERE key = ? AND run_at = ?",
+                [(key, run_at) for key, _, run_at in batch]
+            )
+            self.batches += 1
+        if batch:
+            self.on_due([(key, payload) for key, payload, _ in batch])
@@ -0,0 +1,201 @@
+"""Spread RTMS streams over several worker processes.
+
+One interpreter holds the GIL for all JSON, base64 and HMAC work, so a single
+process tops out at one core no matter how many meetings it serves.
+`ShardedWorkerPool` runs N worker processes, each with its own `RTMSClient`,
+and routes every meeting to one of them with a consistent hash of its
+`meeting_uuid`. Start/stop events are forwarded over a per-worker
+`multiprocessing.Queue`, and a supervisor thread restarts crashed workers
+and resubmits the streams they owned. Workers report every stream that ends
+(stopped, or given up after its reconnects) on a shared result queue, so a
+meeting that is over is not started again when its worker restarts.
+
+Workers are started with "forkserver" (or "spawn" where that is missing)
+rather than "fork": the pool starts on the first webhook, from a process
+that already runs server and log writer threads, and a forked child can
+inherit a lock one of those threads was holding.
+"""
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _ring_hash(key):
+    # Stable across processes and restarts, unlike hash()
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to shard indexes."""
+
+    def __init__(self, shards, replicas=64):
+        points = sorted(
+            (_ring_hash(f"{shard}:{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        i = bisect.bisect(self._hashes, _ring_hash(key)) % len(self._hashes)
+        return self._shards[i]
+
+
+def _worker_main(index, jobs, results, client_factory):
+    """Worker process: run a client on a background loop and apply queued jobs.
+
+    Puts `("ended", meeting_uuid, stream_id)` on `results` when a stream stops running.
+    """
+    client = client_factory()
+    client.start_background()
+    logger.info(f"RTMS worker {index} started")
+
+    def report_end(meeting_uuid, stream_id):
+        def done(future):
+            # run_stream also returns at once for a stream that is already running
+            running = client.streams.get(meeting_uuid)
+            if running is None or running.stream_id != stream_id:
+                results.put(("ended", meeting_uuid, stream_id))
+        return done
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        action, args = job
+        if action == "start":
+            meeting_uuid, stream_id, _ = args
+            client.submit_stream(*args).add_done_callback(report_end(meeting_uuid, stream_id))
+        elif action == "stop":
+            client.submit_stop(*args)
+    logger.info(f"RTMS worker {index} exiting")
+
+
+def _default_start_method():
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+class ShardedWorkerPool:
+    """Route each meeting's stream to one of `workers` processes.
+
+    `client_factory` is called inside each worker to build its `RTMSClient`;
+    it must be a module-level function so it can be pickled, and its module
+    is imported again in every worker.
+    """
+
+    def __init__(self, workers, client_factory, check_interval=1.0, start_method=None):
+        self.workers = workers
+        self.client_factory = client_factory
+        self.check_interval = check_interval
+        self.restarts = 0
+
+        self._ctx = multiprocessing.get_context(start_method or _default_start_method())
+        self._ring = HashRing(workers)
+        self._processes = [None] * workers
+        self._queues = [None] * workers
+        # Streams that ended in any worker, as ("ended", meeting_uuid, stream_id)
+        self._results = self._ctx.Queue()
+        # Last start event per meeting, replayed if its worker has to be restarted
+        self._owned = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._supervisor = None
+
+    def start(self):
+        """Start the worker processes and the supervisor thread (idempotent)."""
+        with self._lock:
+            if self._supervisor is not None:
+                return
+            for index in range(self.workers):
+                self._spawn(index)
+            self._supervisor = threading.Thread(target=self._supervise, name="rtms-supervisor", daemon=True)
+            self._supervisor.start()
+
+    def shard_for(self, meeting_uuid):
+        return self._ring.shard_for(meeting_uuid)
+
+    def submit_start(self, meeting_uuid, stream_id, server_urls):
+        """Forward a stream start to the worker that owns the meeting."""
+        self.start()
+        index = self.shard_for(meeting_uuid)
+        with self._lock:
+            self._owned[meeting_uuid] = (stream_id, server_urls)
+            self._queues[index].put(("start", (meeting_uuid, stream_id, server_urls)))
+        logger.debug(f"Meeting {meeting_uuid} routed to worker {index}")
+
+    def submit_stop(self, meeting_uuid):
+        """Forward a stream stop to the worker that owns the meeting."""
+        self.start()
+        index = self.shard_for(meeting_uuid)
+        with self._lock:
+            self._owned.pop(meeting_uuid, None)
+            self._queues[index].put(("stop", (meeting_uuid,)))
+
+    def stats(self):
+        self._collect_results()
+        with self._lock:
+            alive = sum(1 for process in self._processes if process is not None and process.is_alive())
+            return {"workers": self.workers, "alive": alive, "restarts": self.restarts, "meetings": len(self._owned)}
+
+    def shutdown(self, timeout=5.0):
+        """Ask every worker to exit and wait for them."""
+        self._stopped.set()
+        with self._lock:
+            for queue in self._queues:
+                if queue is not None:
+                    queue.put(None)
+            processes = list(self._processes)
+        for process in processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    # ------------------------------------------------------------ supervisor
+
+    def _spawn(self, index):
+        jobs = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, jobs, self._results, self.client_factory),
+            name=f"rtms-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._queues[index] = jobs
+        self._processes[index] = process
+
+    def _collect_results(self):
+        # Forget meetings whose stream has ended, unless a newer stream was started since
+        while True:
+            try:
+                _, meeting_uuid, stream_id = self._results.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                owned = self._owned.get(meeting_uuid)
+                if owned is not None and owned[0] == stream_id:
+                    del self._owned[meeting_uuid]
+                    logger.debug(f"Stream {stream_id} for meeting {meeting_uuid} ended")
+
+    def _supervise(self):
+        while not self._stopped.wait(self.check_interval):
+            self._collect_results()
+            with self._lock:
+                for index, process in enumerate(self._processes):
+                    if process.is_alive() or self._stopped.is_set():
+                        continue
+                    logger.warning(f"RTMS worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self._spawn(index)
+                    # The crashed worker's streams went with it; start them again
+                    for meeting_uuid, (stream_id, server_urls) in self._owned.items():
+                        if self.shard_for(meeting_uuid) == index:
+                            self._queues[index].put(("start", (meeting_uuid, stream_id, server_urls)))
@@ -0,0 +1,431 @@
+"""Local stand-in for the Zoom RTMS servers, for offline and load testing.
+
+`RTMSSimulator` serves the signaling and media WebSockets the samples talk
+to and drives them the way a meeting would:
+
+1. POST `meeting.rtms_started` to the sample's webhook, with a
+   `server_urls` pointing at this simulator (or, with `event_websocket`,
+   push it to the samples connected to `/events` the way the Zoom event
+   WebSocket does)
+2. answer SIGNALING_HAND_SHAKE_REQ (1) with a RESP (2) naming the media URL,
+   and DATA_HAND_SHAKE_REQ (3) with a RESP (4)
+3. on CLIENT_READY_ACK (7), stream audio (14), video (15) and transcript
+   (17, or 5 with `transcript_msg_type=5`) frames at the configured rates
+   and sizes, for the media types the client asked for
+4. send KEEP_ALIVE_REQ (12) on both sockets every `keepalive_interval`
+   seconds and time the KEEP_ALIVE_RESP (13)
+5. after `duration` seconds (or `end_meetings()`), send
+   `meeting.rtms_stopped` and close
+
+With `ssl_context` (or `--certfile`/`--keyfile`) the sockets are served
+over wss://, to exercise TLS setup and session resumption.
+
+Frames are rendered from templates prepared once per payload size, so one
+process can feed thousands of streams. `stats()` reports frames and bytes
+sent, webhook-to-first-frame latency and keep-alive RTT.
+
+    python -m rtms_common.simulator --meetings 100 --audio-rate 50 --duration 60 \\
+        --webhook-url http://127.0.0.1:3000/webhook
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import ssl
+import statistics
+import time
+import urllib.request
+import uuid
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+# Media type bits of DATA_HAND_SHAKE_REQ
+MEDIA_AUDIO = 1
+MEDIA_VIDEO = 2
+MEDIA_TRANSCRIPT = 8
+MEDIA_ALL = 32
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _summary(values, scale=1000.0):
+    """p50/p95/p99/max of `values` (seconds), in milliseconds."""
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "p50_ms": round(statistics.median(values) * scale, 3),
+        "p95_ms": round(_percentile(values, 95) * scale, 3),
+        "p99_ms": round(_percentile(values, 99) * scale, 3),
+        "max_ms": round(max(values) * scale, 3)
+    }
+
+
+class FrameTemplate:
+    """A pre-rendered media frame; only the timestamp changes per send."""
+
+    def __init__(self, msg_type, data, user_id=16778240, user_name="Simulated User"):
+        body = json.dumps({
+            "msg_type": msg_type,
+            "content": {"user_id": user_id, "user_name": user_name, "data": data, "timestamp": 0}
+        })
+        self._head, self._tail = body.rsplit('"timestamp": 0', 1)
+        self._head += '"timestamp": '
+
+    def render(self, timestamp):
+        return f"{self._head}{timestamp}{self._tail}"
+
+
+class SimulatedMeeting:
+    """State of one simulated meeting and its two sockets."""
+
+    def __init__(self, meeting_uuid, stream_id):
+        self.meeting_uuid = meeting_uuid
+        self.stream_id = stream_id
+        self.signaling = None
+        self.media = None
+        self.media_type = MEDIA_AUDIO
+        self.ready = asyncio.Event()
+        self.done = asyncio.Event()
+        self.webhook_sent_at = None
+        self.first_frame_at = None
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.keepalive_rtts = []
+        self.pending_keepalives = {}
+
+    def wants(self, bit):
+        return self.media_type & MEDIA_ALL or self.media_type & bit
+
+
+class RTMSSimulator:
+    """Serve RTMS signaling/media sockets and drive synthetic meetings through a sample."""
+
+    def __init__(self, host="127.0.0.1", port=8765, webhook_url=None, meetings=1, duration=30.0,
+                 ramp=50.0, audio_rate=50.0, audio_bytes=640, video_rate=0.0, video_bytes=20000,
+                 transcript_rate=1.0, transcript_msg_type=17, keepalive_interval=10.0,
+                 webhook_concurrency=32, advertise_host=None, event_websocket=False, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.webhook_url = webhook_url
+        self.meeting_count = meetings
+        self.duration = duration
+        self.ramp = ramp
+        self.rates = {MEDIA_AUDIO: audio_rate, MEDIA_VIDEO: video_rate, MEDIA_TRANSCRIPT: transcript_rate}
+        self.keepalive_interval = keepalive_interval
+        self.advertise_host = advertise_host or host
+        self.event_websocket = event_websocket
+        self.ssl_context = ssl_context
+
+        self.templates = {
+            MEDIA_AUDIO: FrameTemplate(14, base64.b64encode(os.urandom(audio_bytes)).decode()),
+            MEDIA_VIDEO: FrameTemplate(15, base64.b64encode(os.urandom(video_bytes)).decode()),
+            MEDIA_TRANSCRIPT: FrameTemplate(transcript_msg_type, "simulated transcript text"),
+        }
+        self.meetings = {}
+        self.event_clients = set()
+        self.event_client_connected = asyncio.Event()
+        self.webhook_errors = 0
+        self.handshakes = 0
+        self._server = None
+        self._webhooks = ThreadPoolExecutor(max_workers=webhook_concurrency, thread_name_prefix="sim-webhook")
+        self._started_at = None
+        self._ending = asyncio.Event()
+
+    @property
+    def base_url(self):
+        scheme = "wss" if self.ssl_context else "ws"
+        return f"{scheme}://{self.advertise_host}:{self.port}"
+
+    # ----------------------------------------------------------------- server
+
+    async def start(self):
+        self._server = await websockets.serve(self._handle, self.host, self.port, max_size=None, ssl=self.ssl_context)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"RTMS simulator listening on {self.base_url}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._webhooks.shutdown(wait=False)
+
+    async def _handle(self, ws, path=None):
+        # The legacy server (websockets < 13) keeps the path on the connection
+        request = getattr(ws, "request", None)
+        path = urlsplit(path or (request.path if request is not None else ws.path)).path
+        kind, _, meeting_uuid = path.strip("/").partition("/")
+        if kind == "events":
+            await self._serve_events(ws)
+            return
+        meeting = self.meetings.get(meeting_uuid)
+        if meeting is None or kind not in ("signaling", "media"):
+            await ws.close(code=4004, reason="unknown meeting")
+            return
+        try:
+            if kind == "signaling":
+                meeting.signaling = ws
+                await self._serve_signaling(meeting, ws)
+            else:
+                meeting.media = ws
+                await self._serve_media(meeting, ws)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _serve_signaling(self, meeting, ws):
+        keepalive = asyncio.create_task(self._keepalive(meeting, ws))
+        try:
+            async for message in ws:
+                msg = json.loads(message)
+                msg_type = msg.get("msg_type")
+                if msg_type == 1:
+                    self.handshakes += 1
+                    media_url = f"{self.base_url}/media/{meeting.meeting_uuid}"
+                    await ws.send(json.dumps({
+                        "msg_type": 2,
+                        "protocol_version": 1,
+                        "status_code": 0,
+                        "media_server": {"server_urls": {
+                            "audio": media_url, "video": media_url, "transcript": media_url, "all": media_url
+                        }}
+                    }))
+                elif msg_type == 7:
+                    meeting.ready.set()
+                elif msg_type == 13:
+                    self._keepalive_answered(meeting, ws, msg)
+        finally:
+            keepalive.cancel()
+
+    async def _serve_events(self, ws):
+        # Stand-in for the Zoom event WebSocket: answer heartbeats, push events
+        self.event_clients.add(ws)
+        self.event_client_connected.set()
+        try:
+            async for message in ws:
+                if json.loads(message).get("module") == "heartbeat":
+                    await ws.send(json.dumps({"module": "heartbeat", "success": True}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.event_clients.discard(ws)
+
+    async def _serve_media(self, meeting, ws):
+        keepalive = asyncio.create_task(self._keepalive(meeting, ws))
+        streams = []
+        try:
+            async for message in ws:
+                msg = json.loads(message)
+                msg_type = msg.get("msg_type")
+                if msg_type == 3:
+                    meeting.media_type = msg.get("media_type") or MEDIA_AUDIO
+                    await ws.send(json.dumps({"msg_type": 4, "protocol_version": 1, "status_code": 0}))
+                    streams = [
+                        asyncio.create_task(self._stream(meeting, ws, bit, rate))
+                        for bit, rate in self.rates.items() if rate > 0 and meeting.wants(bit)
+                    ]
+                elif msg_type == 13:
+                    self._keepalive_answered(meeting, ws, msg)
+        finally:
+            keepalive.cancel()
+            for task in streams:
+                task.cancel()
+
+    async def _stream(self, meeting, ws, bit, rate):
+        await meeting.ready.wait()
+        template = self.templates[bit]
+        interval = 1.0 / rate
+        loop = asyncio.get_running_loop()
+        # Spread streams over the first interval so meetings do not send in lockstep
+        next_send = loop.time() + random.uniform(0, interval)
+        while not meeting.done.is_set():
+            delay = next_send - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            frame = template.render(int(time.time() * 1000))
+            await ws.send(frame)
+            if meeting.first_frame_at is None:
+                meeting.first_frame_at = time.perf_counter()
+            meeting.frames_sent += 1
+            meeting.bytes_sent += len(frame)
+            next_send += interval
+
+    async def _keepalive(self, meeting, ws):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            timestamp = int(time.time() * 1000)
+            meeting.pending_keepalives[(id(ws), timestamp)] = time.perf_counter()
+            await ws.send(json.dumps({"msg_type": 12, "timestamp": timestamp}))
+
+    @staticmethod
+    def _keepalive_answered(meeting, ws, msg):
+        sent = meeting.pending_keepalives.pop((id(ws), msg.get("timestamp")), None)
+        if sent is not None:
+            meeting.keepalive_rtts.append(time.perf_counter() - sent)
+
+    # --------------------------------------------------------------- meetings
+
+    async def run(self):
+        """Start `meetings` meetings at `ramp` per second, run them for `duration`, then stop them.
+
+        With `duration=None` the meetings run until `end_meetings()` is called.
+        """
+        self._started_at = time.perf_counter()
+        tasks = []
+        for i in range(self.meeting_count):
+            tasks.append(asyncio.create_task(self._run_meeting(i)))
+            if self.ramp:
+                await asyncio.sleep(1.0 / self.ramp)
+        await asyncio.gather(*tasks)
+
+    async def _run_meeting(self, index):
+        meeting = SimulatedMeeting(f"sim-{index}-{uuid.uuid4().hex[:12]}", uuid.uuid4().hex)
+        self.meetings[meeting.meeting_uuid] = meeting
+        meeting.webhook_sent_at = time.perf_counter()
+        await self._webhook("meeting.rtms_started", {
+            "meeting_uuid": meeting.meeting_uuid,
+            "rtms_stream_id": meeting.stream_id,
+            "server_urls": f"{self.base_url}/signaling/{meeting.meeting_uuid}"
+        })
+        try:
+            await asyncio.wait_for(self._ending.wait(), self.duration)
+        except asyncio.TimeoutError:
+            pass
+        meeting.done.set()
+        await self._webhook("meeting.rtms_stopped", {
+            "meeting_uuid": meeting.meeting_uuid,
+            "rtms_stream_id": meeting.stream_id
+        })
+        for ws in (meeting.media, meeting.signaling):
+            if ws is not None:
+                await ws.close()
+
+    def end_meetings(self):
+        """Stop every running meeting now."""
+        self._ending.set()
+
+    async def _webhook(self, event, payload):
+        if self.event_websocket:
+            await self._push_event(event, payload)
+            return
+        if not self.webhook_url:
+            logger.info(f"{event}: {json.dumps(payload)}")
+            return
+        body = json.dumps({"event": event, "event_ts": int(time.time() * 1000), "payload": payload}).encode()
+        request = urllib.request.Request(
+            self.webhook_url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._webhooks, lambda: urllib.request.urlopen(request, timeout=10).read())
+        except Exception as e:
+            self.webhook_errors += 1
+            logger.warning(f"Webhook {event} to {self.webhook_url} failed: {e}")
+
+    async def _push_event(self, event, payload):
+        content = json.dumps({"event": event, "event_ts": int(time.time() * 1000), "payload": payload})
+        message = json.dumps({"module": "message", "messageId": uuid.uuid4().hex, "content": content})
+        if not self.event_clients:
+            self.webhook_errors += 1
+            logger.warning(f"No event WebSocket client connected for {event}")
+        for ws in list(self.event_clients):
+            try:
+                await ws.send(message)
+            except websockets.exceptions.ConnectionClosed:
+                self.webhook_errors += 1
+
+    # ------------------------------------------------------------------ stats
+
+    def stats(self):
+        meetings = list(self.meetings.values())
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        frames = sum(m.frames_sent for m in meetings)
+        return {
+            "meetings": len(meetings),
+            "handshakes": self.handshakes,
+            "streaming": sum(1 for m in meetings if m.first_frame_at is not None),
+            "webhook_errors": self.webhook_errors,
+            "frames_sent": frames,
+            "bytes_sent": sum(m.bytes_sent for m in meetings),
+            "frames_per_sec": round(frames / elapsed, 1) if elapsed else 0.0,
+            "webhook_to_first_frame": _summary([
+                m.first_frame_at - m.webhook_sent_at for m in meetings if m.first_frame_at is not None
+            ]),
+            "keepalive_rtt": _summary([rtt for m in meetings for rtt in m.keepalive_rtts])
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Zoom RTMS meetings against a local sample.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--webhook-url",
+                        default=f"http://127.0.0.1:{os.getenv('PORT', 3000)}{os.getenv('WEBHOOK_PATH', '/webhook')}",
+                        help="where to POST meeting.rtms_started/stopped ('' to only log them)")
+    parser.add_argument("--event-websocket", action="store_true",
+                        help="push events to clients of ws://HOST:PORT/events instead of POSTing them "
+                             "(set ZOOM_EVENT_WS_BASE=ws://HOST:PORT/events?subscriptionId=sim in the sample)")
+    parser.add_argument("--advertise-host", help="host name put in server_urls (e.g. the name on the certificate)")
+    parser.add_argument("--certfile", help="serve wss:// with this certificate chain")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--meetings", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds each meeting streams")
+    parser.add_argument("--ramp", type=float, default=50.0, help="meetings started per second (0 = all at once)")
+    parser.add_argument("--audio-rate", type=float, default=50.0, help="audio frames/sec per meeting")
+    parser.add_argument("--audio-bytes", type=int, default=640, help="PCM bytes per audio frame")
+    parser.add_argument("--video-rate", type=float, default=0.0, help="video frames/sec per meeting")
+    parser.add_argument("--video-bytes", type=int, default=20000, help="bytes per video frame")
+    parser.add_argument("--transcript-rate", type=float, default=1.0, help="transcript messages/sec per meeting")
+    parser.add_argument("--transcript-msg-type", type=int, default=17, choices=(5, 17))
+    parser.add_argument("--keepalive-interval", type=float, default=10.0)
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO))
+    ssl_context = None
+    if args.certfile:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+
+    simulator = RTMSSimulator(
+        host=args.host, port=args.port, webhook_url=args.webhook_url or None, meetings=args.meetings,
+        duration=args.duration, ramp=args.ramp, audio_rate=args.audio_rate, audio_bytes=args.audio_bytes,
+        video_rate=args.video_rate, video_bytes=args.video_bytes, transcript_rate=args.transcript_rate,
+        transcript_msg_type=args.transcript_msg_type, keepalive_interval=args.keepalive_interval,
+        event_websocket=args.event_websocket, advertise_host=args.advertise_host, ssl_context=ssl_context
+    )
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            logger.info(json.dumps(simulator.stats()))
+
+    async def run():
+        await simulator.start()
+        reporter = asyncio.create_task(report())
+        try:
+            if args.event_websocket:
+                logger.info("Waiting for a sample to connect to the event WebSocket...")
+                await simulator.event_client_connected.wait()
+            await simulator.run()
+        finally:
+            reporter.cancel()
+            await simulator.stop()
+        print(json.dumps(simulator.stats(), indent=2))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
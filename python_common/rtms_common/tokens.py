@@ -0,0 +1,223 @@
+"""Cached Zoom OAuth tokens with proactive refresh.
+
+Zoom access tokens live for an hour, but the samples used to request a new
+one for every call. `TokenManager` keeps one token per (grant type, account,
+client id), hands out the cached token until shortly before it expires and
+refreshes it in the background, so callers on the start-stream path never
+wait for zoom.us. Concurrent callers share one refresh: the first caller
+fetches, the rest wait for its result. Tokens can optionally be persisted to
+a JSON file so a restart does not need a new one either.
+
+    tokens = get_token_manager(client_id, client_secret)  # client_credentials
+    tokens = get_token_manager(s2s_id, s2s_secret, "account_credentials", account_id)
+    headers = {"Authorization": f"Bearer {tokens.get_token()}"}
+    token = await tokens.get_token_async()
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+ZOOM_TOKEN_URL = "https://zoom.us/oauth/token"
+
+
+class TokenError(Exception):
+    """Raised when Zoom does not return an access token."""
+
+
+class TokenManager:
+    """Thread- and asyncio-safe cache for one OAuth client's access token.
+
+    The token is refreshed `refresh_margin` seconds before it expires. Until
+    it actually expires, callers keep getting the old token while the refresh
+    runs in the background.
+    """
+
+    def __init__(self, client_id, client_secret, grant_type="client_credentials", account_id=None,
+                 refresh_margin=300, persist_path=None, token_url=ZOOM_TOKEN_URL, timeout=10):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.grant_type = grant_type
+        self.account_id = account_id
+        self.refresh_margin = refresh_margin
+        self.persist_path = persist_path
+        self.token_url = token_url
+        self.timeout = timeout
+
+        self.access_token = None
+        self.expires_at = 0.0
+        self.refreshes = 0
+
+        self._session = requests.Session()
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._last_error = None
+        self._timer = None
+        self._load()
+
+    @property
+    def key(self):
+        return f"{self.grant_type}:{self.account_id or ''}:{self.client_id}"
+
+    def get_token(self):
+        """Return a valid access token, fetching one only if there is none."""
+        with self._cond:
+            now = time.time()
+            if self.access_token and now < self.expires_at - self.refresh_margin:
+                return self.access_token
+            if self.access_token and now < self.expires_at:
+                # Still valid: refresh in the background and use the current token
+                self._refresh_in_background()
+                return self.access_token
+
+            if self._refreshing:
+                # Another caller is already fetching; share its result
+                self._cond.wait_for(lambda: not self._refreshing, self.timeout * 2)
+                if self.access_token and time.time() < self.expires_at:
+                    return self.access_token
+                raise TokenError(f"Token refresh failed: {self._last_error}")
+            self._refreshing = True
+
+        self._refresh()
+        with self._cond:
+            # A failed refresh leaves the old token in place, which may have expired
+            if not (self.access_token and time.time() < self.expires_at):
+                raise TokenError(f"Token refresh failed: {self._last_error}")
+            return self.access_token
+
+    async def get_token_async(self):
+        """`get_token` for coroutines; only blocks a worker thread if a fetch is needed."""
+        with self._cond:
+            if self.access_token and time.time() < self.expires_at - self.refresh_margin:
+                return self.access_token
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_token)
+
+    def start(self):
+        """Fetch a token now (in the background) so the first caller does not wait."""
+        with self._cond:
+            if self.access_token and time.time() < self.expires_at - self.refresh_margin:
+                self._schedule_refresh()
+                return
+            self._refresh_in_background()
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Zoom rejected it with a 401."""
+        with self._cond:
+            self.access_token = None
+            self.expires_at = 0.0
+
+    # -------------------------------------------------------------- refresh
+
+    def _refresh_in_background(self):
+        # Caller holds self._cond
+        if self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._refresh, name="token-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            access_token, expires_in = self._fetch()
+        except Exception as e:
+            logger.error(f"Zoom token request failed ({self.grant_type}): {e}")
+            with self._cond:
+                self._last_error = e
+                self._refreshing = False
+                self._cond.notify_all()
+            return
+
+        with self._cond:
+            self.access_token = access_token
+            self.expires_at = time.time() + expires_in
+            self.refreshes += 1
+            self._last_error = None
+            self._refreshing = False
+            self._cond.notify_all()
+            self._schedule_refresh()
+        logger.info(f"Zoom access token refreshed ({self.grant_type}), expires in {expires_in}s")
+        self._save()
+
+    def _fetch(self):
+        params = {"grant_type": self.grant_type}
+        if self.account_id:
+            params["account_id"] = self.account_id
+        response = self._session.post(
+            self.token_url,
+            params=params,
+            auth=(self.client_id, self.client_secret),
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise TokenError(f"HTTP {response.status_code}: {response.text}")
+        data = response.json()
+        if not data.get("access_token"):
+            raise TokenError(f"No access_token in response: {data}")
+        return data["access_token"], int(data.get("expires_in", 3600))
+
+    def _schedule_refresh(self):
+        # Caller holds self._cond
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = max(0.0, self.expires_at - self.refresh_margin - time.time())
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._cond:
+            self._refresh_in_background()
+
+    # ---------------------------------------------------------- persistence
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path) as f:
+                cached = json.load(f).get(self.key)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable token cache {self.persist_path}: {e}")
+            return
+        if cached and cached.get("expires_at", 0) > time.time():
+            self.access_token = cached["access_token"]
+            self.expires_at = cached["expires_at"]
+
+    def _save(self):
+        if not self.persist_path:
+            return
+        with _persist_lock:
+            try:
+                with open(self.persist_path) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+            with self._cond:
+                cache[self.key] = {"access_token": self.access_token, "expires_at": self.expires_at}
+            tmp_path = f"{self.persist_path}.tmp"
+            # The file holds bearer tokens, keep it private
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.persist_path)
+
+
+_persist_lock = threading.Lock()
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(client_id, client_secret, grant_type="client_credentials", account_id=None, **kwargs):
+    """Return the process-wide `TokenManager` for these credentials, creating it once."""
+    key = (grant_type, account_id, client_id)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            kwargs.setdefault("persist_path", os.getenv("ZOOM_TOKEN_CACHE") or None)
+            manager = _managers[key] = TokenManager(client_id, client_secret, grant_type, account_id, **kwargs)
+        return manager
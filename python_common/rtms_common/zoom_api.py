@@ -0,0 +1,142 @@
+"""Pooled, rate-limit aware client for the Zoom REST API.
+
+One `requests.Session` with a sized connection pool is shared by a bounded
+worker pool, so a sweep over hundreds of rooms reuses a handful of TLS
+connections and never has more than `max_concurrency` calls in flight.
+A 429 pauses every worker until its `Retry-After` (Zoom rate limits are
+per account, so hammering on with other requests only earns more 429s);
+5xx responses and connection errors are retried with exponential backoff,
+and a 401 invalidates the cached token once and retries.
+
+    api = ZoomAPIClient(lambda: tokens.get_token(), on_unauthorized=tokens.invalidate)
+    response = api.request("GET", "/rooms", params={"status": "available"})
+    future = api.submit("PATCH", f"/rooms/{room_id}/events", json=payload)
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+ZOOM_API_BASE = "https://api.zoom.us/v2"
+
+
+def parse_retry_after(value, default):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class ZoomAPIClient:
+    """Issue Zoom REST calls over a shared connection pool with bounded concurrency."""
+
+    def __init__(self, token_provider, base_url=ZOOM_API_BASE, max_concurrency=16, max_retries=5,
+                 backoff=0.5, max_backoff=30.0, timeout=15, on_unauthorized=None):
+        self.token_provider = token_provider
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.on_unauthorized = on_unauthorized
+
+        self.calls = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="zoom-api")
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def submit(self, method, path, **kwargs):
+        """Run `request` on the worker pool; returns a Future of the response."""
+        return self.executor.submit(self.request, method, path, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        """Send one request, waiting out rate limits and retrying transient errors.
+
+        Returns the final `requests.Response` (which may still be an error
+        status); raises the last connection error if every attempt failed.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+        headers = dict(kwargs.pop("headers", None) or {})
+        kwargs.setdefault("timeout", self.timeout)
+        reauthorized = False
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            headers["Authorization"] = f"Bearer {self.token_provider()}"
+            try:
+                with self._lock:
+                    self.calls += 1
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+                self._count_retry()
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 429:
+                delay = parse_retry_after(response.headers.get("Retry-After"), self._backoff_delay(attempt))
+                with self._lock:
+                    self.rate_limited += 1
+                    # Hold back every worker, not just this one
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Zoom API rate limit hit on {method} {url}, pausing {delay:.1f}s")
+            elif response.status_code == 401 and self.on_unauthorized and not reauthorized:
+                reauthorized = True
+                self.on_unauthorized()
+            elif response.status_code >= 500:
+                time.sleep(self._backoff_delay(attempt))
+            else:
+                return response
+
+            if attempt < self.max_retries:
+                self._count_retry()
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "rate_limited": self.rate_limited, "retries": self.retries}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _wait_for_rate_limit(self):
+        while True:
+            with self._lock:
+                delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _backoff_delay(self, attempt):
+        # Full jitter keeps retrying workers from moving in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _count_retry(self):
+        with self._lock:
+            self.retries += 1
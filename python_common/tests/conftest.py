@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The samples add python_common/ to sys.path themselves; do the same for the tests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,80 @@
+import json
+import sys
+import wave
+from pathlib import Path
+
+# audio_sink.py lives with the save_audio sample
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "audio" / "save_audio_python"))
+
+from audio_sink import SegmentedWavSink, WavFileSink  # noqa: E402
+
+SECOND = 16000 * 2
+
+
+def read_wav(path):
+    with wave.open(str(path), "rb") as f:
+        return f.getframerate(), f.getnchannels(), f.getsampwidth(), f.readframes(f.getnframes())
+
+
+def test_wav_header_is_patched_on_sync_and_close(tmp_path):
+    path = tmp_path / "meeting.wav"
+    sink = WavFileSink(path, flush_interval=0, fsync_interval=0.000001)
+    sink.write(b"\x01\x02" * 100)
+    # Synced on write: the header already covers the audio, as after a crash
+    assert read_wav(path) == (16000, 1, 2, b"\x01\x02" * 100)
+    sink.write(b"\x03\x04" * 50)
+    sink.close()
+    assert read_wav(path)[3] == b"\x01\x02" * 100 + b"\x03\x04" * 50
+    assert path.stat().st_size == 44 + 300
+
+
+def test_wav_gap_is_filled_and_recorded(tmp_path):
+    path = tmp_path / "meeting.wav"
+    sink = WavFileSink(path)
+    sink.write(bytes(SECOND))
+    sink.write_gap(2.5, max_fill=1.0)
+    sink.close()
+    assert len(read_wav(path)[3]) == 2 * SECOND
+    assert sink.gaps == [{"at": 1.0, "duration": 2.5}]
+
+
+def test_segments_rotate_and_are_indexed(tmp_path):
+    sink = SegmentedWavSink(tmp_path, segment_seconds=1)
+    for _ in range(5):
+        sink.write(bytes(SECOND // 2))
+    sink.write_gap(0.25)
+    sink.close()
+
+    index = [json.loads(line) for line in (tmp_path / "index.jsonl").read_text().splitlines()]
+    assert [(s["seq"], s["file"], s["start"], s["duration"]) for s in index] == [
+        (0, "segment_00000.wav", 0.0, 1.0),
+        (1, "segment_00001.wav", 1.0, 1.0),
+        (2, "segment_00002.wav", 2.0, 0.75),
+    ]
+    assert index[2]["gaps"] == [{"at": 2.5, "duration": 0.25}]
+    for segment in index:
+        assert len(read_wav(tmp_path / segment["file"])[3]) == segment["bytes"]
+
+    playlist = (tmp_path / "playlist.m3u8").read_text().splitlines()
+    assert "#EXT-X-TARGETDURATION:1" in playlist
+    assert playlist[-1] == "#EXT-X-ENDLIST"
+    assert [line for line in playlist if line.endswith(".wav")] == [s["file"] for s in index]
+
+
+def test_segment_callback_publishes_later(tmp_path):
+    finished = []
+    sink = SegmentedWavSink(tmp_path, segment_seconds=0, max_bytes=SECOND, on_segment=finished.append)
+    sink.write(bytes(SECOND))
+    sink.close()
+    # Not complete until the callback publishes the last segment
+    assert not (tmp_path / "playlist.m3u8").exists()
+    sink.publish(finished[0])
+    assert (tmp_path / "playlist.m3u8").read_text().splitlines()[-1] == "#EXT-X-ENDLIST"
+
+
+def test_empty_segment_is_removed_on_close(tmp_path):
+    sink = SegmentedWavSink(tmp_path, segment_seconds=1)
+    sink.write(bytes(SECOND))
+    sink.write(b"")
+    sink.close()
+    assert [p.name for p in tmp_path.glob("*.wav")] == ["segment_00000.wav"]
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from rtms_common.capture import FOOTER, INDEX_ENTRY, CaptureError, CaptureReader, CaptureWriter
+
+MESSAGES = [
+    ("signaling", '{"msg_type":4,"status_code":0}'),
+    ("media", '{"msg_type":14,"content":{"data":"AAAA","timestamp":1}}'),
+    ("media", b"\x00\x01\x02"),
+    ("media", '{"msg_type":17,"content":{"data":"hi"}}'),
+]
+
+
+def write_capture(path, block_size=1):
+    writer = CaptureWriter(str(path), block_size=block_size)
+    for i, (channel, message) in enumerate(MESSAGES):
+        writer.record("meeting-a" if i % 2 else "meeting-b", "stream", channel, message, timestamp_ns=(i + 1) * 1000)
+    writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "session.rtmscap"
+    writer = write_capture(path)
+    assert writer.stats()["records"] == len(MESSAGES)
+
+    reader = CaptureReader(str(path))
+    assert reader.indexed and not reader.compressed
+    assert len(reader.blocks) == len(MESSAGES)
+    records = list(reader.records())
+    assert [(r.channel, r.payload) for r in records] == MESSAGES
+    assert [r.timestamp_ns for r in records] == [1000, 2000, 3000, 4000]
+    assert [r.payload for r in reader.records(start_ns=2000, end_ns=3000)] == [MESSAGES[1][1], MESSAGES[2][1]]
+    assert [r.timestamp_ns for r in reader.records(meetings={"meeting-a"})] == [2000, 4000]
+
+    info = reader.info()
+    assert info["records"] == 4
+    assert info["meetings"] == {"meeting-a": 2, "meeting-b": 2}
+    assert info["msg_types"] == {"4": 1, "14": 1, "None": 1, "17": 1}
+
+
+def test_unindexed_truncated_capture_is_scanned(tmp_path):
+    path = tmp_path / "crashed.rtmscap"
+    write_capture(path)
+    # Drop the index and footer, then cut the last block short, as a crash would
+    size = os.path.getsize(path) - len(MESSAGES) * INDEX_ENTRY.size - FOOTER.size
+    with open(path, "r+b") as f:
+        f.truncate(size - 10)
+
+    reader = CaptureReader(str(path))
+    assert not reader.indexed
+    assert len(reader.blocks) == len(MESSAGES) - 1
+    assert [r.payload for r in reader.records()] == [message for _, message in MESSAGES[:-1]]
+    assert reader.blocks[-1].last_ts_ns == 3000
+
+
+def test_empty_capture_writes_no_file(tmp_path):
+    path = tmp_path / "empty.rtmscap"
+    CaptureWriter(str(path)).close()
+    assert not path.exists()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a capture")
+    with pytest.raises(CaptureError):
+        CaptureReader(str(path))
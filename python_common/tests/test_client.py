@@ -0,0 +1,104 @@
+import asyncio
+import json
+import socket
+
+import websockets
+
+from rtms_common.client import RTMSClient
+from rtms_common.keepalive import KeepAliveService
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeRTMSServer:
+    """Signaling and media endpoints on one port.
+
+    `media_status` holds the media handshake status codes to answer with;
+    `signaling_junk` is sent on signaling right after the handshake response.
+    """
+
+    def __init__(self, media_status=(), signaling_junk=()):
+        self.port = unused_port()
+        self.media_status = list(media_status)
+        self.signaling_junk = list(signaling_junk)
+        self.signaling_handshakes = 0
+        self.keep_alive_replies = 0
+        self.media_handshakes = 0
+
+    async def handle(self, ws, path=None):
+        request = getattr(ws, "request", None)
+        path = path or (request.path if request is not None else ws.path)
+        if path.startswith("/media"):
+            await self.serve_media(ws)
+        else:
+            await self.serve_signaling(ws)
+
+    async def serve_signaling(self, ws):
+        async for message in ws:
+            msg_type = json.loads(message)["msg_type"]
+            if msg_type == 13:
+                self.keep_alive_replies += 1
+            elif msg_type == 1:
+                self.signaling_handshakes += 1
+                await ws.send(json.dumps({
+                    "msg_type": 2,
+                    "status_code": 0,
+                    "media_server": {"server_urls": {"all": f"ws://127.0.0.1:{self.port}/media"}}
+                }))
+                for junk in self.signaling_junk:
+                    await ws.send(junk)
+
+    async def serve_media(self, ws):
+        await ws.recv()
+        self.media_handshakes += 1
+        status = self.media_status.pop(0) if self.media_status else 0
+        await ws.send(json.dumps({"msg_type": 4, "status_code": status}))
+        if status != 0:
+            await ws.wait_closed()
+            return
+        await ws.send(json.dumps({"msg_type": 14, "content": {"data": "AAA=", "timestamp": 1}}))
+        await ws.wait_closed()
+
+
+def run_client(server, until, **options):
+    received = []
+
+    async def run():
+        client = RTMSClient(
+            "client", "secret", verify_tls=False, keepalive=KeepAliveService(),
+            on_media=lambda stream, frame: received.append(frame), recovery_backoff=0.01, **options)
+        async with websockets.serve(server.handle, "127.0.0.1", server.port):
+            task = client.start_stream("meeting", "stream", f"ws://127.0.0.1:{server.port}/signaling")
+            for _ in range(200):
+                if until(client, received):
+                    break
+                await asyncio.sleep(0.02)
+            stream = client.streams.get("meeting")
+            await client.stop_stream("meeting")
+            await asyncio.gather(task, return_exceptions=True)
+            return stream
+
+    return asyncio.run(run()), received
+
+
+def test_rejected_media_handshake_recovers():
+    server = FakeRTMSServer(media_status=[1])
+    stream, received = run_client(server, lambda client, received: any(f.msg_type == 14 for f in received))
+    assert server.signaling_handshakes == 2
+    assert server.media_handshakes == 2
+    assert stream.state == "closed" and stream.recoveries == 1
+    assert [f.msg_type for f in received if f.msg_type != 4] == [14]
+
+
+def test_invalid_protocol_message_is_dropped_and_counted():
+    server = FakeRTMSServer(signaling_junk=['{"msg_type": 12, "timestamp": ', '{"msg_type": 12, "timestamp": 5}'])
+    stream, received = run_client(server, lambda client, received: server.keep_alive_replies)
+    # The signaling session survived the bad keep-alive and answered the next one
+    assert server.keep_alive_replies == 1
+    assert server.signaling_handshakes == 1
+    assert stream.invalid_frames == 1
+    assert stream.stats()["invalid_frames"] == 1
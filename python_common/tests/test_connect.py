@@ -0,0 +1,95 @@
+import asyncio
+import socket
+
+import pytest
+import websockets
+
+from rtms_common.connect import Connector, DNSCache
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fake_getaddrinfo(monkeypatch, loop, infos):
+    calls = []
+
+    async def getaddrinfo(host, port, **kwargs):
+        calls.append((host, port))
+        return infos(port)
+
+    monkeypatch.setattr(loop, "getaddrinfo", getaddrinfo)
+    return calls
+
+
+def test_falls_back_to_the_next_address(monkeypatch):
+    async def run():
+        loop = asyncio.get_running_loop()
+        # The first address refuses connections, as an unreachable IPv6 address would
+        calls = fake_getaddrinfo(monkeypatch, loop, lambda port: [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", unused_port())),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port)),
+        ])
+
+        async def echo(ws, path=None):
+            await ws.send(await ws.recv())
+
+        port = unused_port()
+        async with websockets.serve(echo, "127.0.0.1", port):
+            connector = Connector(dns_cache=DNSCache())
+            for _ in range(2):
+                phases = {}
+                async with connector.connect(f"ws://rtms.test:{port}", phases=phases) as ws:
+                    await ws.send("ping")
+                    assert await ws.recv() == "ping"
+                assert set(phases) == {"dns", "tcp", "tls_ws"}
+        return calls, connector.dns.stats()
+
+    calls, stats = asyncio.run(run())
+    # Both addresses were cached by the first lookup
+    assert len(calls) == 1
+    assert stats["hits"] == 1
+
+
+def test_every_address_failing_raises_and_invalidates(monkeypatch):
+    async def run():
+        loop = asyncio.get_running_loop()
+        fake_getaddrinfo(monkeypatch, loop, lambda port: [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", unused_port())),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", unused_port())),
+        ])
+        connector = Connector(dns_cache=DNSCache())
+        with pytest.raises(OSError, match="any of its 2 addresses"):
+            async with connector.connect("ws://rtms.test:1"):
+                pass
+        return connector.dns.stats()
+
+    assert asyncio.run(run())["entries"] == 0
+
+
+def test_ip_literals_skip_the_lookup():
+    addresses = asyncio.run(DNSCache().resolve("::1", 443))
+    assert addresses == [(socket.AF_INET6, ("::1", 443))]
+
+
+def test_cancel_is_not_lost_when_the_connect_completes(monkeypatch):
+    async def run():
+        loop = asyncio.get_running_loop()
+        connected = loop.create_future()
+
+        async def sock_connect(sock, address):
+            await connected
+
+        monkeypatch.setattr(loop, "sock_connect", sock_connect)
+        task = asyncio.ensure_future(
+            Connector()._connect_socket(loop, "rtms.test", 443, [(socket.AF_INET, ("127.0.0.1", 443))]))
+        await asyncio.sleep(0.01)
+        # The connect finishes in the same loop iteration as the cancel
+        connected.set_result(None)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
@@ -0,0 +1,107 @@
+import base64
+import json
+
+import pytest
+
+from rtms_common import frames
+from rtms_common.frames import SPLIT_MIN_FRAME_SIZE, decode_media_frame, peek_msg_type
+
+
+def media_frame(msg_type=14, payload=b"\x01\x02" * (SPLIT_MIN_FRAME_SIZE // 2), **content):
+    data = base64.b64encode(payload).decode()
+    return json.dumps({"msg_type": msg_type, "content": {"user_id": 7, **content, "data": data}})
+
+
+@pytest.mark.parametrize("as_bytes", [False, True])
+def test_msg_type_is_read_without_parsing(as_bytes, monkeypatch):
+    raw = media_frame()
+    raw = raw.encode() if as_bytes else raw
+
+    def fail(raw):
+        raise AssertionError("frame parsed")
+
+    monkeypatch.setattr(frames, "json_loads", fail)
+    frame = decode_media_frame(raw)
+    assert frame.msg_type == 14
+    assert frame._msg is None
+
+
+@pytest.mark.parametrize("as_bytes", [False, True])
+@pytest.mark.parametrize("size", [64, SPLIT_MIN_FRAME_SIZE * 2])
+def test_payload_is_decoded_and_kept_out_of_msg(as_bytes, size):
+    payload = bytes(range(256)) * (size // 256 + 1)
+    raw = media_frame(payload=payload)
+    frame = decode_media_frame(raw.encode() if as_bytes else raw)
+    assert frame.msg["content"]["data"] == ""
+    assert frame.content["user_id"] == 7
+    assert bytes(frame.payload) == payload
+
+
+def test_nested_data_key_before_content_data_is_not_taken_for_the_payload():
+    payload = b"\xff" * SPLIT_MIN_FRAME_SIZE
+    raw = json.dumps({
+        "msg_type": 15,
+        "meta": {"data": "not-the-payload"},
+        "content": {"user": {"data": "nested"}, "data": base64.b64encode(payload).decode()}
+    })
+    frame = decode_media_frame(raw)
+    assert frame.payload == payload
+    assert frame.msg["meta"] == {"data": "not-the-payload"}
+    assert frame.content["user"] == {"data": "nested"}
+
+
+def test_escaped_payload_falls_back_to_a_full_parse():
+    payload = b"\xfb\xff" * SPLIT_MIN_FRAME_SIZE
+    data = base64.b64encode(payload).decode().replace("/", "\\/")
+    raw = '{"msg_type": 14, "content": {"data": "' + data + '"}}'
+    assert decode_media_frame(raw).payload == payload
+
+
+def test_frame_without_msg_type_prefix_is_parsed_eagerly():
+    # A quoted msg_type is not found by the cheap scan
+    frame = decode_media_frame('{"content": {"text": "hi"}, "msg_type": "17"}')
+    assert frame.msg_type == "17"
+    assert frame.content == {"text": "hi"}
+
+
+@pytest.mark.parametrize("raw", ["[1, 2]", "42", '"text"', "null", b"[14]", '[{"msg_type": 14}]'])
+def test_valid_json_that_is_not_an_object_is_rejected(raw):
+    with pytest.raises(ValueError):
+        decode_media_frame(raw)
+
+
+@pytest.mark.parametrize("raw", ["[1, 2]", "42", "{not json"])
+def test_client_and_capture_treat_non_object_frames_as_unparsed(raw):
+    from rtms_common.capture import _decode as capture_decode
+    from rtms_common.client import RTMSClient
+
+    for decode in (RTMSClient._decode, capture_decode):
+        frame = decode(raw)
+        assert frame.msg_type is None
+        assert frame.raw == raw
+
+
+def test_invalid_json_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_media_frame("{not json")
+
+
+def test_non_dict_content_does_not_break_accessors():
+    frame = decode_media_frame('{"msg_type": 14, "content": "oops"}')
+    assert frame.content == {}
+    assert frame.payload is None
+
+
+def test_peek_msg_type():
+    assert peek_msg_type('{"msg_type" : 12, "timestamp": 1}') == 12
+    assert peek_msg_type(b'{"event": "x"}') is None
+
+
+@pytest.mark.parametrize("as_bytes", [False, True])
+def test_nested_msg_type_is_not_peeked(as_bytes):
+    raw = '{"content": {"msg_type": 5, "text": "hi"}, "msg_type": 17}'
+    raw = raw.encode() if as_bytes else raw
+    assert peek_msg_type(raw) is None
+    frame = decode_media_frame(raw)
+    assert frame.msg_type == 17
+    assert frame.content == {"msg_type": 5, "text": "hi"}
@@ -0,0 +1,27 @@
+from rtms_common.connect import Connector
+from rtms_common.frames import MediaFrame
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.pipeline import DROP_NEWEST, MediaPipeline
+
+
+class FakeStream:
+    meeting_uuid = "meeting"
+
+
+def types(text):
+    return dict(line.split()[2:4] for line in text.splitlines() if line.startswith("# TYPE"))
+
+
+def test_running_totals_are_exported_as_counters():
+    metrics = RTMSMetrics()
+    pipeline = MediaPipeline(lambda stream, frame: None, maxsize=0, policies={14: DROP_NEWEST}, workers=0)
+    pipeline.submit(FakeStream(), MediaFrame('{"msg_type":14}', 14))
+    metrics.watch_pipeline(pipeline)
+    metrics.watch_connector(Connector())
+
+    text = metrics.render()
+    kinds = types(text)
+    for name in ("rtms_queue_dropped_total", "rtms_tls_handshakes_total", "rtms_dns_lookups_total"):
+        assert kinds[name] == "counter"
+    assert kinds["rtms_queue_depth"] == "gauge"
+    assert 'rtms_queue_dropped_total{meeting_uuid="meeting",msg_type="14"} 1' in text
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from rtms_common.frames import MediaFrame
+from rtms_common.pipeline import BLOCK, DROP_NEWEST, DROP_OLDEST, SPILL, FrameQueue, MediaPipeline
+
+
+class FakeStream:
+    meeting_uuid = "meeting"
+
+
+def frame(n, msg_type=14):
+    return MediaFrame(f'{{"msg_type":{msg_type},"n":{n}}}', msg_type)
+
+
+def drain(frame_queue):
+    frames = []
+    while (next_frame := frame_queue.get()) is not None:
+        frames.append(next_frame)
+    return [f.msg["n"] for f in frames]
+
+
+def test_drop_oldest_keeps_the_newest_frames():
+    frame_queue = FrameQueue("meeting", 15, 2, DROP_OLDEST)
+    results = [frame_queue.put(frame(n, 15), 0) for n in range(4)]
+    assert results == [True, True, False, False]
+    assert drain(frame_queue) == [2, 3]
+    assert frame_queue.stats()["dropped"] == 2
+
+
+def test_drop_newest_rejects_incoming_frames():
+    frame_queue = FrameQueue("meeting", 14, 2, DROP_NEWEST)
+    results = [frame_queue.put(frame(n), 0) for n in range(4)]
+    assert results == [True, True, False, False]
+    assert drain(frame_queue) == [0, 1]
+
+
+def test_block_waits_for_space_then_drops():
+    frame_queue = FrameQueue("meeting", 14, 1, BLOCK)
+    assert frame_queue.put(frame(0), 0)
+    assert not frame_queue.put(frame(1), 0.01)
+    threading.Timer(0.05, frame_queue.get).start()
+    assert frame_queue.put(frame(2), 2)
+    assert drain(frame_queue) == [2]
+
+
+def test_spill_keeps_every_frame_in_order():
+    frame_queue = FrameQueue("meeting", 14, 2, SPILL)
+    binary = MediaFrame(b"\x00\x01", None)
+    assert all(frame_queue.put(frame(n), 0) for n in range(5))
+    assert frame_queue.put(binary, 0)
+    assert frame_queue.depth == 6
+    assert frame_queue.stats()["spilled"] == 4
+    frames = []
+    while (next_frame := frame_queue.get()) is not None:
+        frames.append(next_frame)
+    assert [f.msg["n"] for f in frames[:5]] == [0, 1, 2, 3, 4]
+    assert frames[5].raw == b"\x00\x01" and frames[5].msg_type is None
+    # Frames queued after a drain are spilled to the start of the reused file
+    assert all(frame_queue.put(frame(n), 0) for n in range(3))
+    assert drain(frame_queue) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("policy, expected", [(DROP_OLDEST, [0, 3, 4]), (SPILL, [0, 1, 2, 3, 4])])
+def test_pipeline_applies_policy_per_msg_type(policy, expected):
+    release = threading.Event()
+    handled = {14: [], 15: []}
+    done = threading.Event()
+
+    def handler(stream, media_frame):
+        release.wait(2)
+        handled[media_frame.msg_type].append(media_frame.msg["n"])
+        if len(handled[14]) == len(expected) and handled[15] == [0]:
+            done.set()
+
+    pipeline = MediaPipeline(handler, maxsize=2, policies={14: policy}, workers=2)
+    stream = FakeStream()
+    assert pipeline.submit(stream, frame(0))
+    # Wait until the worker holds frame 0, so the queue fills up behind it
+    deadline = time.monotonic() + 2
+    while pipeline.stats()["meeting/14"]["depth"] and time.monotonic() < deadline:
+        time.sleep(0.001)
+    for n in range(1, 5):
+        pipeline.submit(stream, frame(n))
+    pipeline.submit(stream, frame(0, 15))
+    release.set()
+    assert done.wait(2)
+    assert handled[14] == expected
+    assert pipeline.totals()["processed"] == len(expected) + 1
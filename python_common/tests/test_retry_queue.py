@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from rtms_common.retry_queue import RetryQueue
+
+
+@pytest.fixture
+def retry_queue(tmp_path):
+    queue = RetryQueue(str(tmp_path / "retries.db"), base_delay=10.0, max_delay=100.0)
+    yield queue
+    queue.close()
+
+
+def test_backoff_grows_and_is_capped(retry_queue, monkeypatch):
+    monkeypatch.setattr("rtms_common.retry_queue.random.uniform", lambda low, high: 1.0)
+    now = time.time()
+    delays = [retry_queue.record_failure("room", {"id": "room"}) - now for _ in range(6)]
+    assert [round(delay) for delay in delays] == [10, 20, 40, 80, 100, 100]
+    assert retry_queue.get("room")["attempts"] == 6
+
+
+def test_due_returns_only_items_whose_backoff_has_passed(retry_queue):
+    first = retry_queue.record_failure("a", {"id": "a"})
+    second = retry_queue.record_failure("b", {"id": "b"})
+    assert retry_queue.due(now=time.time()) == []
+    assert retry_queue.due(now=min(first, second)) == [{"id": "a"} if first <= second else {"id": "b"}]
+    assert len(retry_queue.due(now=max(first, second))) == 2
+    assert retry_queue.stats() == {"queued": 2, "due": 0}
+
+
+def test_remove_and_max_attempts(tmp_path):
+    queue = RetryQueue(str(tmp_path / "retries.db"), max_attempts=2)
+    queue.record_failure("a", {"id": "a"})
+    assert queue.record_failure("a", {"id": "a"}) is not None
+    # The third failure gives up and forgets the item
+    assert queue.record_failure("a", {"id": "a"}) is None
+    assert "a" not in queue
+
+    queue.record_failure("b", {"id": "b"})
+    queue.remove("b")
+    assert len(queue) == 0
+    queue.close()
+
+
+def test_select_skips_available_rooms_in_backoff(retry_queue):
+    retry_queue.record_failure("backing-off", {"id": "backing-off", "name": "old"})
+    available = [{"id": "backing-off", "name": "listed"}, {"id": "fresh", "name": "fresh"}]
+
+    # Still listed as available, but its backoff has not passed: it is not joined again
+    assert retry_queue.select(available) == [{"id": "fresh", "name": "fresh"}]
+    assert retry_queue.pending_ids() == {"backing-off"}
+    assert retry_queue.get("backing-off")["attempts"] == 1
+
+    # Once due, it is selected once (the fresh listing wins over the stored copy)
+    later = retry_queue.get("backing-off")["next_attempt"]
+    assert retry_queue.select(available, now=later) == available
+
+
+def test_select_includes_due_rooms_that_are_no_longer_listed(retry_queue):
+    next_attempt = retry_queue.record_failure(42, {"id": 42, "name": "gone"})
+    assert retry_queue.select([], now=next_attempt) == [{"id": 42, "name": "gone"}]
+
+
+def test_items_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "retries.db")
+    queue = RetryQueue(path)
+    next_attempt = queue.record_failure("a", {"id": "a"}, error="HTTP 500")
+    queue.close()
+
+    reopened = RetryQueue(path)
+    assert reopened.get("a") == {"item": {"id": "a"}, "attempts": 1, "next_attempt": next_attempt,
+                                 "last_error": "HTTP 500"}
+    reopened.close()
@@ -0,0 +1,101 @@
+from concurrent.futures import Future
+
+from rtms_common.room_inventory import RoomInventory
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, etag=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = {"ETag": etag} if etag else {}
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeRoomsAPI:
+    """Two pages of rooms; each page has its own ETag and answers If-None-Match."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def submit(self, method, path, params=None, headers=None):
+        self.requests.append((params.get("next_page_token"), (headers or {}).get("If-None-Match")))
+        index = int(params.get("next_page_token") or 0)
+        rooms = self.pages[index]
+        etag = f'"{index}-{",".join(room["id"] for room in rooms)}"'
+        if headers and headers.get("If-None-Match") == etag:
+            response = FakeResponse(304)
+        else:
+            data = {"rooms": rooms}
+            if index + 1 < len(self.pages):
+                data["next_page_token"] = str(index + 1)
+            response = FakeResponse(200, data, etag)
+        future = Future()
+        future.set_result(response)
+        return future
+
+
+def room_ids(rooms):
+    return sorted(room["id"] for room in rooms)
+
+
+def test_all_pages_are_fetched_and_cached_within_ttl():
+    api = FakeRoomsAPI([[{"id": "a"}, {"id": "b"}], [{"id": "c"}]])
+    inventory = RoomInventory(api, ttl=300)
+    assert room_ids(inventory.rooms()) == ["a", "b", "c"]
+    assert room_ids(inventory.rooms()) == ["a", "b", "c"]
+    assert len(api.requests) == 2
+
+
+def test_unchanged_pages_keep_the_cache():
+    api = FakeRoomsAPI([[{"id": "a"}], [{"id": "b"}]])
+    inventory = RoomInventory(api)
+    inventory.refresh()
+    api.requests.clear()
+
+    assert room_ids(inventory.refresh()) == ["a", "b"]
+    # Every page is revalidated, not only the first
+    assert [token for token, etag in api.requests] == [None, "1"]
+    assert all(etag for token, etag in api.requests)
+    assert inventory.revalidated == 1 and inventory.fetches == 1
+
+
+def test_a_change_on_a_later_page_refetches_the_list():
+    api = FakeRoomsAPI([[{"id": "a"}], [{"id": "b"}]])
+    inventory = RoomInventory(api)
+    inventory.refresh()
+
+    # Room b is no longer available; the first page is unchanged
+    api.pages[1] = [{"id": "c"}]
+    assert room_ids(inventory.refresh()) == ["a", "c"]
+    assert inventory.last_changes == {"added": ["c"], "removed": ["b"]}
+    assert inventory.fetches == 2
+
+
+def test_stale_list_is_not_served_past_max_stale():
+    api = FakeRoomsAPI([[{"id": "a"}]])
+    inventory = RoomInventory(api, ttl=10, max_stale=60)
+    inventory.refresh()
+    api.pages[0] = [{"id": "b"}]
+
+    # Too old to serve while refreshing in the background: the caller gets the new list
+    inventory.fetched_at -= 61
+    assert room_ids(inventory.rooms()) == ["b"]
+
+
+def test_cache_file_keeps_the_pages_for_revalidation(tmp_path):
+    path = str(tmp_path / "rooms.json")
+    api = FakeRoomsAPI([[{"id": "a"}], [{"id": "b"}]])
+    RoomInventory(api, cache_path=path).refresh()
+
+    api.requests.clear()
+    restored = RoomInventory(api, cache_path=path)
+    assert room_ids(restored.refresh()) == ["a", "b"]
+    assert restored.revalidated == 1
+    assert [token for token, etag in api.requests] == [None, "1"]
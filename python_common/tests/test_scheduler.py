@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from rtms_common.scheduler import DelayedJobStore, TimerWheel
+
+
+@pytest.fixture
+def wheel():
+    wheel = TimerWheel(tick=0.01, slots=16)
+    yield wheel
+    wheel.stop()
+
+
+class Batches:
+    def __init__(self):
+        self.batches = []
+        self.event = threading.Event()
+
+    def __call__(self, batch):
+        self.batches.append(batch)
+        self.event.set()
+
+
+def test_job_rescheduled_within_batch_window_keeps_its_row(wheel, tmp_path):
+    on_due = Batches()
+    store = DelayedJobStore(wheel, str(tmp_path / "jobs.db"), on_due, batch_window=0.3)
+    store.schedule("room", 0, {"n": 1})
+    deadline = time.monotonic() + 2
+    while "room" in store.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Fired and waiting in the batch; schedule the key again before the flush
+    store.schedule("room", 60, {"n": 2})
+    assert on_due.event.wait(2)
+    assert on_due.batches == [[("room", {"n": 1})]]
+    assert store.pending() == ["room"]
+
+    restored_wheel = TimerWheel(tick=0.01)
+    restored = DelayedJobStore(restored_wheel, str(tmp_path / "jobs.db"), Batches())
+    assert restored.pending() == ["room"]
+    restored_wheel.stop()
+
+
+def test_timer_wheel_fires_in_order_and_never_early(wheel):
+    fired = []
+    done = threading.Event()
+    start = time.monotonic()
+    wheel.call_later(0.05, lambda: fired.append(("b", time.monotonic() - start)))
+    wheel.call_later(0.01, lambda: fired.append(("a", time.monotonic() - start)))
+    # More than one turn of the 16-slot wheel away
+    wheel.call_later(0.25, done.set)
+    assert done.wait(2)
+    assert [name for name, _ in fired] == ["a", "b"]
+    assert fired[0][1] >= 0.01 and fired[1][1] >= 0.05
+    assert wheel.stats()["fired"] == 3
+
+
+def test_timer_wheel_cancel(wheel):
+    fired = []
+    handle = wheel.call_later(0.02, fired.append, "cancelled")
+    done = threading.Event()
+    wheel.call_later(0.05, done.set)
+    handle.cancel()
+    assert done.wait(2)
+    assert fired == []
+    assert wheel.stats()["cancelled"] == 1
+
+
+def test_jobs_due_together_are_batched(wheel, tmp_path):
+    on_due = Batches()
+    store = DelayedJobStore(wheel, str(tmp_path / "jobs.db"), on_due, batch_window=0.1)
+    store.schedule("a", 0.01, "first")
+    store.schedule("b", 0.02, "second")
+    store.schedule("c", 0.02, "cancelled")
+    assert store.cancel("c")
+    assert not store.cancel("c")
+    assert on_due.event.wait(2)
+    assert sorted(on_due.batches[0]) == [("a", "first"), ("b", "second")]
+    assert store.pending() == []
+
+
+def test_restore_reschedules_persisted_jobs(wheel, tmp_path):
+    path = str(tmp_path / "jobs.db")
+    stopped_wheel = TimerWheel(tick=0.01)
+    before_restart = DelayedJobStore(stopped_wheel, path, Batches())
+    before_restart.schedule("overdue", 0.2, {"room": 1})
+    before_restart.schedule("later", 60, {"room": 2})
+    before_restart.schedule("later", 120, {"room": 3})
+    # The process goes down before either job runs
+    stopped_wheel.stop()
+    time.sleep(0.25)
+
+    on_due = Batches()
+    store = DelayedJobStore(wheel, path, on_due, batch_window=0.05)
+    assert sorted(store.pending()) == ["later", "overdue"]
+    assert on_due.event.wait(2)
+    assert on_due.batches == [[("overdue", {"room": 1})]]
+    assert store.pending() == ["later"]
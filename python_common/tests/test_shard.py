@@ -0,0 +1,84 @@
+import concurrent.futures
+import time
+
+import pytest
+
+from rtms_common.shard import HashRing, ShardedWorkerPool
+
+
+class FakeClient:
+    """Streams for meetings named "ended-..." finish at once; the rest keep running."""
+
+    def __init__(self):
+        self.streams = {}
+
+    def start_background(self):
+        pass
+
+    def submit_stream(self, meeting_uuid, stream_id, server_urls):
+        future = concurrent.futures.Future()
+        if meeting_uuid.startswith("ended-"):
+            future.set_result(None)
+        return future
+
+    def submit_stop(self, meeting_uuid):
+        pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def pool():
+    pool = ShardedWorkerPool(2, FakeClient, check_interval=0.02, start_method="fork")
+    yield pool
+    pool.shutdown(timeout=1.0)
+
+
+def test_hash_ring_is_stable_and_uses_every_shard():
+    ring = HashRing(4)
+    shards = {ring.shard_for(f"meeting-{i}") for i in range(200)}
+    assert shards == {0, 1, 2, 3}
+    assert HashRing(4).shard_for("meeting-7") == ring.shard_for("meeting-7")
+
+
+def test_ended_streams_are_forgotten(pool):
+    pool.submit_start("live-1", "stream-1", "wss://example")
+    pool.submit_start("ended-1", "stream-2", "wss://example")
+    pool.submit_start("ended-2", "stream-3", "wss://example")
+    assert wait_for(lambda: pool.stats()["meetings"] == 1)
+    assert list(pool._owned) == ["live-1"]
+
+
+def test_end_of_a_replaced_stream_keeps_the_new_one(pool):
+    pool.submit_start("ended-1", "stream-1", "wss://example")
+    assert wait_for(lambda: pool.stats()["meetings"] == 0)
+    # A later stream for the same meeting is not dropped by an old stream's report
+    pool._results.put(("ended", "live-1", "old-stream"))
+    pool.submit_start("live-1", "new-stream", "wss://example")
+    time.sleep(0.1)
+    assert pool.stats()["meetings"] == 1
+
+
+def test_crashed_worker_is_restarted(pool):
+    pool.submit_start("live-1", "stream-1", "wss://example")
+    index = pool.shard_for("live-1")
+    pool._processes[index].kill()
+    assert wait_for(lambda: pool.stats()["restarts"] == 1 and pool.stats()["alive"] == 2)
+    assert pool.stats()["meetings"] == 1
+
+
+def test_workers_are_not_forked_by_default():
+    pool = ShardedWorkerPool(1, FakeClient, check_interval=0.02)
+    try:
+        assert pool._ctx.get_start_method() in ("forkserver", "spawn")
+        pool.submit_start("ended-1", "stream-1", "wss://example")
+        assert wait_for(lambda: pool.stats()["alive"] == 1 and pool.stats()["meetings"] == 0, timeout=30)
+    finally:
+        pool.shutdown(timeout=1.0)
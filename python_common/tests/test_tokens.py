@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from rtms_common.tokens import TokenError, TokenManager
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data or {}
+        self.text = str(self._data)
+
+    def json(self):
+        return self._data
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = 0
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        return self.responses.pop(0)
+
+
+def manager(*responses, **kwargs):
+    tokens = TokenManager("client-id", "client-secret", **kwargs)
+    tokens._session = FakeSession(*responses)
+    return tokens
+
+
+def test_token_is_fetched_once_and_cached():
+    tokens = manager(FakeResponse(200, {"access_token": "abc", "expires_in": 3600}))
+    assert tokens.get_token() == "abc"
+    assert tokens.get_token() == "abc"
+    assert tokens._session.posts == 1
+    assert tokens.refreshes == 1
+
+
+def test_failed_first_fetch_raises():
+    tokens = manager(FakeResponse(401, {"reason": "invalid client"}))
+    with pytest.raises(TokenError, match="HTTP 401"):
+        tokens.get_token()
+
+
+def test_expired_token_is_not_returned_when_refresh_fails():
+    tokens = manager(FakeResponse(500))
+    tokens.access_token = "expired"
+    tokens.expires_at = time.time() - 1
+    with pytest.raises(TokenError):
+        tokens.get_token()
+
+
+def test_token_near_expiry_is_used_while_refreshing_in_background():
+    tokens = manager(FakeResponse(200, {"access_token": "new", "expires_in": 3600}), refresh_margin=300)
+    tokens.access_token = "old"
+    tokens.expires_at = time.time() + 60
+    assert tokens.get_token() == "old"
+    deadline = time.time() + 5
+    while tokens.access_token != "new" and time.time() < deadline:
+        time.sleep(0.01)
+    assert tokens.get_token() == "new"
+
+
+def test_tokens_persist_across_managers(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    first = manager(FakeResponse(200, {"access_token": "saved", "expires_in": 3600}), persist_path=path)
+    assert first.get_token() == "saved"
+
+    second = manager(persist_path=path)
+    assert second.get_token() == "saved"
+    assert second._session.posts == 0
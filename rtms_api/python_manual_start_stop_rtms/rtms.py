@@ -1,18 +1,39 @@
 import os
 import json
-import asyncio
-import websockets
 import requests
-import hmac
-import hashlib
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
+from pathlib import Path
+import sys
+
+# Shared RTMS helpers live in python_common/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "python_common"))
+from rtms_common.client import RTMSClient, MEDIA_TYPE_TRANSCRIPT
+from rtms_common.runner import SessionRunner
+from rtms_common.tokens import get_token_manager
+from rtms_common.scheduler import DelayedJobStore, TimerWheel
+from rtms_common.zoom_api import ZoomAPIClient
+from rtms_common.metrics import RTMSMetrics
+from rtms_common.capture import CaptureWriter
 
 # Load environment variables from .env
 load_dotenv()
 
 app = Flask(__name__)
 
+# Message rates, decode/handshake latency and keep-alive timings, served at GET /metrics
+metrics = RTMSMetrics()
+metrics.attach(app)
+
+# Seconds after meeting.started before RTMS is stopped again
+RTMS_STOP_DELAY = float(os.getenv('RTMS_STOP_DELAY', 10))
+# SQLite file keeping scheduled stops across restarts
+RTMS_JOBS_DB = os.getenv('RTMS_JOBS_DB', 'rtms_jobs.db')
+# Record every received RTMS message to this file for offline replay (a .zst name compresses it)
+RTMS_CAPTURE = os.getenv('RTMS_CAPTURE')
+# Verify the RTMS servers' TLS certificates; set to false only for local servers with self-signed certificates
+RTMS_VERIFY_TLS = os.getenv('RTMS_VERIFY_TLS', 'true').lower() != 'false'
+
 # Step 1: Webhook Receiver - Listen for meeting events
 @app.route("/webhook", methods=['POST'])
 def webhook():
@@ -39,8 +60,8 @@ def webhook():
             
             print(f'RTMS started for meeting {meeting_id}')
             
-            # Schedule automatic RTMS stop after 60 seconds
-            schedule_rtms_stop(meeting_id, access_token)
+            # Schedule automatic RTMS stop after RTMS_STOP_DELAY seconds
+            schedule_rtms_stop(meeting_uuid, meeting_id)
         except Exception as error:
             print(f'Error starting RTMS: {error}')
 
@@ -50,34 +71,40 @@ def webhook():
         meeting_uuid = payload.get('meeting_uuid')
         rtms_stream_id = payload.get('rtms_stream_id')
         server_urls = payload.get('server_urls')
-        asyncio.run(connect_to_signaling_websocket(meeting_uuid, rtms_stream_id, server_urls))
+        # Only enqueue the stream; it runs on the background session runner
+        if not session_runner.submit_start(meeting_uuid, rtms_stream_id, server_urls):
+            return jsonify({'status': 'busy'}), 503
 
-    # When meeting RTMS stops, log the stop event
+    # When meeting RTMS stops, close its connections
     if event == 'meeting.rtms_stopped':
         meeting_uuid = payload.get('meeting_uuid')
         print(f'Meeting {meeting_uuid} stopped')
-        # Open WebSocket connections will close naturally
+        session_runner.submit_stop(meeting_uuid)
+        # RTMS is already stopped; drop the scheduled stop call
+        if stop_jobs.cancel(meeting_uuid):
+            print(f'Cancelled scheduled RTMS stop for meeting {meeting_uuid}')
 
     return jsonify({'status': 'success'}), 200
 
-# Step 4: Generate Signature for authentication handshake
-def generate_signature(meeting_uuid, stream_id):
-    client_id = os.getenv('ZOOM_CLIENT_ID')
-    client_secret = os.getenv('ZOOM_CLIENT_SECRET')
-    
-    if not client_id or not client_secret:
-        raise Exception('ZOOM_CLIENT_ID and ZOOM_CLIENT_SECRET must be set in environment variables')
-    
-    message = f"{client_id},{meeting_uuid},{stream_id}"
-    signature = hmac.new(
-        client_secret.encode('utf-8'),
-        message.encode('utf-8'),
-        hashlib.sha256
-    ).hexdigest()
-    return signature
+# Step 4: The handshake signature is generated by rtms_common.client.generate_signature
+
+# Helper function: Get an access token for the Zoom REST API. With Server-to-Server
+# OAuth credentials the token is cached and refreshed before it expires, so
+# starting RTMS does not wait on zoom.us; otherwise the static env var is used.
+def get_api_token_manager():
+    if os.getenv('ZOOM_ACCOUNT_ID'):
+        return get_token_manager(
+            os.getenv('S2S_ZOOM_CLIENT_ID'),
+            os.getenv('S2S_ZOOM_CLIENT_SECRET'),
+            'account_credentials',
+            os.getenv('ZOOM_ACCOUNT_ID')
+        )
+    return None
 
-# Helper function: Generate access token from environment variable
 def generate_access_token():
+    token_manager = get_api_token_manager()
+    if token_manager:
+        return token_manager.get_token()
     access_token = os.getenv('access_token')
     if not access_token:
         raise Exception('access_token not found in environment variables')
@@ -119,158 +146,89 @@ def start_rtms(meeting_id, access_token):
         print(f'Error starting RTMS via API: {error}')
         raise error
 
-# Step 5: WebSocket 1 - Connect to Signaling WebSocket
-async def connect_to_signaling_websocket(meeting_uuid, stream_id, server_urls):
-    print(f'Connecting to signaling WebSocket: {server_urls}')
-    
-    try:
-        # Disable SSL certificate verification for development
-        import ssl
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        async with websockets.connect(server_urls, ssl=ssl_context) as signaling_ws:
-            print('Signaling WebSocket opened')
-            
-            # Send handshake
-            handshake_message = {
-                'msg_type': 1,  # HANDSHAKE_REQUEST
-                'meeting_uuid': meeting_uuid,
-                'rtms_stream_id': stream_id,
-                'signature': generate_signature(meeting_uuid, stream_id)
-            }
-            await signaling_ws.send(json.dumps(handshake_message))
-            
-            # Handle incoming signaling messages
-            async for message in signaling_ws:
-                msg = json.loads(message)
-                print(f'Signaling message: {msg}')
-
-                # If handshake is successful, proceed to media connection
-                if msg.get('msg_type') == 2 and msg.get('status_code') == 0:
-                    media_url = msg['media_server']['server_urls']['transcript']
-                    await connect_to_media_websocket(media_url, meeting_uuid, stream_id, signaling_ws)
-
-                # If keep-alive request is received, respond with ACK
-                if msg.get('msg_type') == 12:
-                    ack_message = {
-                        'msg_type': 13,
-                        'timestamp': msg.get('timestamp')
-                    }
-                    await signaling_ws.send(json.dumps(ack_message))
-                    
-    except Exception as error:
-        print(f'Signaling WebSocket error: {error}')
-    finally:
-        print('Signaling WebSocket closed')
-
-# Step 6: WebSocket 2 - Connect to Media WebSocket
-async def connect_to_media_websocket(media_url, meeting_uuid, stream_id, signaling_socket):
-    print(f'Connecting to media WebSocket: {media_url}')
-    
-    try:
-        # Disable SSL certificate verification for development
-        import ssl
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        async with websockets.connect(media_url, ssl=ssl_context) as media_ws:
-            print('Media WebSocket opened')
-            
-            # Send media handshake
-            media_handshake = {
-                'msg_type': 3,  # MEDIA_HANDSHAKE_REQUEST
-                'protocol_version': 1,
-                'sequence': 0,
-                'meeting_uuid': meeting_uuid,
-                'rtms_stream_id': stream_id,
-                'signature': generate_signature(meeting_uuid, stream_id),
-                'media_type': 8  # Request transcript stream
-            }
-            await media_ws.send(json.dumps(media_handshake))
-            
-            # Handle incoming media messages
-            async for message in media_ws:
-                msg = json.loads(message)
-                print(f'Media message received: {msg}')
-
-                # Respond to keep-alive request from media server
-                if msg.get('msg_type') == 12:
-                    print('Responding to media keep-alive')
-                    ack_message = {
-                        'msg_type': 13,
-                        'timestamp': msg.get('timestamp')
-                    }
-                    await media_ws.send(json.dumps(ack_message))
-
-                # If media handshake is successful, notify signaling server that client is ready
-                if msg.get('msg_type') == 4 and msg.get('status_code') == 0:
-                    print('Media handshake successful, sending CLIENT_READY_ACK')
-                    ready_message = {
-                        'msg_type': 7,
-                        'rtms_stream_id': stream_id
-                    }
-                    await signaling_socket.send(json.dumps(ready_message))
-
-                # Log incoming transcript data
-                if msg.get('msg_type') == 5:
-                    print(f'Transcript: {msg}')
-                    
-    except Exception as error:
-        print(f'Media WebSocket error: {error}')
-    finally:
-        print('Media WebSocket closed')
+# Step 5 & 6: Signaling and media WebSockets are handled by the shared RTMSClient;
+# this callback receives the media messages
+def handle_media(stream, frame):
+    # Log incoming transcript data
+    if frame.msg_type in (5, 17):
+        print(f'Transcript: {frame.msg}')
+
+rtms_client = RTMSClient(
+    os.getenv('ZOOM_CLIENT_ID'),
+    os.getenv('ZOOM_CLIENT_SECRET'),
+    media_type=MEDIA_TYPE_TRANSCRIPT,  # Request transcript stream
+    media_url_key='transcript',
+    on_media=handle_media,
+    verify_tls=RTMS_VERIFY_TLS,
+    metrics=metrics,
+    capture=CaptureWriter(RTMS_CAPTURE) if RTMS_CAPTURE else None
+)
+
+# Streams run on a dedicated event-loop thread so the webhook returns immediately
+session_runner = SessionRunner(
+    rtms_client,
+    max_concurrent_streams=int(os.getenv('MAX_CONCURRENT_STREAMS', 0)),
+    max_pending=int(os.getenv('MAX_PENDING_STREAMS', 10000))
+)
+
+# Pooled REST client for stop calls: shared connections, retries on 429/5xx
+zoom_api = ZoomAPIClient(generate_access_token, max_concurrency=8)
 
 # Step 7: Stop RTMS using Zoom API
-def stop_rtms(meeting_id, access_token):
-    try:
-        url = f"https://api.zoom.us/v2/live_meetings/{meeting_id}/rtms_app/status"
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
-        data = {
-            'action': 'stop',
-            'settings': {
-                'client_id': os.getenv('ZOOM_CLIENT_ID')
-            }
+def stop_rtms(meeting_id):
+    data = {
+        'action': 'stop',
+        'settings': {
+            'client_id': os.getenv('ZOOM_CLIENT_ID')
         }
-        
-        response = requests.patch(url, json=data, headers=headers)
+    }
+    try:
+        response = zoom_api.request('PATCH', f'/live_meetings/{meeting_id}/rtms_app/status', json=data)
         response.raise_for_status()
         
-        print(f'RTMS stop response: {response.json()}')
-        return response.json()
+        print(f'RTMS stop response: {response.text or response.status_code}')
+        return response
     except requests.exceptions.RequestException as error:
         print(f'Error stopping RTMS via API: {error}')
         raise error
 
-# Helper function: Schedule RTMS stop after 10 seconds
-def schedule_rtms_stop(meeting_id, access_token):
-    print(f'Scheduling RTMS stop for meeting {meeting_id} in 10 seconds...')
-    
-    def stop_after_delay():
-        import threading
-        import time
-        
-        def delayed_stop():
-            time.sleep(10)  # 10 seconds delay
-            try:
-                print(f'Stopping RTMS for meeting {meeting_id}...')
-                stop_rtms(meeting_id, access_token)
-                print(f'RTMS stopped successfully for meeting {meeting_id}')
-            except Exception as error:
-                print(f'Failed to stop RTMS for meeting {meeting_id}: {error}')
-        
-        thread = threading.Thread(target=delayed_stop)
-        thread.daemon = True
-        thread.start()
-    
-    stop_after_delay()
+def stop_rtms_batch(batch):
+    # Every stop that came due in the same batch window is sent concurrently
+    print(f'Stopping RTMS for {len(batch)} meeting(s)...')
+    for meeting_uuid, job in batch:
+        zoom_api.executor.submit(run_scheduled_stop, job['meeting_id'])
+
+def run_scheduled_stop(meeting_id):
+    try:
+        stop_rtms(meeting_id)
+        print(f'RTMS stopped successfully for meeting {meeting_id}')
+    except Exception as error:
+        print(f'Failed to stop RTMS for meeting {meeting_id}: {error}')
+
+# One timer thread for every scheduled stop; pending stops are persisted and
+# restored on restart, and can be cancelled by meeting UUID
+stop_jobs = DelayedJobStore(TimerWheel(tick=0.1, name='rtms-stop-timers'), RTMS_JOBS_DB, stop_rtms_batch)
+
+# Helper function: Schedule RTMS stop after RTMS_STOP_DELAY seconds
+def schedule_rtms_stop(meeting_uuid, meeting_id):
+    print(f'Scheduling RTMS stop for meeting {meeting_id} in {RTMS_STOP_DELAY:g} seconds...')
+    stop_jobs.schedule(meeting_uuid, RTMS_STOP_DELAY, {'meeting_id': meeting_id})
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    # Session runner counters, plus pending stops and timer drift
+    return jsonify({
+        'sessions': session_runner.stats(),
+        'connections': rtms_client.streams.counts(),
+        'scheduled_stops': stop_jobs.stats()
+    })
 
 # Step 8: Start Flask server on port 3000
 if __name__ == '__main__':
+    # Fetch the API token before the first meeting.started arrives
+    if get_api_token_manager():
+        get_api_token_manager().start()
     print('Server running on port 3000')
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    # No reloader: it would import this module in a second process, which would
+    # restore and fire every persisted stop job and fetch the token a second time
+    app.run(host='0.0.0.0', port=3000, debug=True, use_reloader=False)